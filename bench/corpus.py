@@ -0,0 +1,84 @@
+# bench/corpus.py
+# 벤치마크용 가짜 특허 JSON 생성기
+# 실제 데이터와 같은 {"dataset": {"invention_title", "abstract", "claims"}} 구조로 파일을 만든다.
+#
+# 단어는 한글 음절(+ 일부 영문)을 이어 붙여 만든 가짜 명사이고, Zipf 분포(순위 r의 확률 ∝ 1/r^s)로 뽑는다.
+# -> 몇몇 term은 거의 모든 문서에 나오고(긴 포스팅 리스트) 대부분은 드물게 나오는 실제 말뭉치와 비슷한 모양.
+# seed가 같으면 단어 목록 / 파일 내용이 항상 같아서 실행끼리 비교할 수 있다.
+import os
+import json
+import numpy as np
+
+SYLLABLES = "가나다라마바사아자차카타파하거너더러머버서어저처커터퍼허고노도로모보소오조초코토포호구누두루무부수우주추쿠투푸후기니디리미비시이지치키티피히"
+LATIN_RATIO = 0.05 # 단어 중 영문(SL) 비율
+FILES_PER_DIR = 1000
+
+# 필드별 단어 수 범위 (실제 특허 데이터 비율 비슷하게)
+FIELD_LENGTHS = {"invention_title": (3, 10), "abstract": (60, 200), "claims": (150, 600)}
+
+
+def make_vocabulary(size, seed=0):
+    # 순위 순서대로 정렬된 단어 목록 (0번이 가장 자주 나오는 단어). 중복 없음
+    rng = np.random.default_rng(seed)
+    words = []
+    seen = set()
+    while len(words) < size:
+        if rng.random() < LATIN_RATIO:
+            word = "".join(chr(ord('a') + i) for i in rng.integers(0, 26, rng.integers(3, 9)))
+        else:
+            word = "".join(SYLLABLES[i] for i in rng.integers(0, len(SYLLABLES), rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def zipf_probabilities(size, exponent):
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def doc_path(out_dir, doc_no):
+    return os.path.join(out_dir, f"d{doc_no // FILES_PER_DIR:04d}", f"p{doc_no:08d}.json")
+
+
+def generate_corpus(out_dir, docs, vocab_size=50000, exponent=1.0, seed=0):
+    # out_dir에 docs개 파일 생성. 같은 설정으로 이미 만들어져 있으면 다시 만들지 않는다.
+    info = {"docs": docs, "vocab_size": vocab_size, "exponent": exponent, "seed": seed}
+    info_path = out_dir.rstrip(os.sep) + ".info" # 색인 대상이 안 되게 corpus 폴더 밖에 둔다
+    if os.path.exists(info_path):
+        with open(info_path, encoding='utf8') as f:
+            if json.load(f) == info:
+                return info
+        os.remove(info_path)
+    for root, dirs, files in os.walk(out_dir): # 설정이 다르거나 중간에 멈춘 corpus는 지우고 다시 생성
+        for name in files:
+            if name.endswith('.json'):
+                os.remove(os.path.join(root, name))
+
+    vocabulary = np.array(make_vocabulary(vocab_size, seed), dtype=object)
+    probabilities = zipf_probabilities(vocab_size, exponent)
+    rng = np.random.default_rng(seed + 1)
+    for doc_no in range(docs):
+        dataset = {}
+        for field, (low, high) in FIELD_LENGTHS.items():
+            ranks = rng.choice(vocab_size, size=int(rng.integers(low, high + 1)), p=probabilities)
+            dataset[field] = " ".join(vocabulary[ranks])
+        path = doc_path(out_dir, doc_no)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump({"dataset": dataset}, f, ensure_ascii=False)
+
+    with open(info_path, 'w', encoding='utf8') as f: # 다 만든 다음에 써야 중간에 멈춘 corpus를 재사용하지 않음
+        json.dump(info, f)
+    return info
+
+
+def sample_titles(out_dir, docs, count, seed=0):
+    # PHRASE 검색어를 만들 때 쓸 실제 제목들 (문서 번호를 고르게 뽑음)
+    rng = np.random.default_rng(seed + 2)
+    titles = []
+    for doc_no in rng.choice(docs, size=min(count, docs), replace=False):
+        with open(doc_path(out_dir, int(doc_no)), encoding='utf8') as f:
+            titles.append(json.load(f)["dataset"]["invention_title"])
+    return titles
@@ -0,0 +1,218 @@
+# bench/run.py
+# 색인/검색 성능 벤치마크
+#
+#   python -m bench.run --docs 10000                    # 대체 분석기(simple)로 Komoran 비용 없이
+#   python -m bench.run --docs 2000 --tokenizer komoran # 실제 Komoran 포함
+#
+# 1. bench/corpus.py로 가짜 특허 corpus 생성 (같은 설정이면 재사용)
+# 2. 색인: 새 프로세스에서 build_index -> 색인 시간, docs/sec, peak RSS, 디스크 크기
+# 3. 검색: 새 프로세스에서 Searcher 시작 시간 + 워크로드(OR/AND/FIELD/PHRASE/VERBOSE)별 지연시간 p50/p95/p99
+# 결과는 --out 파일(JSON lines)에 한 줄씩 추가된다. git commit / 설정이 같이 저장되어 실행끼리 비교할 수 있다.
+#
+# 단계마다 새 프로세스(spawn)에서 돌리는 이유: peak RSS와 시작 시간을 앞 단계와 섞이지 않게 재기 위해
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import subprocess
+import contextlib
+import multiprocessing
+import numpy as np
+from .corpus import generate_corpus, make_vocabulary, sample_titles
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOC_TABLE_FILE = "doc_table.json"
+TERM_DICT_FILE = "term_dict.json"
+POSTINGS_FILE = "postings.bin"
+WORKLOADS = ["OR", "AND", "FIELD", "PHRASE", "VERBOSE"]
+COMMON_TERMS = 200 # Zipf 상위 이 순위까지를 자주 나오는 term으로 본다
+
+
+def peak_rss_mb():
+    # 이 프로세스 + 끝난 자식 프로세스(색인 워커) 중 최대 RSS. linux는 KB, macOS는 byte 단위
+    scale = 1 if sys.platform == "darwin" else 1024
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage * scale / (1024 * 1024)
+
+
+def dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def percentiles(latencies):
+    values = np.array(latencies) * 1000 # ms
+    return {"count": len(values), "mean_ms": float(values.mean()), "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)), "p99_ms": float(np.percentile(values, 99)),
+            "max_ms": float(values.max()), "qps": float(len(values) / values.sum() * 1000)}
+
+
+def make_queries(vocabulary, titles, count, seed=0):
+    # 워크로드별 검색어. 자주 나오는 term + 드문 term 조합 (seed가 같으면 항상 같은 검색어)
+    rng = random.Random(seed)
+    common = vocabulary[:COMMON_TERMS]
+    rare = vocabulary[COMMON_TERMS:COMMON_TERMS * 20]
+    phrases = [title.split() for title in titles if len(title.split()) >= 2]
+    queries = {name: [] for name in WORKLOADS}
+    for i in range(count):
+        queries["OR"].append(f"{rng.choice(common)} {rng.choice(rare)} {rng.choice(rare)}")
+        queries["AND"].append(f"[AND] {rng.choice(common)} {rng.choice(common if i % 2 else rare)}")
+        queries["FIELD"].append(f"[FIELD={'TAC'[i % 3]}] {rng.choice(common)} {rng.choice(rare)}")
+        words = rng.choice(phrases)
+        start = rng.randrange(len(words) - 1)
+        queries["PHRASE"].append(f"[PHRASE] {words[start]} {words[start + 1]}")
+        queries["VERBOSE"].append(f"[VERBOSE] {rng.choice(common)} {rng.choice(rare)}")
+    return queries
+
+
+def index_phase(corpus_dir, index_dir, options, quiet, with_metrics, tokenizer_workers):
+    from src.indexer import Indexer
+    from src.metrics import metrics
+    from src.tokenizer_pool import TokenizerService
+    if with_metrics:
+        metrics.enable()
+    start = time.perf_counter()
+    service = TokenizerService(tokenizer_workers, os.environ["TOKENIZER_BACKEND"]).install() if tokenizer_workers else None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        indexer = Indexer(corpus_dir, index_dir, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, **options)
+        indexer.build_index()
+    if service is not None:
+        service.close()
+    elapsed = time.perf_counter() - start
+    result = {"seconds": elapsed, "peak_rss_mb": peak_rss_mb()}
+    if with_metrics:
+        result["metrics"] = metrics.snapshot()
+    return result
+
+
+def search_phase(index_dir, queries, k, options, warmup, with_metrics):
+    start = time.perf_counter()
+    from src.searcher import Searcher # import 시간(형태소 분석기 시작 포함)도 시작 시간에 넣는다
+    from src.metrics import metrics
+    imported = time.perf_counter()
+    searcher = Searcher(index_dir, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, **options)
+    opened = time.perf_counter()
+    result = {"import_seconds": imported - start, "open_seconds": opened - imported, "startup_seconds": opened - start, "workloads": {}}
+
+    for name, workload in queries.items():
+        for query in workload[:warmup]: # 첫 mmap page fault / JIT 같은 한 번만 드는 비용은 빼고
+            searcher.search(query, k, snippets="[VERBOSE]" in query)
+        if with_metrics: # 워크로드별 단계 breakdown
+            metrics.reset()
+            metrics.enable()
+        latencies = []
+        hits = 0
+        for query in workload:
+            t = time.perf_counter()
+            result_item = searcher.search(query, k, snippets="[VERBOSE]" in query)
+            latencies.append(time.perf_counter() - t)
+            hits += result_item["total"]
+        result["workloads"][name] = dict(percentiles(latencies), avg_hits=hits / len(workload))
+        if with_metrics:
+            metrics.disable()
+            result["workloads"][name]["metrics"] = metrics.snapshot()
+    result["peak_rss_mb"] = peak_rss_mb()
+    searcher.close()
+    return result
+
+
+def run_child(queue, func, args):
+    try:
+        queue.put(("ok", func(*args)))
+    except BaseException as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+        raise
+
+
+def run_in_process(func, *args):
+    # func(*args)를 새 프로세스에서 실행하고 결과를 돌려받는다
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=run_child, args=(queue, func, args))
+    process.start()
+    status, value = queue.get()
+    process.join()
+    if status != "ok":
+        raise RuntimeError(f"{func.__name__} failed: {value}")
+    return value
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="색인/검색 벤치마크")
+    parser.add_argument("--docs", type=int, default=10000, help="생성할 문서 수")
+    parser.add_argument("--vocab", type=int, default=50000, help="단어 종류 수")
+    parser.add_argument("--zipf", type=float, default=1.0, help="Zipf 지수 (클수록 상위 term에 몰림)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tokenizer", choices=["simple", "komoran"], default="simple", help="simple이면 Komoran 없이 대체 분석기")
+    parser.add_argument("--workers", type=int, default=1, help="색인 워커 프로세스 수")
+    parser.add_argument("--tokenizer-workers", type=int, default=None, help="색인할 때 형태소 분석기 풀(src/tokenizer_pool.py) 워커 수")
+    parser.add_argument("--memory-budget", type=int, default=None, help="SPIMI 색인 메모리 예산(MB)")
+    parser.add_argument("--dict-format", choices=["binary", "json"], default="binary")
+    parser.add_argument("--no-positions", action="store_true", help="positions.bin 없이 색인")
+    parser.add_argument("--queries", type=int, default=200, help="워크로드별 검색어 수")
+    parser.add_argument("--warmup", type=int, default=10, help="워크로드별 측정 전에 돌릴 검색어 수")
+    parser.add_argument("-k", type=int, default=5, help="top-k")
+    parser.add_argument("--cache", action="store_true", help="검색 LRU 캐시를 켜고 측정 (기본은 끄고 매번 실제로 계산)")
+    parser.add_argument("--work-dir", default=os.path.join(ROOT_DIR, "bench", "work"), help="corpus / 색인을 만들 폴더")
+    parser.add_argument("--out", default=os.path.join(ROOT_DIR, "bench", "results.jsonl"), help="결과를 추가할 JSON lines 파일")
+    parser.add_argument("--metrics", action="store_true", help="단계별 계측(src/metrics.py)을 켜고 breakdown도 결과에 저장")
+    parser.add_argument("--skip-index", action="store_true", help="색인은 다시 만들지 않고 검색만 측정")
+    parser.add_argument("--verbose", action="store_true", help="색인 로그 출력")
+    parser.add_argument("--note", default="", help="결과에 같이 남길 메모")
+    args = parser.parse_args()
+
+    os.environ["TOKENIZER_BACKEND"] = args.tokenizer # spawn 자식 프로세스(색인 워커 포함)에 전달
+    corpus_dir = os.path.join(args.work_dir, f"corpus_{args.docs}_{args.vocab}_{args.zipf}_{args.seed}")
+    index_dir = os.path.join(args.work_dir, f"index_{args.tokenizer}")
+
+    start = time.perf_counter()
+    corpus = generate_corpus(corpus_dir, args.docs, args.vocab, args.zipf, args.seed)
+    print(f"corpus : {args.docs}개 문서 ({time.perf_counter() - start:.1f}s) -> {corpus_dir}")
+
+    record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git_commit": git_commit(), "note": args.note,
+              "host": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+              "config": {key: value for key, value in vars(args).items() if key not in ("work_dir", "out", "verbose", "note")},
+              "corpus": dict(corpus, bytes=dir_size(corpus_dir))}
+
+    if not args.skip_index:
+        options = {"workers": args.workers, "memory_budget": args.memory_budget, "dict_format": args.dict_format, "positions": not args.no_positions}
+        index = run_in_process(index_phase, corpus_dir, index_dir, options, not args.verbose, args.metrics, args.tokenizer_workers)
+        index["docs_per_sec"] = args.docs / index["seconds"]
+        index["bytes"] = dir_size(index_dir)
+        record["index"] = index
+        print(f"index  : {index['seconds']:.1f}s, {index['docs_per_sec']:.0f} docs/sec, peak RSS {index['peak_rss_mb']:.0f}MB, {index['bytes'] / 1024 / 1024:.1f}MB")
+
+    vocabulary = make_vocabulary(args.vocab, args.seed)
+    queries = make_queries(vocabulary, sample_titles(corpus_dir, args.docs, 500, args.seed), args.queries, args.seed)
+    cache_sizes = {} if args.cache else {"query_cache_size": 0, "postings_cache_size": 0, "result_cache_size": 0}
+    search = run_in_process(search_phase, index_dir, queries, args.k, cache_sizes, args.warmup, args.metrics)
+    record["search"] = search
+    print(f"search : startup {search['startup_seconds'] * 1000:.0f}ms (import {search['import_seconds'] * 1000:.0f}ms), peak RSS {search['peak_rss_mb']:.0f}MB")
+    for name, stats in search["workloads"].items():
+        print(f"  {name:<8} p50 {stats['p50_ms']:7.2f}ms  p95 {stats['p95_ms']:7.2f}ms  p99 {stats['p99_ms']:7.2f}ms  ({stats['qps']:.0f} qps)")
+        if "metrics" in stats: # 검색어 하나당 평균 단계별 시간
+            stages = {stage.split(".", 1)[1]: h["sum_ms"] / stats["count"] for stage, h in stats["metrics"]["histograms"].items() if stage != "query.total"}
+            print("           " + "  ".join(f"{stage} {ms:.3f}ms" for stage, ms in stages.items()))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'a', encoding='utf8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"결과 저장 : {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 # main.py
+import os
 from src.indexer import Indexer
 from src.searcher import Searcher
+from src.shards import ShardedSearcher, load_manifest as load_shard_manifest
+from src.metrics import metrics
+from src.tokenizer_pool import TokenizerService
 
 # 설정
 DATA_DIR = r"/Users/seolwootae/indexer-dnxo1224/data" # data path
@@ -8,22 +12,71 @@ INDEX_DIR = "index" # indexer 출력 dir / indexer.py의 출력 결과 파일 di
 DOC_TABLE_FILE = "doc_table.json"
 TERM_DICT_FILE = "term_dict.json"
 POSTINGS_FILE = "postings.bin"
+INDEX_WORKERS = 1 # 색인 워커 프로세스 수. 1이면 직렬, None이면 CPU 코어 수만큼 병렬 색인
+INDEX_MEMORY_BUDGET = None # 색인 메모리 예산(MB). 값을 주면 SPIMI(run 파일 flush + merge) 방식으로 색인
+INDEX_POSITIONS = True # term 위치(positions.bin)도 색인. [PHRASE] 검색을 원본 파일 없이 색인만으로 처리
+INDEX_SHARDS = None # 샤드 수. 값을 주면 문서를 N개 샤드(shard_XXX/)로 나눠 색인하고, 검색은 샤드 워커 N개가 동시에 한다 (binary 사전만). None이면 단일 색인
+DICT_FORMAT = "binary" # term_dict / doc_table 저장 포맷. "binary"(mmap 하는 .bin) or "json"
+TOKEN_CACHE_FILE = os.path.join(INDEX_DIR, "token_cache.db") # 형태소 분석 결과 캐시. None이면 캐시 안 씀
+TOKEN_CACHE_MB = 1024 # 토큰 캐시 최대 크기(MB). 넘으면 오래 안 쓴 항목부터 삭제
+QUERY_CACHE_SIZE = 1024 # 검색 LRU 캐시 크기 (검색어 형태소 분석 결과). 0이면 끔
+POSTINGS_CACHE_SIZE = 256 # 검색 LRU 캐시 크기 (자주 나오는 term의 포스팅 리스트)
+RESULT_CACHE_SIZE = 1024 # 검색 LRU 캐시 크기 (검색어 + 플래그별 최종 결과)
+SERVER_HOST = "127.0.0.1" # 검색 서버 주소 (serve 작업)
+SERVER_PORT = 8000
+SERVER_WORKERS = None # 검색 서버 워커 프로세스 수. None이면 CPU 코어 수만큼
+TOKENIZER_WORKERS = None # 형태소 분석기 풀 워커 수. 값을 주면 분석기(JVM) N개를 띄워 두고 색인 워커 / 검색 서버 워커가 나눠 씀. None이면 프로세스마다 직접 분석
+METRICS_ENABLED = False # 단계별 시간/카운터 계측. 끝날 때 요약 출력 (검색 서버는 /metrics)
+SLOW_QUERY_MS = None # 계측 중 이 시간(ms)보다 오래 걸린 검색어는 단계별 breakdown을 SLOW_QUERY_LOG에 기록. None이면 안 씀
+SLOW_QUERY_LOG = os.path.join(INDEX_DIR, "slow_queries.log")
 
 if __name__ == "__main__":
 
-    task = input("작업을 선택하세요 (index/search): ").strip().lower() # 입력값이 잘못들어가도 인지할 수 있도록 strip,lower 사용.
+    task = input("작업을 선택하세요 (index/update/search/serve): ").strip().lower() # 입력값이 잘못들어가도 인지할 수 있도록 strip,lower 사용.
+    metrics_options = {"slow_query_ms": SLOW_QUERY_MS, "slow_query_log": SLOW_QUERY_LOG} if METRICS_ENABLED else None
+    if metrics_options is not None:
+        metrics.enable(**metrics_options)
+    # 풀을 먼저 띄워 두면 이후에 뜨는 색인 워커 / 검색 서버 워커도 환경변수로 풀을 쓴다
+    tokenizer_service = TokenizerService(TOKENIZER_WORKERS).install() if TOKENIZER_WORKERS else None
 
     if task in ("index", "i"): # input 입력 받은 값이 index or i 가 들어가면 실행. 오타가 있어도 실행되는게 진짜 좋은 것 같음 !! 
-        indexer = Indexer(DATA_DIR, INDEX_DIR, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE) 
+        indexer = Indexer(DATA_DIR, INDEX_DIR, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, workers=INDEX_WORKERS, memory_budget=INDEX_MEMORY_BUDGET, positions=INDEX_POSITIONS, dict_format=DICT_FORMAT, token_cache=TOKEN_CACHE_FILE, token_cache_max_bytes=TOKEN_CACHE_MB * 1024 * 1024)
         # 설정값을 그대로 불러오게 만들었음. 유지보수를 위한 클래스화
-        indexer.build_index() # indexer 패키지의 인덱스 빌드 코드를 실행.
+        if INDEX_SHARDS:
+            indexer.build_shards(INDEX_SHARDS) # 샤드마다 색인 + 전체 통계(N, df, 필드 길이)
+        else:
+            indexer.build_index() # indexer 패키지의 인덱스 빌드 코드를 실행.
         print(f"색인이 완료되었습니다. 색인 결과는 '{INDEX_DIR}'에 저장되었습니다.")
+        for line in metrics.report(): # 계측이 꺼져 있으면 빈 리스트
+            print(f"[metrics] {line}")
+
+    elif task in ("update", "u"): # 바뀐 파일만 새 세그먼트로 증분 색인 (삭제된 파일은 tombstone 처리)
+        indexer = Indexer(DATA_DIR, INDEX_DIR, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, workers=INDEX_WORKERS, memory_budget=INDEX_MEMORY_BUDGET, positions=INDEX_POSITIONS, dict_format=DICT_FORMAT, token_cache=TOKEN_CACHE_FILE, token_cache_max_bytes=TOKEN_CACHE_MB * 1024 * 1024)
+        merge_thread = indexer.update_index() # 작은 세그먼트 merge는 백그라운드 스레드에서
+        print("증분 색인이 완료되었습니다. 세그먼트 merge가 끝날 때까지 기다립니다.")
+        merge_thread.join()
+        for line in metrics.report():
+            print(f"[metrics] {line}")
 
     elif task in ("search","s"):
-        searcher = Searcher(INDEX_DIR, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE)
+        # shards.json이 있으면 샤드 색인 -> 샤드 워커들에 나눠서 검색하는 coordinator
+        searcher_class = ShardedSearcher if load_shard_manifest(INDEX_DIR) is not None else Searcher
+        searcher = searcher_class(INDEX_DIR, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, query_cache_size=QUERY_CACHE_SIZE, postings_cache_size=POSTINGS_CACHE_SIZE, result_cache_size=RESULT_CACHE_SIZE)
 
         while True:
             input_query = input("검색어를 입력하세요.: ").strip()
             if not input_query:
                 break
-            searcher.process_query(input_query)
\ No newline at end of file
+            searcher.process_query(input_query)
+
+        for name, stats in searcher.cache_stats().items(): # 종료할 때 캐시 hit/miss 통계 출력
+            print(f"[cache] {name}: {stats['hits']} hits / {stats['misses']} misses (size {stats['size']}/{stats['maxsize']})")
+        for line in metrics.report():
+            print(f"[metrics] {line}")
+
+    elif task in ("serve", "v"): # HTTP/JSON 검색 서버. 워커 프로세스 여러 개가 같은 색인(mmap)을 나눠 쓰면서 동시에 검색
+        from src.server import serve
+        serve(INDEX_DIR, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, metrics_options=metrics_options, query_cache_size=QUERY_CACHE_SIZE, postings_cache_size=POSTINGS_CACHE_SIZE, result_cache_size=RESULT_CACHE_SIZE)
+
+    if tokenizer_service is not None:
+        tokenizer_service.close()
@@ -0,0 +1,95 @@
+# src/bm25f.py
+# BM25F 파라미터 + 벡터화된 점수 계산 엔진
+import math
+import numpy as np
+from .metrics import metrics
+
+FIELDS = ("title", "abstract", "claims")
+
+# 필드별 가중치 (Title > Abstract > Claims)
+WEIGHTS = {"title": 2.5, "abstract": 1.5, "claims": 1.1}
+# 필드별 길이 정규화 세기
+B = {"title": 0.3, "abstract": 0.75, "claims": 0.8}
+K1 = 1.2 # 파라미터 값 정의
+
+
+def idf(N, df): # idf 계산식
+    return math.log((N - df + 0.5) / (df + 0.5) + 1)
+
+
+def rescale_max_score(max_score, old_idf, new_idf, tf_scale=1.0):
+    # 다른 통계(N, df, 필드 평균 길이)로 계산한 term 점수 상한을 새 통계 기준 상한으로 바꾼다. (세그먼트 색인용)
+    # max_score = old_idf * (K1 + 1) * t / (K1 + t) 에서 최대 tilde_tf(t)를 되돌려 구하고,
+    # 평균 길이가 바뀌어서 tilde_tf가 커질 수 있는 최대 배율(tf_scale)을 곱한 뒤 new_idf로 다시 계산
+    ratio = max_score / old_idf
+    if ratio >= K1 + 1:
+        return new_idf * (K1 + 1)
+    t = K1 * ratio / (K1 + 1 - ratio) * tf_scale
+    return new_idf * (K1 + 1) * t / (K1 + t)
+
+
+def tf_scale(old_avgdl, new_avgdl):
+    # 1 - b + b * len / avgdl 의 비율은 len에 따라 1 ~ new_avgdl / old_avgdl 사이 -> tilde_tf는 최대 이 배율만큼 커진다
+    # 예전 평균 길이가 0인 필드는 그 필드 TF가 전부 0이라 점수에 영향이 없어서 뺀다
+    return max([1.0] + [new_avgdl[field] / old_avgdl[field] for field in FIELDS if old_avgdl[field]])
+
+
+class BM25FScorer:
+    # 문서별 필드 길이 정규화 값(Bunmo)을 색인 로드할 때 한 번만 계산해두고,
+    # 쿼리 때는 포스팅 리스트 전체를 NumPy 배열 연산으로 한 번에 점수 계산한다.
+    def __init__(self, field_lengths, live=None, stats=None):
+        # field_lengths: {"title": np.array([...]), "abstract": ..., "claims": ...} (doc_id 순서)
+        # live: 살아있는 문서 마스크 (세그먼트 색인에서 삭제된 문서는 N/평균 길이 통계에서 뺀다). None이면 전부
+        # stats: 전체 색인 통계 {"doc_count": N, "field_lengths": {필드: 길이 합}}. 샤드처럼 일부 문서만 가진 색인도
+        #        N/평균 길이를 전체 기준으로 맞춰서 나누지 않은 색인과 같은 점수를 낸다. None이면 field_lengths로 계산
+        if stats is not None:
+            self.N = stats["doc_count"]
+        else:
+            self.N = len(field_lengths["title"]) if live is None else int(np.count_nonzero(live))
+        self.avgdl = {}
+        self.norms = {}
+        for field in FIELDS:
+            lengths = np.asarray(field_lengths[field], dtype=np.int64)
+            if stats is not None:
+                total = np.int64(stats["field_lengths"][field])
+            else:
+                total = (lengths if live is None else lengths[live]).sum()
+            # 필드별 평균 길이(토큰 수)
+            self.avgdl[field] = float(total / self.N) if self.N else 0.0
+            # 필드별 TF 계산을 위한 분모 값. 1 - b + b * (len / avgdl)
+            # 평균 길이가 0이면(문서가 없거나 모든 문서에서 빈 필드) 그 필드 TF가 전부 0이라 1.0으로 둔다 (0으로 나누면 nan)
+            if self.avgdl[field]:
+                self.norms[field] = 1 - B[field] + B[field] * (lengths / self.avgdl[field])
+            else:
+                self.norms[field] = np.ones(len(lengths))
+
+    def field_mask(self, postings, target_fields=None):
+        # 선택된 필드 중 하나라도 TF > 0 인 포스팅 (필드 제한이 없으면 모든 포스팅)
+        keep = np.zeros(len(postings), dtype=bool)
+        for field in FIELDS:
+            if not target_fields or field in target_fields:
+                keep |= postings["tf_" + field] > 0
+        return keep
+
+    def score(self, postings, term_idf, target_fields=None):
+        # postings: POSTING_DTYPE 배열 -> (doc_ids, scores) 반환 (선택된 필드에 term이 없는 문서는 제외)
+        # 선택되지 않은 필드의 TF는 0으로 취급 (0을 더해도 값이 안 바뀌니까 아예 계산에서 뺀다)
+        fields = [field for field in FIELDS if not target_fields or field in target_fields]
+        doc_ids = postings["doc_id"]
+        metrics.count("scorer.postings_scored", len(postings))
+
+        # 해당 문서에서 유효한 필드에 단어가 하나도 없으면 스킵 (OR 쿼리에서도 필드 제한 적용 가능)
+        keep = self.field_mask(postings, target_fields)
+        if not keep.all():
+            postings = postings[keep]
+            doc_ids = doc_ids[keep]
+
+        # sum( wf * tf_t,d,f / B_t,d,f )
+        tilde_tf = np.zeros(len(postings))
+        for field in fields:
+            tilde_tf = tilde_tf + WEIGHTS[field] * postings["tf_" + field] / self.norms[field][doc_ids]
+
+        # 최종 BM25F 점수 계산
+        numerator = tilde_tf * (K1 + 1) # 분자
+        denominator = K1 + tilde_tf # 분모
+        return doc_ids, term_idf * (numerator / denominator)
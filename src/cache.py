@@ -0,0 +1,39 @@
+# src/cache.py
+# 검색용 LRU 캐시 (검색어 형태소 분석 결과 / 포스팅 리스트 / 검색 결과)
+from collections import OrderedDict
+
+
+class LRUCache:
+    # 크기 제한 LRU. maxsize가 0이면 아무것도 저장하지 않는다 (캐시 끄기).
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False) # 가장 오래 안 쓴 항목
+
+    def clear(self): # 통계는 그대로 두고 내용만 비움 (색인 generation이 바뀐 경우)
+        self.data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self.data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,137 @@
+# src/doc_table.py
+# 문서 테이블 (doc_table.json / doc_table.bin)
+#
+# doc_table.bin : 컬럼형 바이너리 파일. mmap 해서 컬럼을 NumPy 배열 view로 바로 쓴다.
+#   [헤더 16바이트] b"TRSC" + version(1) + 예약(3) + 문서 수(uint64)
+#   [컬럼들]        len_title, len_abstract, len_claims : int32[N]
+#                   filename_offsets, path_offsets      : uint64[N + 1] (문자열 영역 안의 시작 위치)
+#   [문자열 영역]    filename들, path들 (utf8)
+import os
+import json
+import struct
+import tempfile
+import shutil
+from array import array
+import numpy as np
+from .postings import MappedFile
+
+MAGIC = b"TRSC"
+VERSION = 1
+HEADER_FORMAT = "<4sB3xQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+LENGTH_COLUMNS = ("len_title", "len_abstract", "len_claims")
+
+
+def binary_path(path): # doc_table.json -> doc_table.bin
+    return os.path.splitext(path)[0] + ".bin"
+
+
+def align8(offset):
+    return (offset + 7) // 8 * 8
+
+
+class DocTableWriter:
+    # doc_id 순서대로 append() 한다. 길이 컬럼/문자열 offset만 메모리에 두고 문자열은 임시 파일에 흘려 쓴다.
+    def __init__(self, path):
+        self.path = path
+        self.lengths = {column: array('i') for column in LENGTH_COLUMNS}
+        self.filename_offsets = array('Q', [0])
+        self.path_offsets = array('Q', [0])
+        self.filenames = tempfile.TemporaryFile(dir=os.path.dirname(path))
+        self.paths = tempfile.TemporaryFile(dir=os.path.dirname(path))
+
+    def append(self, doc):
+        for column in LENGTH_COLUMNS:
+            self.lengths[column].append(doc[column])
+        filename = doc["filename"].encode('utf8')
+        file_path = doc["path"].encode('utf8')
+        self.filenames.write(filename)
+        self.paths.write(file_path)
+        self.filename_offsets.append(self.filename_offsets[-1] + len(filename))
+        self.path_offsets.append(self.path_offsets[-1] + len(file_path))
+
+    def close(self):
+        doc_count = len(self.filename_offsets) - 1
+        with open(self.path, 'wb') as f:
+            f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, doc_count))
+            for column in LENGTH_COLUMNS:
+                f.write(np.asarray(self.lengths[column], dtype="<i4").tobytes())
+            f.write(b"\0" * (align8(f.tell()) - f.tell()))
+            f.write(np.asarray(self.filename_offsets, dtype="<u8").tobytes())
+            f.write(np.asarray(self.path_offsets, dtype="<u8").tobytes())
+            for tmp in (self.filenames, self.paths):
+                tmp.seek(0)
+                shutil.copyfileobj(tmp, f)
+                tmp.close()
+
+
+class BinaryDocTable(MappedFile):
+    # doc_table[doc_id] -> {"doc_id", "filename", "path", "len_title", ...} (json 때와 같은 모양)
+    def __init__(self, path):
+        super().__init__(path)
+        magic, _, self.doc_count = struct.unpack(HEADER_FORMAT, bytes(self.buf[:HEADER_SIZE]))
+        if magic != MAGIC:
+            raise ValueError(f"Not a doc table file: {path}")
+        n = self.doc_count
+        offset = HEADER_SIZE
+        self.columns = {}
+        for column in LENGTH_COLUMNS:
+            self.columns[column] = np.frombuffer(self.buf, dtype="<i4", count=n, offset=offset)
+            offset += 4 * n
+        offset = align8(offset)
+        self.filename_offsets = np.frombuffer(self.buf, dtype="<u8", count=n + 1, offset=offset)
+        offset += 8 * (n + 1)
+        self.path_offsets = np.frombuffer(self.buf, dtype="<u8", count=n + 1, offset=offset)
+        offset += 8 * (n + 1)
+        self.filenames_start = offset
+        self.paths_start = offset + int(self.filename_offsets[-1])
+
+    def __len__(self):
+        return self.doc_count
+
+    def __getitem__(self, doc_id):
+        if not 0 <= doc_id < self.doc_count:
+            raise IndexError(f"doc_id out of range: {doc_id}")
+        return {
+            "doc_id": int(doc_id),
+            "filename": self.string(self.filenames_start, self.filename_offsets, doc_id),
+            "path": self.string(self.paths_start, self.path_offsets, doc_id),
+            "len_title": int(self.columns["len_title"][doc_id]),
+            "len_abstract": int(self.columns["len_abstract"][doc_id]),
+            "len_claims": int(self.columns["len_claims"][doc_id])
+        }
+
+    def __iter__(self):
+        for doc_id in range(self.doc_count):
+            yield self[doc_id]
+
+    def string(self, base, offsets, doc_id):
+        start = base + int(offsets[doc_id])
+        end = base + int(offsets[doc_id + 1])
+        return self.mm[start:end].decode('utf8') if self.mm is not None else ""
+
+    def column(self, name):
+        return self.columns[name]
+
+    def close(self):
+        self.columns = None
+        self.filename_offsets = None
+        self.path_offsets = None
+        super().close()
+
+
+class JsonDocTable(list):
+    # 예전 doc_table.json 용. list 그대로 쓰고 컬럼만 배열로 뽑아준다.
+    def column(self, name):
+        return np.array([doc[name] for doc in self], dtype=np.int64)
+
+    def close(self):
+        pass
+
+
+def load_doc_table(path):
+    # doc_table.bin이 있으면 컬럼형 바이너리(mmap), 없으면 json
+    if os.path.exists(binary_path(path)):
+        return BinaryDocTable(binary_path(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return JsonDocTable(json.load(f))
@@ -0,0 +1,96 @@
+# src/docstore.py
+# stored fields 문서 저장소 (docstore.bin)
+# 스니펫 하이라이팅 / PHRASE 검증 때 원본 JSON 대신 여기서 title, abstract, claims를 꺼내 쓴다.
+#
+# 파일 구조:
+#   [헤더 8바이트] b"TRSD" + version(1) + 예약(3)
+#   [블록들]       문서 block_size개씩 묶어서 json([[title, abstract, claims], ...])을 zlib 압축
+#   [offset 표]    블록 시작 위치 uint64 배열 (블록 수 + 1개, 마지막 값은 offset 표 시작 위치)
+#   [footer 16바이트] offset 표 위치(uint64) + 문서 수(uint32) + block_size(uint32)
+import json
+import struct
+import zlib
+from collections import OrderedDict
+import numpy as np
+from .postings import MappedFile
+from .metrics import metrics
+
+MAGIC = b"TRSD"
+VERSION = 1
+HEADER_SIZE = 8
+FOOTER_FORMAT = "<QII"
+FOOTER_SIZE = struct.calcsize(FOOTER_FORMAT)
+DEFAULT_BLOCK_SIZE = 16
+COMPRESS_LEVEL = 1 # zlib 기본값(6)보다 색인이 훨씬 빠르고 크기는 20% 정도만 커진다 (읽을 때 속도는 같음)
+
+
+class DocStoreWriter:
+    # doc_id 순서대로 add() 해야 한다. (doc_id = 추가한 순번)
+    def __init__(self, path, block_size=DEFAULT_BLOCK_SIZE):
+        self.f = open(path, 'wb')
+        self.f.write(MAGIC + struct.pack("<B3x", VERSION))
+        self.block_size = block_size
+        self.block = []
+        self.offsets = []
+        self.offset = HEADER_SIZE
+        self.doc_count = 0
+
+    def add(self, title, abstract, claims):
+        self.block.append([title, abstract, claims])
+        self.doc_count += 1
+        if len(self.block) == self.block_size:
+            self.flush_block()
+
+    def flush_block(self):
+        data = zlib.compress(json.dumps(self.block, ensure_ascii=False).encode('utf8'), COMPRESS_LEVEL)
+        self.offsets.append(self.offset)
+        self.f.write(data)
+        self.offset += len(data)
+        self.block = []
+
+    def close(self):
+        if self.block:
+            self.flush_block()
+        self.offsets.append(self.offset) # 마지막 블록의 끝
+        self.f.write(np.array(self.offsets, dtype="<u8").tobytes())
+        self.f.write(struct.pack(FOOTER_FORMAT, self.offset, self.doc_count, self.block_size))
+        self.f.close()
+
+
+class DocStoreReader(MappedFile):
+    # doc_id -> {"title", "abstract", "claims"}. 최근에 푼 블록 몇 개는 캐싱 (같은 블록의 문서가 연달아 나오는 경우)
+    def __init__(self, path, cache_blocks=8):
+        super().__init__(path)
+        if bytes(self.buf[:4]) != MAGIC:
+            raise ValueError(f"Not a docstore file: {path}")
+        table_offset, self.doc_count, self.block_size = struct.unpack(FOOTER_FORMAT, bytes(self.buf[-FOOTER_SIZE:]))
+        block_count = (self.doc_count + self.block_size - 1) // self.block_size
+        self.offsets = np.frombuffer(self.buf, dtype="<u8", count=block_count + 1, offset=table_offset)
+        self.cache = OrderedDict()
+        self.cache_blocks = cache_blocks
+
+    def __len__(self):
+        return self.doc_count
+
+    def block(self, block_idx):
+        if block_idx in self.cache:
+            self.cache.move_to_end(block_idx)
+            return self.cache[block_idx]
+        start, end = int(self.offsets[block_idx]), int(self.offsets[block_idx + 1])
+        metrics.count("docstore.blocks_read")
+        docs = json.loads(zlib.decompress(self.buf[start:end]).decode('utf8'))
+        self.cache[block_idx] = docs
+        if len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        return docs
+
+    def get(self, doc_id):
+        if not 0 <= doc_id < self.doc_count:
+            raise IndexError(f"doc_id out of range: {doc_id}")
+        title, abstract, claims = self.block(doc_id // self.block_size)[doc_id % self.block_size]
+        return {"title": title, "abstract": abstract, "claims": claims}
+
+    def close(self):
+        self.offsets = None
+        self.cache.clear()
+        super().close()
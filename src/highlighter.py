@@ -0,0 +1,184 @@
+# src/highlighter.py
+# [VERBOSE] 스니펫 하이라이팅
+#
+# 검색어 term들을 정규식 하나로 묶어서 필드 텍스트를 한 번만 훑고 term별 등장 위치(겹치는 것 포함)를 모두 구한다.
+# 창(window) 후보는 왼쪽부터 차례로 보면서 term별 위치 리스트에서 이진 탐색으로 창 안에 들어 있는지만 확인한다.
+# (term마다 필드 전체 re.finditer + 창마다 term별 re.search 하던 것을 대신함. AND는 위치를 한 번만 구해서 매 단계 재사용)
+#
+# 고르는 창과 <<>> 표시는 예전과 똑같다.
+#   창 후보 : 각 term의 (겹치지 않는) 등장 위치 i마다 [max(0, i - 40), 거기서 +80)
+#   창 점수 : 창 안에 통째로 들어 있는 term 수 (OR은 검색어에 두 번 나온 term은 두 번 셈)
+#   동점    : Title > Abstract > Claims, 같은 필드면 앞쪽 창
+#   표시    : 고른 창(80자)에서 검색어 term 순서대로 하나씩 <<>>로 감싼다 (서로 겹치는 term은 예전처럼 중첩됨)
+import re
+from bisect import bisect_left
+
+WINDOW_SIZE = 80
+
+
+def same_text(a, b):
+    # 대소문자 무시하고 같은 문자열인지 (re.IGNORECASE와 같은 기준. 다른 글자만 한 글자짜리 정규식으로 비교)
+    return len(a) == len(b) and all(x == y or re.match(re.escape(x), y, re.IGNORECASE) for x, y in zip(a, b))
+
+
+class Highlighter:
+    # 검색어 하나에 하나 만들어서 top-k 문서 전부에 쓴다 (정규식 컴파일 한 번)
+    def __init__(self, query_terms):
+        self.query_terms = list(query_terms)
+        self.terms = [term for term in dict.fromkeys(self.query_terms) if term] # 중복 뺀 term
+        self.lengths = [len(term) for term in self.terms]
+        self.weights = [self.query_terms.count(term) for term in self.terms]
+        # 긴 term부터 (term1)|(term2)|... 로 한 번 훑으면 각 위치에서 시작하는 가장 긴 term이 잡힌다.
+        # 같은 위치에서 시작하는 더 짧은 term은 그 term의 앞부분이어야 하므로 prefixes로 같이 기록한다.
+        self.order = sorted(range(len(self.terms)), key=lambda j: -self.lengths[j])
+        self.prefixes = [[i for i in range(len(self.terms)) if self.lengths[i] <= self.lengths[j]
+                          and same_text(self.terms[i], self.terms[j][:self.lengths[i]])] for j in range(len(self.terms))]
+        # (그룹으로 어떤 term인지 표시하면 re의 빠른 첫 글자 탐색이 꺼져서, 잡힌 글자로 term을 찾는다)
+        self.pattern = re.compile("|".join(re.escape(self.terms[j]) for j in self.order), re.IGNORECASE) if self.terms else None
+        self.index = {}
+        for j in self.order:
+            self.index.setdefault(self.terms[j], j)
+        # 잡힌 term 안쪽에서 다른 term(또는 자기 자신)이 시작할 수 있는 offset들. 이 위치는 훑을 때 건너뛰므로 따로 확인한다.
+        # (term끼리 겹칠 수 없으면 비어 있어서 추가 비용 없음)
+        self.inner_offsets = [[k for k in range(1, self.lengths[j]) if any(self.overlaps(i, j, k) for i in range(len(self.terms)))]
+                              for j in range(len(self.terms))]
+        # 자기 자신과 겹쳐서 나올 수 있는 term(ex. "aa")은 re.finditer가 고르는 위치(겹치지 않게)를 따로 계산해야 한다
+        self.self_overlapping = [bool(self.inner_offsets[j]) and any(self.overlaps(j, j, k) for k in self.inner_offsets[j])
+                                 for j in range(len(self.terms))]
+        self.markers = [re.compile(re.escape(term), re.IGNORECASE) for term in self.query_terms]
+
+    def overlaps(self, i, j, k):
+        # term j의 k번째 글자부터 term i가 시작하는 것이 가능한지 (겹치는 부분이 같은 글자)
+        size = min(self.lengths[i], self.lengths[j] - k)
+        return same_text(self.terms[i][:size], self.terms[j][k:k + size])
+
+    def matched_term(self, matched):
+        # 정규식이 잡은 글자 -> term 번호 (대소문자가 다르면 긴 term부터 비교. 정규식도 같은 순서로 고름)
+        j = self.index.get(matched)
+        if j is None:
+            j = next(j for j in self.order if same_text(self.terms[j], matched))
+        return j
+
+    def snippets(self, targets, mode):
+        # targets: [(필드 이름, 텍스트), ...] 우선순위 순 -> [(필드 이름, 스니펫), ...]
+        if mode == "PHRASE":
+            return self.phrase_snippet(targets)
+        if self.pattern is None:
+            return []
+        fields = [(field_name, text) + self.find(text) for field_name, text in targets if text]
+        if mode == "OR":
+            return self.or_snippet(fields)
+        return self.and_snippets(fields)
+
+    def find(self, text):
+        # term별 (등장 위치 전부, re.finditer처럼 겹치지 않게 고른 위치) - 둘 다 오름차순
+        occurrences = [[] for _ in self.terms]
+        for match in self.pattern.finditer(text):
+            start = match.start()
+            j = self.matched_term(match.group())
+            for i in self.prefixes[j]:
+                occurrences[i].append(start)
+            for k in self.inner_offsets[j]: # 잡힌 term에 가려진 위치 (겹치는 등장)
+                inner = self.pattern.match(text, start + k)
+                if inner:
+                    for i in self.prefixes[self.matched_term(inner.group())]:
+                        occurrences[i].append(start + k)
+        anchors = []
+        for j, starts in enumerate(occurrences):
+            if not self.self_overlapping[j]:
+                anchors.append(starts)
+                continue
+            picked = []
+            end = 0
+            for start in starts:
+                if start >= end:
+                    picked.append(start)
+                    end = start + self.lengths[j]
+            anchors.append(picked)
+        return occurrences, anchors
+
+    def best_window(self, text, occurrences, anchors, term_ids, weights, best_score):
+        # term_ids 등장 위치마다 창을 만들어 왼쪽부터 보면서 best_score보다 점수가 높은 첫 창 중 최고 -> (점수, 창 시작, 끝, 들어 있는 term들)
+        # 창 시작은 오름차순이라 term별 탐색 시작점(lows)을 앞으로만 옮기면 된다.
+        points = sorted(start for j in term_ids for start in anchors[j])
+        full_score = sum(weights)
+        best = None
+        lows = [0] * len(term_ids)
+        prev = -1
+        for point in points:
+            if point == prev: # 같은 창
+                continue
+            prev = point
+            w_start = max(0, point - WINDOW_SIZE // 2)
+            w_end = min(len(text), w_start + WINDOW_SIZE)
+            score = 0
+            covered = []
+            for row, j in enumerate(term_ids):
+                positions = occurrences[j]
+                lows[row] = low = bisect_left(positions, w_start, lows[row])
+                if low < len(positions) and positions[low] + self.lengths[j] <= w_end:
+                    score += weights[row]
+                    covered.append(j)
+            if score > best_score:
+                best_score = score
+                best = (score, w_start, w_end, covered)
+                if score == full_score: # 더 높은 점수는 없음
+                    break
+        return best
+
+    def mark(self, snippet):
+        for marker in self.markers:
+            snippet = marker.sub(r"<<\g<0>>>", snippet)
+        return snippet
+
+    def phrase_snippet(self, targets):
+        # 지정 필드에서 구문이 처음 나오는 곳 한 군데 (구문을 가운데에)
+        phrase = self.query_terms[0] if self.query_terms else ""
+        if not phrase:
+            return []
+        for field_name, text in targets:
+            match = self.markers[0].search(text)
+            if match:
+                start = max(0, match.start() - (WINDOW_SIZE - len(phrase)) // 2)
+                end = min(len(text), start + WINDOW_SIZE)
+                return [(field_name, self.mark(text[start:end]))]
+        return []
+
+    def or_snippet(self, fields):
+        # (서로 다른) 검색어가 가장 많이 들어 있는 창 하나
+        term_ids = range(len(self.terms))
+        best_score = -1
+        best = None
+        for field_name, text, occurrences, anchors in fields:
+            window = self.best_window(text, occurrences, anchors, term_ids, self.weights, best_score)
+            if window is not None:
+                best_score = window[0]
+                best = (field_name, text[window[1]:window[2]])
+                if best_score == sum(self.weights):
+                    break
+        if best is None or not best[1]:
+            return []
+        return [(best[0], self.mark(best[1]))]
+
+    def and_snippets(self, fields):
+        # 아직 안 보여준 term이 가장 많이 들어 있는 창을 골라서 모든 term이 나올 때까지 반복
+        snippets = []
+        remaining = set(range(len(self.terms)))
+        while remaining:
+            term_ids = sorted(remaining)
+            weights = [1] * len(term_ids)
+            best_score = 0
+            best = None
+            for field_name, text, occurrences, anchors in fields:
+                window = self.best_window(text, occurrences, anchors, term_ids, weights, best_score)
+                if window is not None:
+                    best_score = window[0]
+                    best = (field_name, text[window[1]:window[2]], window[3])
+                    if best_score == len(term_ids):
+                        break
+            if best is None:
+                break
+            field_name, snippet, covered = best
+            snippets.append((field_name, self.mark(snippet)))
+            remaining -= set(covered)
+        return snippets
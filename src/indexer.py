@@ -3,10 +3,200 @@
 import os
 import json
 import struct
-from .tokenizer import extract_terms # tokenizer에 있는 추출 함수 가져오기. ps. 같은 디렉토리에 있기때문에 .tokenizer라고 써야함 !
+import heapq
+import shutil
+import time
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from functools import partial
+from array import array
+import numpy as np
+from .postings import FORMAT_VARINT, FORMAT_LEGACY, POSTING_DTYPE, write_header, encode_postings, encode_positions
+from .bm25f import BM25FScorer, idf
+from .docstore import DocStoreWriter
+from . import term_dict as term_dict_format
+from . import doc_table as doc_table_format
+from . import segments
+from . import shards
+from .token_cache import TokenCache, DEFAULT_MAX_BYTES, open_reader, close_readers
+from .metrics import metrics
+from .tokenizer import extract_terms_batch # tokenizer에 있는 추출 함수 가져오기. ps. 같은 디렉토리에 있기때문에 .tokenizer라고 써야함 !
+
+STAGING_SUFFIX = ".tmp" # 쓰는 중인 색인 파일 (publish 때 제자리로)
+FIELD_NAMES = ("title", "abstract", "claims") # 토큰 캐시 key에 들어가는 필드 이름 (read_document 순서)
+BATCHES_IN_FLIGHT_PER_WORKER = 2 # 병렬 색인에서 워커당 동시에 맡겨 두는 묶음 수 (분석 결과가 부모 메모리에 쌓이는 양의 상한)
+
+
+def read_document(file_path):
+    # json 하나를 읽어서 (title, abstract, claims) 원문. 깨진 파일이면 None
+    with open(file_path, encoding='utf8') as json_file: # 파일 열기
+        try:
+            data = json.load(json_file)
+        except json.JSONDecodeError:
+            print(f"Skipping malformed JSON file: {json_file.name}")
+            return None
+
+    title = data['dataset'].get('invention_title','')
+    abstract = data['dataset'].get('abstract','')
+    claims = data['dataset'].get('claims','')
+    return title, abstract, claims
+
+
+def analyze_fields(fields, field_terms, positions=False, stored_fields=False):
+    # 문서 하나의 필드별 term 리스트 -> 필드별 TF 계산까지 한 결과.
+    # 직렬 빌드와 병렬 빌드(워커 프로세스)가 똑같이 이 함수를 쓰기 때문에 결과가 항상 같다.
+    # positions=True 이면 field_terms가 필드별 (terms, 위치들)이고, term별 필드 내 위치도 인코딩해서 같이 돌려준다. (PHRASE 검색용)
+    # stored_fields=True 이면 원문 필드(title, abstract, claims)도 같이 돌려준다. (docstore.bin 저장용)
+    if positions:
+        field_positions = [raw for _, raw in field_terms]
+        field_terms = [terms for terms, _ in field_terms]
+    title_txt, abstract_txt, claims_txt = field_terms
+
+    # 단어별, 필드별 빈도수 계산
+    # txt_counts 구조: { "term": {"title": 0, "abstract": 0, "claims": 0} }
+    txt_counts = {}
+
+    for t in title_txt:
+        if t not in txt_counts: txt_counts[t] = {"title": 0, "abstract": 0, "claims": 0}
+        txt_counts[t]["title"] += 1
+
+    for t in abstract_txt:
+        if t not in txt_counts: txt_counts[t] = {"title": 0, "abstract": 0, "claims": 0}
+        txt_counts[t]["abstract"] += 1
+
+    for t in claims_txt:
+        if t not in txt_counts: txt_counts[t] = {"title": 0, "abstract": 0, "claims": 0}
+        txt_counts[t]["claims"] += 1
+
+    analyzed = {
+        "len_title": len(title_txt),
+        "len_abstract": len(abstract_txt),
+        "len_claims": len(claims_txt),
+        "txt_counts": txt_counts
+    }
+
+    if positions:
+        # term_positions 구조: { "term": ([title 위치들], [abstract 위치들], [claims 위치들]) }
+        # 위치는 형태소 분석 결과(버린 토큰 포함) 순번이라 "인공지능 3 시스템"의 두 term은 붙어 있지 않다
+        term_positions = {t: ([], [], []) for t in txt_counts}
+        for field_idx, field_txt in enumerate((title_txt, abstract_txt, claims_txt)):
+            for pos, t in zip(field_positions[field_idx], field_txt):
+                term_positions[t][field_idx].append(pos)
+        analyzed["positions"] = {t: encode_positions(field_positions) for t, field_positions in term_positions.items()}
+
+    if stored_fields:
+        analyzed["fields"] = fields
+
+    return analyzed
+
+
+def analyze_in_order(pool, analyze, batches, in_flight):
+    # 워커 풀에 묶음을 최대 in_flight개만 맡겨 두고 입력 순서대로 결과를 돌려준다.
+    # pool.imap은 입력을 전부 미리 넘겨서 워커가 부모(포스팅 쌓기 / run 파일 쓰기)보다 얼마든지 앞서 나가고,
+    # 끝난 분석 결과가 부모 메모리에 쌓여서 SPIMI memory_budget을 넘을 수 있다.
+    # 결과 하나를 받으면 다음 묶음을 바로 맡긴 뒤 돌려준다. (부모가 처리하는 동안에도 워커는 계속 일함)
+    batches = iter(batches)
+    pending = deque(pool.apply_async(analyze, (batch,)) for batch in itertools.islice(batches, in_flight))
+    while pending:
+        result = pending.popleft().get()
+        for batch in itertools.islice(batches, 1):
+            pending.append(pool.apply_async(analyze, (batch,)))
+        yield result
+
+
+def analyze_batch(file_paths, positions=False, stored_fields=False, token_cache=None): # 워커 프로세스 하나가 처리하는 단위 (파일 여러 개 묶음)
+    # 묶음 안 모든 문서의 필드 텍스트를 모아서 형태소 분석을 한 번에 부른다. (토크나이저 풀이면 풀 워커들이 나눠서 분석)
+    # token_cache(token_cache.db 경로)를 주면 필드 텍스트가 예전과 같을 때 형태소 분석 없이 캐시된 term 리스트를 쓴다.
+    documents = [read_document(file_path) for file_path in file_paths]
+    if token_cache:
+        pendings = [{"hits": [], "new": []} if fields is not None else None for fields in documents] # 캐시에 쓸 내용은 부모 프로세스가 모아서 쓴다
+        items = [(field, text) for fields in documents if fields is not None for field, text in zip(FIELD_NAMES, fields)]
+        terms = open_reader(token_cache).extract_terms_batch(items, [pending for pending in pendings if pending is not None for _ in FIELD_NAMES], positions)
+    else:
+        terms = extract_terms_batch([text for fields in documents if fields is not None for text in fields], positions)
+
+    results = []
+    i = 0
+    for doc_idx, fields in enumerate(documents):
+        if fields is None:
+            results.append(None)
+            continue
+        analyzed = analyze_fields(fields, terms[i:i + len(FIELD_NAMES)], positions, stored_fields)
+        i += len(FIELD_NAMES)
+        if token_cache:
+            analyzed["token_cache"] = pendings[doc_idx]
+        results.append(analyzed)
+    return results
+
+
+# SPIMI 메모리 사용량 추정용 상수 (CPython 기준 대략적인 값)
+POSTING_BYTES = 16 # 포스팅 하나 = struct "iiii" 16바이트 (bytearray에 바로 pack 해둔다)
+TERM_OVERHEAD_BYTES = 200 # term 문자열 + dict 슬롯 + bytearray 객체 오버헤드
+
+
+class JsonStreamWriter:
+    # json.dump(obj, indent=4, ensure_ascii=False)와 똑같은 모양의 파일을 항목 하나씩 써 내려가는 writer.
+    # doc_table / term_dict를 메모리에 다 들고 있지 않아도 기존과 같은 json 파일을 만들 수 있다.
+    def __init__(self, path, kind):
+        self.f = open(path, 'w', encoding='utf8')
+        self.kind = kind # "list" or "dict"
+        self.count = 0
+
+    def _write_item(self, text):
+        self.f.write("\n" if self.count == 0 else ",\n")
+        self.f.write(text.replace("\n", "\n    "))
+        self.count += 1
+
+    def append(self, value): # list 항목 추가
+        if self.count == 0: self.f.write("[")
+        self._write_item("    " + json.dumps(value, ensure_ascii=False, indent=4))
+
+    def add(self, key, value): # dict 항목 추가
+        if self.count == 0: self.f.write("{")
+        self._write_item("    " + json.dumps(key, ensure_ascii=False) + ": " + json.dumps(value, ensure_ascii=False, indent=4))
+
+    def close(self):
+        if self.count == 0:
+            self.f.write("[]" if self.kind == "list" else "{}")
+        else:
+            self.f.write("\n]" if self.kind == "list" else "\n}")
+        self.f.close()
+
+
+def write_run(run_path, block):
+    # 메모리 블록을 term 정렬 순서로 run 파일에 쓰기
+    # 레코드 구조: [term 길이(4)][term utf8][포스팅 수(4)][포스팅들(16 * n)][positions 길이(4)][positions]
+    with open(run_path, 'wb') as f:
+        for term in sorted(block):
+            term_bytes = term.encode('utf8')
+            data, pos_data = block[term]
+            f.write(struct.pack("<I", len(term_bytes)))
+            f.write(term_bytes)
+            f.write(struct.pack("<I", len(data) // POSTING_BYTES))
+            f.write(data)
+            f.write(struct.pack("<I", len(pos_data)))
+            f.write(pos_data)
+
+
+def read_run(run_path):
+    # run 파일을 (term, 포스팅 bytes, positions bytes) 순서대로 하나씩 읽는 제너레이터 (파일 전체를 올리지 않음)
+    with open(run_path, 'rb') as f:
+        while True:
+            head = f.read(4)
+            if not head:
+                break
+            (term_len,) = struct.unpack("<I", head)
+            term = f.read(term_len).decode('utf8')
+            (count,) = struct.unpack("<I", f.read(4))
+            data = f.read(count * POSTING_BYTES)
+            (pos_len,) = struct.unpack("<I", f.read(4))
+            yield term, data, f.read(pos_len)
+
 
 class Indexer:
-    def __init__(self, data_dir, output_dir, doc_table_file, term_dict_file, postings_file):
+    def __init__(self, data_dir, output_dir, doc_table_file, term_dict_file, postings_file, workers=1, batch_size=32, memory_budget=None, postings_format=FORMAT_VARINT, positions=False, stored_fields=True, dict_format="binary", token_cache=None, token_cache_max_bytes=DEFAULT_MAX_BYTES):
         self.data_dir = os.path.abspath(data_dir)
         self.output_dir = os.path.abspath(output_dir)
         os.makedirs(self.output_dir, exist_ok=True)
@@ -14,99 +204,611 @@ class Indexer:
         self.doc_table_file = os.path.join(self.output_dir, doc_table_file)
         self.term_dict_file = os.path.join(self.output_dir, term_dict_file)
         self.postings_file = os.path.join(self.output_dir, postings_file)
-        
-    def build_index(self):
-        word_dic = {}
-        term_postings = {}
-        sorted_txt = []
-        doc_id = -1 # 파일의 id를 추적하기 위한 변수 생성
-        doc_table = []
-        
-        doc_id = -1 # id 초기화
+
+        # 병렬 색인 설정. workers=1 이면 기존처럼 한 프로세스에서 순서대로 처리한다.
+        # workers=None 이면 CPU 코어 수만큼 워커를 띄운다.
+        self.workers = workers if workers else os.cpu_count() or 1
+        self.batch_size = batch_size # 워커에게 한 번에 넘기는 파일 수
+
+        # SPIMI 색인 설정. memory_budget(MB)을 주면 포스팅을 메모리 예산만큼만 모았다가
+        # 정렬된 run 파일로 내려쓰고, 마지막에 run들을 k-way merge 한다.
+        self.memory_budget = memory_budget
+        self.run_dir = os.path.join(self.output_dir, "spimi_runs")
+
+        # postings.bin 포맷. 기본은 d-gap + varint 압축 포맷, FORMAT_LEGACY면 예전 16바이트 고정 포맷.
+        self.postings_format = postings_format
+
+        # positions=True 이면 필드별 term 위치를 positions.bin에 따로 저장 (PHRASE 검색을 색인만으로 처리)
+        self.positions = positions
+        self.positions_file = os.path.join(self.output_dir, "positions.bin")
+
+        # stored_fields=True 이면 원문 필드를 블록 압축해서 docstore.bin에 저장 (스니펫/PHRASE 검증용, 색인 폴더만으로 검색 가능)
+        self.stored_fields = stored_fields
+        self.docstore_file = os.path.join(self.output_dir, "docstore.bin")
+
+        # term_dict / doc_table 저장 포맷. "binary"면 mmap 해서 쓰는 term_dict.bin / doc_table.bin,
+        # "json"이면 예전 term_dict.json / doc_table.json
+        if dict_format not in ("binary", "json"):
+            raise ValueError(f"Unknown dict format: {dict_format}")
+        self.dict_format = dict_format
+
+        # 형태소 분석 결과 캐시 (sqlite 파일 경로). 다시 색인할 때 내용이 그대로인 문서는 Komoran을 건너뛴다.
+        self.token_cache = os.path.abspath(token_cache) if token_cache else None
+        self.token_cache_max_bytes = token_cache_max_bytes
+
+        # 세그먼트 증분 색인(update_index)용. 같은 Indexer 안에서 업데이트와 백그라운드 merge가 manifest를 번갈아 고친다.
+        self.merge_factor = segments.MERGE_FACTOR
+        self.segment_lock = threading.Lock()
+        self.merge_lock = threading.Lock()
+
+    def term_entry(self, df, start, data, max_score, pos_start=None, pos_data=None):
+        # term_dict 한 항목. 압축 포맷은 term마다 바이트 길이가 달라서 "bytes"도 같이 저장한다.
+        # max_score: 이 term 하나가 어떤 문서에 줄 수 있는 BM25F 점수의 최댓값 (검색 때 MaxScore 가지치기용)
+        entry = {"df": df, "start": start, "length": df}
+        if self.postings_format != FORMAT_LEGACY:
+            entry["bytes"] = len(data)
+        entry["max_score"] = max_score
+        if self.positions: # positions.bin 안에서의 위치
+            entry["pos_start"] = pos_start
+            entry["pos_bytes"] = len(pos_data)
+        return entry
+
+    # 색인 파일은 전부 임시 파일(.tmp)에 쓰고 publish()에서 os.replace로 바꿔치기 한다.
+    # 검색 중인 Searcher가 mmap 한 파일을 'wb'로 열면 파일이 잘려서 Bus error로 죽기 때문 (바꿔치기 하면 예전 파일은 그대로 남아 있음)
+    def staging_path(self, path):
+        return path + STAGING_SUFFIX
+
+    def open_positions(self):
+        # positions를 안 쓰면 아무것도 안 쓰는 파일 객체(os.devnull)로 대신해서 쓰기 코드를 한 갈래로 유지
+        if self.positions:
+            return open(self.staging_path(self.positions_file), 'wb')
+        return open(os.devnull, 'wb')
+
+    def open_postings(self):
+        return open(self.staging_path(self.postings_file), 'wb')
+
+    def open_docstore(self):
+        if self.stored_fields:
+            return DocStoreWriter(self.staging_path(self.docstore_file))
+        return None
+
+    def open_term_dict_writer(self):
+        # 두 writer 모두 add(term, 항목) 으로 쓴다. 바이너리 사전은 term이 정렬된 순서로 들어와야 함.
+        if self.dict_format == "json":
+            return JsonStreamWriter(self.staging_path(self.term_dict_file), "dict")
+        flags = term_dict_format.FLAG_MAX_SCORE
+        if self.postings_format != FORMAT_LEGACY:
+            flags |= term_dict_format.FLAG_BYTES
+        if self.positions:
+            flags |= term_dict_format.FLAG_POSITIONS
+        return term_dict_format.TermDictWriter(self.staging_path(term_dict_format.binary_path(self.term_dict_file)), flags)
+
+    def open_doc_table_writer(self):
+        # 두 writer 모두 append(문서 항목) 으로 쓴다.
+        if self.dict_format == "json":
+            return JsonStreamWriter(self.staging_path(self.doc_table_file), "list")
+        return doc_table_format.DocTableWriter(self.staging_path(doc_table_format.binary_path(self.doc_table_file)))
+
+    def publish(self):
+        # 다 쓴 임시 파일들을 제자리로. 이번에 안 만든 파일(다른 사전 포맷, 끈 positions/docstore)은 예전 색인 것이라 지운다.
+        # postings.bin 수정 시각이 색인 generation이라 맨 마지막에 바꿔서, Searcher가 새 generation을 볼 때는 나머지 파일이 다 준비돼 있게 한다.
+        paths = [path for path in dict.fromkeys(self.index_files()) if path != self.postings_file] + [self.postings_file]
+        for path in paths:
+            if os.path.exists(self.staging_path(path)):
+                os.replace(self.staging_path(path), path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def store_document(self, docstore, analyzed):
+        if docstore is not None:
+            docstore.add(*analyzed["fields"])
+
+    def close_docstore(self, docstore):
+        if docstore is not None:
+            docstore.close()
+            print('docstore_file 완료')
+
+    def max_score(self, scorer, postings, df=None):
+        # 필드 제한이 없을 때의 점수가 가장 크다 (필드를 빼면 tilde_tf가 줄어들기만 함) -> 모든 쿼리에 대한 상한값
+        # df: 전체 색인 기준 df (샤드 색인). None이면 이 포스팅 길이
+        _, scores = scorer.score(postings, idf(scorer.N, len(postings) if df is None else df))
+        return float(scores.max()) if len(scores) else 0.0
+
+    def list_files(self):
+        # 색인 대상 json 파일 목록. os.walk 순서 그대로 -> doc_id 부여 순서가 항상 같음.
+        file_list = []
         for root, dirs, files in os.walk(self.data_dir): # .walk로 파일 위치 받아오기
-            for f in files: #f에는 파일 이름. 
+            for f in files: #f에는 파일 이름.
                 if not f.endswith('.json'):
                     print("not json")
                     continue
-                file_path = os.path.join(root, f) 
-                with open(file_path, encoding='utf8') as json_file: # 파일 열기
-                    try:
-                        data = json.load(json_file)
-                    except json.JSONDecodeError:
-                        print(f"Skipping malformed JSON file: {json_file.name}")
+                file_list.append((f, os.path.join(root, f)))
+        return file_list
+
+    def iter_documents(self, file_list=None):
+        # (doc_id, filename, file_path, analyzed) 를 doc_id 순서대로 돌려주는 제너레이터.
+        # 병렬 모드에서도 analyze_in_order가 입력 순서대로 결과를 돌려주기 때문에 doc_id는 직렬 빌드와 똑같이 부여된다.
+        # file_list를 주면 data_dir 전체 대신 그 파일들만 색인 (세그먼트 증분 색인용)
+        if file_list is None:
+            file_list = self.list_files()
+        doc_id = -1 # 파일의 id를 추적하기 위한 변수 생성
+
+        # 캐시 쓰기는 부모 프로세스 한 곳에서만 (워커는 읽기 전용으로 조회)
+        cache = TokenCache(self.token_cache, self.token_cache_max_bytes) if self.token_cache else None
+        analyze = partial(analyze_batch, positions=self.positions, stored_fields=self.stored_fields, token_cache=self.token_cache)
+
+        # 파일 batch_size개씩 묶어서 분석 (묶음마다 형태소 분석을 한 번에 부름)
+        batches = [file_list[i:i + self.batch_size] for i in range(0, len(file_list), self.batch_size)]
+        paths = ([file_path for _, file_path in batch] for batch in batches)
+        if self.workers > 1 and len(file_list) > 1:
+            # Komoran(JVM)은 fork 후에 쓸 수 없어서 spawn으로 워커를 새로 띄운다. (워커마다 Komoran 따로 생성)
+            ctx = multiprocessing.get_context("spawn")
+            pool = ctx.Pool(self.workers)
+            results = analyze_in_order(pool, analyze, paths, self.workers * BATCHES_IN_FLIGHT_PER_WORKER)
+        else:
+            pool = None
+            results = map(analyze, paths)
+
+        try:
+            # index.analyze = 다음 문서 분석 결과를 기다린 시간 (직렬이면 형태소 분석 시간, 병렬이면 워커 대기 시간)
+            for batch, analyzed_list in zip(batches, metrics.timed("index.analyze", results)):
+                metrics.count("files.opened", len(batch))
+                for (f, file_path), analyzed in zip(batch, analyzed_list):
+                    if analyzed is None:
                         continue
-                        
+                    metrics.count("index.docs")
+                    if cache is not None:
+                        cache.record(analyzed.pop("token_cache"))
                     doc_id += 1 # 성공적으로 읽은 경우에만 doc_id 증가
                     print(f"open file : {doc_id}")
+                    yield doc_id, f, file_path, analyzed
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if cache is not None:
+                close_readers()
+                cache.flush()
+                cache.evict()
+                cache.close()
+
+    def build_index(self, file_list=None):
+        self.clear_segments() # 전체 재색인이면 예전 세그먼트 / 샤드 색인은 지운다
+        shards.clear_shards(self.output_dir)
+        if self.memory_budget:
+            return self.build_index_spimi(file_list)
+        trace = metrics.begin("index", self.output_dir)
+
+        word_dic = {}
+        # max_score 계산에 필요한 필드 길이만 따로 모아둔다 (문서당 12바이트)
+        field_lengths = {"title": array('i'), "abstract": array('i'), "claims": array('i')}
+        doc_table_writer = self.open_doc_table_writer() # doc_table은 바로바로 파일에 쓰기
+        docstore = self.open_docstore()
+
+        for doc_id, f, file_path, analyzed in self.iter_documents(file_list):
+            self.store_document(docstore, analyzed)
+            for field, lengths in field_lengths.items():
+                lengths.append(analyzed["len_" + field])
+            # doc_table에 필드별 길이 저장
+            doc_table_writer.append({
+                "doc_id": doc_id,
+                "filename": f,
+                "path": file_path,
+                "len_title": analyzed["len_title"],
+                "len_abstract": analyzed["len_abstract"],
+                "len_claims": analyzed["len_claims"]
+            })
+
+            for txt, fields_tf in analyzed["txt_counts"].items():
+                entry = word_dic.get(txt)
+                if entry is None:
+                    entry = word_dic[txt] = {"posting_list": array('i'), "positions": []}
 
-                    # 필드별 텍스트 추출 (이미 리스트 형태임)
-                    title_txt = extract_terms(data['dataset'].get('invention_title',''))
-                    abstract_txt = extract_terms(data['dataset'].get('abstract',''))
-                    claims_txt = extract_terms(data['dataset'].get('claims',''))
-
-                    # doc_table에 필드별 길이 저장
-                    
-                    doc_table.append({
-                        "doc_id": doc_id,
-                        "filename": f,
-                        "path": file_path,
-                        "len_title": len(title_txt),
-                        "len_abstract": len(abstract_txt),
-                        "len_claims": len(claims_txt)
-                    })
-
-                    # 단어별, 필드별 빈도수 계산
-                    # txt_counts 구조: { "term": {"title": 0, "abstract": 0, "claims": 0} }
-                    txt_counts = {}
-                    
-                    for t in title_txt:
-                        if t not in txt_counts: txt_counts[t] = {"title": 0, "abstract": 0, "claims": 0}
-                        txt_counts[t]["title"] += 1
-                        
-                    for t in abstract_txt:
-                        if t not in txt_counts: txt_counts[t] = {"title": 0, "abstract": 0, "claims": 0}
-                        txt_counts[t]["abstract"] += 1
-                        
-                    for t in claims_txt:
-                        if t not in txt_counts: txt_counts[t] = {"title": 0, "abstract": 0, "claims": 0}
-                        txt_counts[t]["claims"] += 1
-
-                    for txt, fields_tf in txt_counts.items():
-                        if txt not in word_dic:
-                            word_dic[txt] = {"df": 0, "tf": 0, "posting_list": []}
-                        
-                        word_dic[txt]["df"] += 1
-                        # 전체 TF는 단순 합 (BM25F에서는 개별 필드 TF가 중요하지만, 통계용으로 합쳐둠)
-                        total_tf = fields_tf["title"] + fields_tf["abstract"] + fields_tf["claims"]
-                        word_dic[txt]["tf"] += total_tf
-                        
-                        # posting_list에 (doc_id, tf_title, tf_abstract, tf_claims) 저장
-                        word_dic[txt]["posting_list"].append((doc_id, fields_tf["title"], fields_tf["abstract"], fields_tf["claims"]))
-                    
-        for word_dic_txt,word_dic_value in word_dic.items():
-            term_postings[word_dic_txt] = word_dic_value["posting_list"]
-        
-        # postings.bin + term_dict.json 생성
-        term_dict = {}
-        offset = 0
-
-        with open(self.postings_file,'wb') as pbin:
-            for term, plist in term_postings.items():
-                start = offset
-                for doc_id, tf_title, tf_abstract, tf_claims in plist: # 필드별로 나눠야 함. 
-                    pbin.write(struct.pack("iiii", doc_id, tf_title, tf_abstract, tf_claims)) 
-                    offset += 16 # postings.bin에 16바이트씩 쓰기 4바이트 값 4개 -> 16바이트임.
-                term_dict[term] = {
-                    "df": len(plist),
-                    "start": start,
-                    "length": len(plist)
-                }
+                # posting_list에 (doc_id, tf_title, tf_abstract, tf_claims)를 int32로 이어붙여 저장
+                # (POSTING_DTYPE과 같은 배치라 쓸 때 변환 없이 NumPy view로 본다. 포스팅마다 tuple을 안 만듦)
+                entry["posting_list"].extend((doc_id, fields_tf["title"], fields_tf["abstract"], fields_tf["claims"]))
+                if self.positions:
+                    entry["positions"].append(analyzed["positions"][txt])
+
+        doc_table_writer.close()
+        print('doc_table_file 완료')
+        self.close_docstore(docstore)
+
+        # postings.bin + term_dict 생성
+        # json 사전은 예전처럼 처음 나온 순서, 바이너리 사전은 정렬된 순서로 쓴다.
+        terms = sorted(word_dic) if self.dict_format == "binary" else list(word_dic)
+        metrics.count("index.terms", len(terms))
+        scorer = BM25FScorer(field_lengths)
+        term_dict_writer = self.open_term_dict_writer()
+
+        with metrics.timer("index.write"), self.open_postings() as pbin, self.open_positions() as posbin:
+            offset = write_header(pbin, self.postings_format) # 포맷 헤더 (legacy는 0바이트)
+            pos_offset = 0
+            for term in terms:
+                postings = np.frombuffer(word_dic[term]["posting_list"], dtype=POSTING_DTYPE) # 인코딩 / max_score 계산에 같이 쓴다
+                data = encode_postings(postings, self.postings_format) # 필드별 TF까지 한 블록으로 인코딩
+                pbin.write(data)
+                pos_data = b"".join(word_dic[term]["positions"])
+                posbin.write(pos_data)
+                max_score = self.max_score(scorer, postings)
+                term_dict_writer.add(term, self.term_entry(len(postings), offset, data, max_score, pos_offset, pos_data))
+                offset += len(data)
+                pos_offset += len(pos_data)
+            metrics.count("postings.bytes_written", offset)
             print('postings_file 완료')
 
-        with open(self.term_dict_file,'w',encoding='utf8') as f: # term_dict 파일로 write하기
-            json.dump(term_dict, f, ensure_ascii=False,indent=4)
-            print('term_dict_file 완료')
-        
-        with open(self.doc_table_file,'w',encoding='utf8') as f:
-            json.dump(doc_table, f, ensure_ascii=False,indent=4)
-            print('doc_table_file 완료')
\ No newline at end of file
+        term_dict_writer.close()
+        print('term_dict_file 완료')
+        self.publish()
+        metrics.end(trace)
+
+
+    def build_index_spimi(self, file_list=None):
+        # Single-Pass In-Memory Indexing
+        # term -> bytearray(포스팅들) 로 메모리에서 바로 역색인을 만들다가 예산을 넘으면 run 파일로 flush.
+        trace = metrics.begin("index", self.output_dir)
+        budget_bytes = int(self.memory_budget * 1024 * 1024)
+        os.makedirs(self.run_dir, exist_ok=True)
+        run_paths = []
+        block = {}
+        block_bytes = 0
+        # max_score 계산에 필요한 필드 길이만 따로 모아둔다 (문서당 12바이트)
+        field_lengths = {"title": array('i'), "abstract": array('i'), "claims": array('i')}
+
+        doc_table_writer = self.open_doc_table_writer() # doc_table도 바로바로 파일에 쓰기
+        docstore = self.open_docstore()
+        for doc_id, f, file_path, analyzed in self.iter_documents(file_list):
+            self.store_document(docstore, analyzed)
+            for field, lengths in field_lengths.items():
+                lengths.append(analyzed["len_" + field])
+            doc_table_writer.append({
+                "doc_id": doc_id,
+                "filename": f,
+                "path": file_path,
+                "len_title": analyzed["len_title"],
+                "len_abstract": analyzed["len_abstract"],
+                "len_claims": analyzed["len_claims"]
+            })
+
+            for txt, fields_tf in analyzed["txt_counts"].items():
+                if txt not in block:
+                    block[txt] = (bytearray(), bytearray()) # (포스팅들, positions)
+                    block_bytes += TERM_OVERHEAD_BYTES
+                block[txt][0].extend(struct.pack("iiii", doc_id, fields_tf["title"], fields_tf["abstract"], fields_tf["claims"]))
+                block_bytes += POSTING_BYTES
+                if self.positions:
+                    pos_data = analyzed["positions"][txt]
+                    block[txt][1].extend(pos_data)
+                    block_bytes += len(pos_data)
+
+            if block_bytes >= budget_bytes: # 예산 초과 -> 정렬된 run으로 내려쓰고 메모리 비우기
+                run_path = os.path.join(self.run_dir, f"run_{len(run_paths):05d}.bin")
+                with metrics.timer("index.flush_run"):
+                    write_run(run_path, block)
+                run_paths.append(run_path)
+                print(f"flush run : {run_path}")
+                block = {}
+                block_bytes = 0
+        doc_table_writer.close()
+        print('doc_table_file 완료')
+        self.close_docstore(docstore)
+
+        # 마지막 블록은 디스크에 안 쓰고 바로 merge에 참여시킨다.
+        sources = [read_run(run_path) for run_path in run_paths]
+        sources.append((term, bytes(block[term][0]), bytes(block[term][1])) for term in sorted(block))
+
+        # k-way merge: heapq.merge는 같은 term이면 앞 run이 먼저 나오므로 doc_id 오름차순이 유지된다.
+        scorer = BM25FScorer(field_lengths)
+        term_dict_writer = self.open_term_dict_writer() # merge 결과는 term 정렬 순서라 바이너리 사전에 바로 쓸 수 있음
+        with metrics.timer("index.write"), self.open_postings() as pbin, self.open_positions() as posbin:
+            offset = write_header(pbin, self.postings_format)
+            pos_offset = 0
+            current_term = None
+            chunks = []
+            pos_chunks = []
+
+            def flush_term(): # 한 term의 run 조각들을 합쳐서 최종 포맷으로 인코딩
+                nonlocal offset, pos_offset
+                postings = np.frombuffer(b"".join(chunks), dtype=POSTING_DTYPE)
+                data = encode_postings(postings, self.postings_format)
+                pbin.write(data)
+                pos_data = b"".join(pos_chunks)
+                posbin.write(pos_data)
+                term_dict_writer.add(current_term, self.term_entry(len(postings), offset, data, self.max_score(scorer, postings), pos_offset, pos_data))
+                metrics.count("index.terms")
+                offset += len(data)
+                pos_offset += len(pos_data)
+
+            for term, data, pos_data in heapq.merge(*sources, key=lambda item: item[0]):
+                if term != current_term:
+                    if current_term is not None:
+                        flush_term()
+                    current_term = term
+                    chunks = []
+                    pos_chunks = []
+                chunks.append(data)
+                pos_chunks.append(pos_data)
+            if current_term is not None:
+                flush_term()
+            metrics.count("postings.bytes_written", offset)
+            print('postings_file 완료')
+        term_dict_writer.close()
+        print('term_dict_file 완료')
+        self.publish()
+
+        shutil.rmtree(self.run_dir, ignore_errors=True) # 중간 run 파일 정리
+        metrics.end(trace)
+
+    # ----- 샤드 색인 -----
+    # index_dir/shards.json + global_terms.bin + shard_XXX/ 폴더들. 자세한 구조는 src/shards.py 참고.
+
+    def build_shards(self, shard_count):
+        # 문서를 파일 순서대로 shard_count개 샤드에 돌아가며 나눠서 샤드마다 보통 색인을 만들고, 전체 통계를 모은다.
+        if self.dict_format != "binary":
+            raise ValueError("Sharded index needs binary dict format")
+        if shard_count < 1:
+            raise ValueError(f"Invalid shard count: {shard_count}")
+        trace = metrics.begin("index", self.output_dir)
+        previous = shards.load_manifest(self.output_dir)
+        generation = previous["generation"] + 1 if previous is not None else 0
+        self.clear_segments()
+        shards.clear_shards(self.output_dir)
+        for path in self.index_files(): # 예전 단일 색인 파일은 지운다
+            if os.path.exists(path):
+                os.remove(path)
+
+        file_list = self.list_files()
+        shard_indexers = []
+        for shard_idx in range(shard_count):
+            indexer = self.segment_indexer(shards.shard_name(shard_idx))
+            indexer.build_index(file_list[shard_idx::shard_count])
+            shard_indexers.append(indexer)
+        with metrics.timer("index.shard_stats"):
+            manifest = shards.finish_shards(self, shard_indexers, file_list, generation)
+        print(f"shards : {shard_count}개, 문서 {manifest['doc_count']}개")
+        metrics.end(trace)
+        return manifest
+
+    # ----- 세그먼트 증분 색인 -----
+    # index_dir/segments.json + seg_XXXXX/ 폴더들. 자세한 구조는 src/segments.py 참고.
+
+    def segment_indexer(self, name, positions=None, stored_fields=None):
+        # 세그먼트(샤드) 폴더 하나를 output_dir로 쓰는 Indexer (설정은 그대로)
+        return Indexer(self.data_dir, os.path.join(self.output_dir, name),
+                       os.path.basename(self.doc_table_file), os.path.basename(self.term_dict_file), os.path.basename(self.postings_file),
+                       workers=self.workers, batch_size=self.batch_size, memory_budget=self.memory_budget, postings_format=self.postings_format,
+                       positions=self.positions if positions is None else positions,
+                       stored_fields=self.stored_fields if stored_fields is None else stored_fields,
+                       dict_format=self.dict_format, token_cache=self.token_cache, token_cache_max_bytes=self.token_cache_max_bytes)
+
+    def open_segment(self, info, base=0):
+        return segments.Segment(self.output_dir, info, os.path.basename(self.doc_table_file), os.path.basename(self.term_dict_file), os.path.basename(self.postings_file), base)
+
+    def index_files(self):
+        # 한 번에 색인된 결과 파일 목록 (세그먼트로 옮기거나 지울 때)
+        return [self.doc_table_file, doc_table_format.binary_path(self.doc_table_file),
+                self.term_dict_file, term_dict_format.binary_path(self.term_dict_file),
+                self.postings_file, self.positions_file, self.docstore_file]
+
+    def clear_segments(self):
+        manifest = segments.load_manifest(self.output_dir)
+        if manifest is None:
+            return
+        os.remove(segments.manifest_path(self.output_dir))
+        if manifest.get("paths"):
+            os.remove(os.path.join(self.output_dir, manifest["paths"]))
+        for info in manifest["segments"]:
+            shutil.rmtree(os.path.join(self.output_dir, info["name"]), ignore_errors=True)
+
+    def init_segments(self):
+        # 처음 update_index 할 때 manifest 만들기.
+        # build_index로 만든 예전 단일 색인이 있으면 seg_00000으로 옮겨서 그대로 첫 세그먼트로 쓴다.
+        manifest = {"generation": 0, "updated_ns": 0, "next_segment": 0, "segments": []}
+        if os.path.exists(self.postings_file):
+            name = segments.segment_name(0)
+            os.makedirs(os.path.join(self.output_dir, name), exist_ok=True)
+            manifest["updated_ns"] = os.stat(self.postings_file).st_mtime_ns # 색인 이후에 바뀐 파일만 다시 색인
+            for path in self.index_files():
+                if os.path.exists(path):
+                    os.replace(path, os.path.join(self.output_dir, name, os.path.basename(path)))
+            info = {"name": name, "doc_count": 0, "deleted": None, "deleted_count": 0}
+            segment = self.open_segment(info)
+            info["doc_count"] = len(segment.doc_table)
+            segment.close()
+            manifest["segments"].append(info)
+            manifest["next_segment"] = 1
+        segments.save_manifest(self.output_dir, manifest)
+        return manifest
+
+    def segment_paths(self, manifest):
+        # 살아있는 문서의 path -> [세그먼트 이름, 세그먼트 내 doc_id, 크기, 수정 시각(ns)]
+        # (크기/수정 시각은 색인하기 전에 잰 값. 예전 paths 파일이나 세그먼트를 훑어서 만든 항목에는 없다)
+        # 보통은 manifest가 가리키는 paths 파일을 읽는다. 없으면 (예전 색인 / 첫 업데이트) 세그먼트를 한 번 전부 훑어서 만든다.
+        path_map = segments.read_paths(self.output_dir, manifest)
+        if path_map is not None:
+            return path_map
+        path_map = {}
+        for info in manifest["segments"]:
+            self.add_segment_paths(path_map, info)
+        return path_map
+
+    def add_segment_paths(self, path_map, info, stats=None):
+        # stats: path -> [크기, 수정 시각(ns)] (file_stats)
+        stats = stats or {}
+        segment = self.open_segment(info)
+        for local_id in np.flatnonzero(segment.live).tolist():
+            path = segment.doc_table[local_id]["path"]
+            path_map[path] = [info["name"], local_id] + stats.get(path, [])
+        segment.close()
+
+    def save_segments(self, manifest, path_map):
+        # paths 파일을 먼저 새로 쓰고 manifest가 가리키게 바꾼다. 지워도 되는 예전 paths 파일 경로를 돌려준다.
+        old_paths = manifest.get("paths")
+        manifest["paths"] = segments.write_paths(self.output_dir, path_map, manifest["generation"] + 1)
+        segments.save_manifest(self.output_dir, manifest)
+        return os.path.join(self.output_dir, old_paths) if old_paths and old_paths != manifest["paths"] else None
+
+    def file_stats(self, paths):
+        # path -> [크기, 수정 시각(ns)]. 사라진 파일은 빠진다.
+        stats = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats[path] = [st.st_size, st.st_mtime_ns]
+        return stats
+
+    def scan_changes(self, manifest, path_map):
+        # data_dir를 훑어서 새로 생기거나 바뀐 파일, 사라진 파일을 찾는다. (stat만 하고 내용은 안 읽음) -> (changed, deleted, stats)
+        # 색인할 때 잰 크기/수정 시각과 하나라도 다르면 바뀐 파일. 마지막 업데이트 시각과 비교하면
+        # cp -p / rsync -t / 압축 풀기처럼 예전 수정 시각을 그대로 가진 파일로 바꿔치기 한 경우를 놓친다.
+        stats = self.file_stats(file_path for f, file_path in self.list_files())
+        changed = []
+        for file_path, stat in stats.items():
+            entry = path_map.get(file_path)
+            if entry is None:
+                changed.append(file_path)
+            elif len(entry) > 2:
+                if entry[2:] != stat:
+                    changed.append(file_path)
+            elif stat[1] > manifest["updated_ns"]: # 크기/수정 시각이 없는 예전 항목은 업데이트 시각으로
+                changed.append(file_path)
+            else: # 그 뒤로 안 바뀐 파일이라 지금 잰 값을 적어 두고 다음부터 비교
+                entry.extend(stat)
+        deleted = [path for path in path_map if path not in stats]
+        return changed, deleted, stats
+
+    def update_index(self, changed_files=None, deleted_files=None, background_merge=True):
+        # 증분 색인. 바뀐 파일만 새 세그먼트로 색인하고, 예전 버전/삭제된 파일은 tombstone(deletes 파일)으로 표시한다.
+        # changed_files / deleted_files를 안 주면 data_dir를 스캔해서 찾는다.
+        # background_merge=True 이면 merge 스레드를 띄워서 돌려준다. (필요하면 join)
+        if shards.load_manifest(self.output_dir) is not None:
+            raise ValueError("update_index does not support sharded index (rebuild with build_shards)")
+        trace = metrics.begin("update", self.output_dir) # 안에서 부르는 build_index의 단계들도 여기로 합쳐진다
+        with self.segment_lock:
+            manifest = segments.load_manifest(self.output_dir)
+            if manifest is None:
+                manifest = self.init_segments()
+            scan_ns = time.time_ns()
+            path_map = self.segment_paths(manifest)
+            if changed_files is None and deleted_files is None:
+                changed, deleted, stats = self.scan_changes(manifest, path_map)
+            else:
+                changed = [os.path.abspath(path) for path in changed_files or []]
+                deleted = [os.path.abspath(path) for path in deleted_files or []]
+                stats = self.file_stats(changed) # 색인하기 전에 잰다 (색인 중에 또 바뀌면 다음 scan이 찾음)
+            print(f"update : 변경 {len(changed)}개, 삭제 {len(deleted)}개")
+
+            # 바뀐 파일의 예전 버전 + 삭제된 파일 -> 세그먼트별 tombstone
+            new_deletes = {}
+            for path in changed + deleted:
+                if path in path_map:
+                    name, local_id = path_map.pop(path)[:2]
+                    new_deletes.setdefault(name, []).append(local_id)
+
+            # 바뀐 파일만 새 세그먼트로 색인 (비용이 전체 문서 수가 아니라 변경량에 비례)
+            if changed:
+                info = self.new_segment(manifest)
+                self.segment_indexer(info["name"]).build_index([(os.path.basename(path), path) for path in changed])
+                segment = self.open_segment(info)
+                info["doc_count"] = len(segment.doc_table)
+                segment.close()
+                if info["doc_count"]:
+                    manifest["segments"].append(info)
+                    self.add_segment_paths(path_map, info, stats) # 새 세그먼트 문서만 추가 (변경량에 비례)
+                else: # 전부 읽기 실패한 경우
+                    shutil.rmtree(os.path.join(self.output_dir, info["name"]), ignore_errors=True)
+
+            old_files = self.apply_deletes(manifest, new_deletes)
+            manifest["updated_ns"] = scan_ns
+            old_files.append(self.save_segments(manifest, path_map))
+            for path in old_files: # 새 manifest가 안 가리키는 예전 tombstone / paths 파일 정리
+                if path is not None:
+                    os.remove(path)
+            print(f"update 완료 : generation {manifest['generation']}, 세그먼트 {len(manifest['segments'])}개")
+        metrics.end(trace)
+
+        if background_merge:
+            thread = threading.Thread(target=self.merge_segments)
+            thread.start()
+            return thread
+
+    def new_segment(self, manifest):
+        info = {"name": segments.segment_name(manifest["next_segment"]), "doc_count": 0, "deleted": None, "deleted_count": 0}
+        manifest["next_segment"] += 1
+        return info
+
+    def apply_deletes(self, manifest, new_deletes):
+        # new_deletes: 세그먼트 이름 -> 새로 지울 세그먼트 내 doc_id들. 지워도 되는 예전 tombstone 파일 목록을 돌려준다.
+        old_files = []
+        for info in manifest["segments"]:
+            if info["name"] not in new_deletes:
+                continue
+            segment_dir = os.path.join(self.output_dir, info["name"])
+            deleted = np.union1d(segments.read_deletes(segment_dir, info), new_deletes[info["name"]])
+            if info["deleted"]:
+                old_files.append(os.path.join(segment_dir, info["deleted"]))
+            info["deleted"] = segments.write_deletes(segment_dir, deleted, manifest["generation"] + 1)
+            info["deleted_count"] = len(deleted)
+        return old_files
+
+    def merge_segments(self):
+        # 백그라운드 merge. merge 정책(segments.find_merge)이 고른 세그먼트들을 하나로 합치고 manifest를 바꿔치기 한다.
+        # 합치는 동안(락 밖) 업데이트가 들어와도 되고, 그 사이에 생긴 삭제는 커밋할 때 새 세그먼트로 옮겨준다.
+        if not self.merge_lock.acquire(blocking=False): # 이미 merge 중이면 그 스레드가 이어서 처리
+            return
+        try:
+            while True:
+                with self.segment_lock:
+                    manifest = segments.load_manifest(self.output_dir)
+                    group = segments.find_merge(manifest["segments"], self.merge_factor) if manifest else []
+                    if not group:
+                        return
+                    info = self.new_segment(manifest)
+                    segments.save_manifest(self.output_dir, manifest) # 새 세그먼트 이름 예약
+
+                print(f"merge : {[g['name'] for g in group]} -> {info['name']}")
+                opened = [self.open_segment(g) for g in group]
+                try:
+                    merger = self.segment_indexer(info["name"], positions=all(s.positions is not None for s in opened),
+                                                  stored_fields=all(s.docstore is not None for s in opened))
+                    with metrics.timer("index.segment_merge"):
+                        remaps, info["doc_count"] = segments.write_merged_segment(merger, opened)
+                except Exception:
+                    shutil.rmtree(os.path.join(self.output_dir, info["name"]), ignore_errors=True) # 쓰다 만 세그먼트 정리
+                    raise
+                finally:
+                    for segment in opened:
+                        segment.close()
+
+                with self.segment_lock:
+                    manifest = segments.load_manifest(self.output_dir)
+                    current = {g["name"]: g for g in manifest["segments"]}
+                    # merge 하는 동안 새로 지워진 문서를 새 세그먼트 doc_id로 옮긴다
+                    moved = []
+                    for g, remap in zip(group, remaps):
+                        segment_dir = os.path.join(self.output_dir, g["name"])
+                        newly = np.setdiff1d(segments.read_deletes(segment_dir, current[g["name"]]), segments.read_deletes(segment_dir, g))
+                        moved.extend(remap[newly][remap[newly] >= 0].tolist())
+                    names = [g["name"] for g in group]
+                    position = min(i for i, g in enumerate(manifest["segments"]) if g["name"] in names)
+                    manifest["segments"] = [g for g in manifest["segments"] if g["name"] not in names]
+                    if info["doc_count"]:
+                        manifest["segments"].insert(position, info)
+                        self.apply_deletes(manifest, {info["name"]: moved} if moved else {})
+                    else: # 전부 삭제된 문서였으면 세그먼트 자체가 사라진다
+                        shutil.rmtree(os.path.join(self.output_dir, info["name"]), ignore_errors=True)
+                    # 합쳐진 세그먼트의 문서는 새 세그먼트 doc_id로 (merge 중에 지워진 문서는 update 때 이미 빠져 있음)
+                    path_map = self.segment_paths(manifest)
+                    remap_of = dict(zip(names, remaps))
+                    for entry in path_map.values():
+                        if entry[0] in remap_of: # 크기/수정 시각은 그대로
+                            entry[:2] = [info["name"], int(remap_of[entry[0]][entry[1]])]
+                    old_paths = self.save_segments(manifest, path_map)
+                if old_paths is not None:
+                    os.remove(old_paths)
+                for name in names: # 열려 있는 Searcher는 mmap으로 예전 파일을 계속 볼 수 있다
+                    shutil.rmtree(os.path.join(self.output_dir, name), ignore_errors=True)
+                print(f"merge 완료 : generation {manifest['generation']}, 세그먼트 {len(manifest['segments'])}개")
+        finally:
+            self.merge_lock.release()
@@ -0,0 +1,201 @@
+# src/metrics.py
+# 단계별 계측 (타이머 / 카운터 / 히스토그램 / 느린 검색어 로그)
+#
+# 프로세스마다 전역 metrics 객체 하나를 쓴다. 기본은 꺼져 있고 enable()을 불러야 기록한다.
+# 꺼져 있을 때는 timer()가 아무것도 안 하는 공용 객체를 돌려주고 count()는 바로 return 해서 비용이 거의 없다.
+#
+#   with metrics.timer("query.postings"):   # 단계 시간 -> 히스토그램 (ms)
+#       ...
+#   metrics.count("postings.bytes_read", n) # 누적 카운터
+#
+#   trace = metrics.begin("query", 검색어)  # 검색어 하나 / 색인 한 번의 단계별 breakdown
+#   ...
+#   metrics.end(trace)                     # "<kind>.total" 히스토그램 + (느리면) slow query log
+#
+# 단계 이름
+#   query.tokenize / query.postings / query.intersect / query.phrase / query.score / query.snippets / query.total
+#   index.analyze / index.flush_run / index.write / index.total / update.total / index.segment_merge
+# 카운터 이름
+#   postings.bytes_read / postings.decoded / scorer.postings_scored / docstore.blocks_read / files.opened
+#   index.docs / index.terms / postings.bytes_written
+import json
+import time
+import bisect
+import threading
+
+# 히스토그램 버킷 상한 (ms). 마지막 버킷은 그보다 큰 값 전부
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BUCKETS_MS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # 버킷 상한으로 근사한 분위수 (실제 최댓값보다 크게는 안 나오게)
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {"count": self.count, "sum_ms": self.sum, "mean_ms": self.sum / self.count if self.count else 0.0,
+                "p50_ms": self.quantile(0.5), "p95_ms": self.quantile(0.95), "p99_ms": self.quantile(0.99), "max_ms": self.max,
+                "buckets": {("+Inf" if i == len(BUCKETS_MS) else str(BUCKETS_MS[i])): n for i, n in enumerate(self.buckets) if n}}
+
+
+class NullTimer:
+    # 계측이 꺼져 있을 때 timer()가 돌려주는 객체 (아무것도 안 함)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_ms = None
+        self.slow_query_log = None
+        self.lock = threading.Lock() # 백그라운드 merge 스레드도 기록함
+        self.local = threading.local() # 스레드별 진행 중인 trace
+        self.reset()
+
+    def enable(self, slow_query_ms=None, slow_query_log=None):
+        # slow_query_ms를 주면 그보다 오래 걸린 검색어의 단계별 breakdown을 slow_query_log(JSON lines)에 남긴다.
+        self.enabled = True
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log = slow_query_log
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.slow_queries = 0
+
+    def timer(self, stage):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, stage)
+
+    def timed(self, stage, iterable):
+        # iterable에서 다음 값을 꺼내는 데 걸린 시간을 stage로 기록 (제너레이터 / 병렬 색인 워커 결과 대기 시간)
+        if not self.enabled:
+            return iterable
+        return self.iter_timed(stage, iter(iterable))
+
+    def iter_timed(self, stage, iterator):
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.observe(stage, (time.perf_counter() - start) * 1000)
+            yield item
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace["counters"][name] = trace["counters"].get(name, 0) + n
+
+    def observe(self, stage, ms):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(ms)
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace["stages"][stage] = trace["stages"].get(stage, 0.0) + ms
+
+    def begin(self, kind, label):
+        # 이미 진행 중인 trace가 있으면 (ex. update_index 안의 build_index) 바깥 trace에 합쳐지도록 None
+        if not self.enabled or getattr(self.local, "trace", None) is not None:
+            return None
+        trace = {"kind": kind, "label": label, "stages": {}, "counters": {}, "start": time.perf_counter()}
+        self.local.trace = trace
+        return trace
+
+    def end(self, trace):
+        if trace is None:
+            return None
+        self.local.trace = None
+        total_ms = (time.perf_counter() - trace.pop("start")) * 1000
+        self.observe(f"{trace['kind']}.total", total_ms)
+        trace["total_ms"] = total_ms
+        if trace["kind"] == "query" and self.slow_query_ms is not None and total_ms >= self.slow_query_ms:
+            self.log_slow_query(trace)
+        return trace
+
+    def log_slow_query(self, trace):
+        with self.lock:
+            self.slow_queries += 1
+        if self.slow_query_log:
+            record = dict(trace, time=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            with self.lock, open(self.slow_query_log, 'a', encoding='utf8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def snapshot(self):
+        with self.lock:
+            return {"enabled": self.enabled, "counters": dict(self.counters), "slow_queries": self.slow_queries,
+                    "histograms": {stage: histogram.snapshot() for stage, histogram in sorted(self.histograms.items())}}
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=4)
+
+    def report(self):
+        # 사람이 읽을 요약 (CLI 종료 시 출력용)
+        snapshot = self.snapshot()
+        lines = []
+        for stage, stats in snapshot["histograms"].items():
+            lines.append(f"{stage:<22} {stats['count']:>7}회  평균 {stats['mean_ms']:8.3f}ms  p50 {stats['p50_ms']:8.3f}ms  p95 {stats['p95_ms']:8.3f}ms  p99 {stats['p99_ms']:8.3f}ms")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name:<22} {value}")
+        return lines
+
+
+metrics = Metrics()
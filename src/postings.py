@@ -0,0 +1,349 @@
+# src/postings.py
+# postings.bin 파일 포맷 (인코딩/디코딩)
+#
+# legacy 포맷 : 헤더 없음. 포스팅 하나 = struct.pack("iiii", doc_id, tf_title, tf_abstract, tf_claims) 16바이트
+# varint 포맷 : [헤더 8바이트] + term별 압축 블록
+#   헤더   = b"TRSP" + version(1바이트) + codec(1바이트) + 예약(2바이트)
+#   블록   = [doc_id d-gap들][tf_title들][tf_abstract들][tf_claims들] 을 모두 variable-byte(varint)로 저장
+#            doc_id는 오름차순이라 앞 문서와의 차이(d-gap)만 저장하고, TF는 대부분 0/1이라 1바이트로 끝난다.
+#   version 2 : df가 SKIP_INTERVAL보다 큰 term은 포스팅을 SKIP_INTERVAL개씩 잘라 블록마다 위 모양으로 따로 인코딩하고,
+#               앞에 skip 테이블 [(블록 마지막 doc_id, 블록 끝 offset) uint32 쌍 x 블록 수]을 둔다.
+#               블록 첫 d-gap은 앞 블록 마지막 doc_id 기준. -> AND 교집합에서 후보 문서가 있는 블록만 골라 디코딩 (PostingsReader.probe)
+#               (df가 작은 term과 version 1 파일은 예전처럼 블록 하나)
+#
+# 읽기는 PostingsReader가 담당한다. postings.bin을 mmap 해서 term별 포스팅을 NumPy structured array로 돌려줌.
+#
+# positions.bin (선택) : term별로 포스팅 순서대로, 포스팅마다 [title 위치들][abstract 위치들][claims 위치들]
+#   위치 = 필드 형태소 분석 결과(버린 토큰 포함)에서의 순번 (tokenizer.select_positions). 필드 안에서 앞 위치와의 차이를 varint로 저장.
+#   필드별 위치 개수는 포스팅의 tf_title / tf_abstract / tf_claims 와 같아서 따로 저장하지 않는다.
+import os
+import mmap
+import struct
+import numpy as np
+from .metrics import metrics
+
+MAGIC = b"TRSP"
+VERSION = 2
+HEADER_SIZE = 8
+SKIP_VERSION = 2 # skip 테이블이 생긴 버전
+
+CODEC_VARINT = 1
+
+FORMAT_LEGACY = "legacy"
+FORMAT_VARINT = "varint"
+CODECS = {FORMAT_VARINT: CODEC_VARINT}
+
+LEGACY_POSTING_SIZE = 16 # "iiii" 4바이트 값 4개
+
+SKIP_INTERVAL = 128 # skip 블록 하나의 포스팅 수
+SKIP_DTYPE = np.dtype([("last_doc", "<u4"), ("end", "<u4")]) # skip 테이블 항목 (end = 테이블 뒤 블록 영역 기준 끝 offset)
+VECTOR_ENCODE_MIN = 256 # 포스팅이 이만큼 이상이면 varint 인코딩을 NumPy로 한 번에 (적으면 파이썬 루프가 더 빠름)
+SKIP_FULL_DECODE = 0.5 # probe할 블록이 이 비율보다 많으면 그냥 전체를 디코딩
+
+# 포스팅 하나의 NumPy 타입. legacy 포맷의 struct "iiii"와 메모리 배치가 같아서 파일을 그대로 view로 볼 수 있다.
+POSTING_DTYPE = np.dtype([("doc_id", "i4"), ("tf_title", "i4"), ("tf_abstract", "i4"), ("tf_claims", "i4")])
+
+
+def write_header(f, postings_format):
+    # legacy 포맷은 헤더 없이 예전 그대로 쓴다. 헤더 크기(=첫 term의 시작 offset)를 돌려줌.
+    if postings_format == FORMAT_LEGACY:
+        return 0
+    if postings_format not in CODECS:
+        raise ValueError(f"Unknown postings format: {postings_format}")
+    f.write(MAGIC + struct.pack("<BBH", VERSION, CODECS[postings_format], 0))
+    return HEADER_SIZE
+
+
+def read_header(f):
+    # postings.bin 앞부분을 보고 (포맷, 버전) 판별. (legacy 파일은 첫 4바이트가 doc_id 0 이라 MAGIC과 겹치지 않음)
+    f.seek(0)
+    head = f.read(HEADER_SIZE)
+    if len(head) < HEADER_SIZE or head[:4] != MAGIC:
+        return FORMAT_LEGACY, 0
+    version, codec, _ = struct.unpack("<BBH", head[4:])
+    if version > VERSION:
+        raise ValueError(f"Unsupported postings version: {version}")
+    for name, value in CODECS.items():
+        if value == codec:
+            return name, version
+    raise ValueError(f"Unknown postings codec: {codec}")
+
+
+def encode_varint(value, out):
+    # 7비트씩 잘라서 앞 바이트들은 최상위 비트(continuation bit)를 1로 표시
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data):
+    # varint 바이트 배열(np.uint8)을 파이썬 루프 없이 한 번에 디코딩
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if data.max() < 0x80: # 모든 값이 1바이트 (TF 0/1, 작은 d-gap) -> 그대로 변환
+        return data.astype(np.int64)
+    ends = data < 0x80 # 각 값의 마지막 바이트
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1]))) # 각 값의 첫 바이트 위치
+    group = np.concatenate(([0], np.cumsum(ends[:-1]))) # 바이트가 몇 번째 값에 속하는지
+    shift = (np.arange(len(data)) - starts[group]) * 7
+    return np.add.reduceat((data & 0x7F).astype(np.int64) << shift, starts)
+
+
+def encode_varints(values):
+    # 0 이상 정수 배열 -> (varint 바이트 배열, 값마다 바이트 수). encode_varint를 값마다 부른 것과 같은 bytes
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    top = int(values.max()) if len(values) else 0
+    for shift in range(7, 64, 7):
+        if top < (1 << shift):
+            break
+        sizes += values >= (1 << shift)
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    pos = np.cumsum(sizes) - sizes # 값마다 첫 바이트 위치
+    for i in range(int(sizes.max()) if len(values) else 0):
+        rest = sizes > i
+        byte = (values[rest] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        out[pos[rest] + i] = byte | ((sizes[rest] > i + 1).astype(np.uint64) << np.uint64(7)) # 마지막 바이트가 아니면 continuation bit
+    return out, sizes
+
+
+def encode_postings(plist, postings_format):
+    # plist: POSTING_DTYPE 배열 또는 [(doc_id, tf_title, tf_abstract, tf_claims), ...] (doc_id 오름차순)
+    postings = np.asarray(plist, dtype=POSTING_DTYPE)
+    if postings_format == FORMAT_LEGACY: # struct "iiii"와 같은 배치
+        return postings.tobytes()
+    if len(postings) < VECTOR_ENCODE_MIN: # 짧은 리스트는 NumPy 호출 비용이 더 커서 파이썬 루프로
+        return encode_blocks(postings.tolist())
+
+    # 블록마다 [doc_id d-gap들][title TF들][abstract TF들][claims TF들] (d-gap의 prev = 앞 블록의 마지막 doc_id)
+    # -> 값 배열을 (블록, 필드, 블록 안 순번) 순서로 한 번에 늘어놓고 varint 인코딩
+    n = len(postings)
+    doc_ids = postings["doc_id"].astype(np.int64)
+    columns = np.stack((np.diff(doc_ids, prepend=0), postings["tf_title"], postings["tf_abstract"], postings["tf_claims"]), axis=1)
+    full = n // SKIP_INTERVAL * SKIP_INTERVAL
+    values = np.concatenate((columns[:full].reshape(-1, SKIP_INTERVAL, 4).transpose(0, 2, 1).ravel(), columns[full:].T.ravel()))
+    data, sizes = encode_varints(values)
+    if n <= SKIP_INTERVAL:
+        return data.tobytes()
+
+    # skip 테이블: 블록마다 (마지막 doc_id, 블록 영역 기준 끝 offset)
+    block_ends = np.minimum(np.arange(SKIP_INTERVAL, n + SKIP_INTERVAL, SKIP_INTERVAL), n)
+    skips = np.empty(len(block_ends), dtype=SKIP_DTYPE)
+    skips["last_doc"] = doc_ids[block_ends - 1]
+    skips["end"] = np.cumsum(sizes)[block_ends * 4 - 1]
+    return skips.tobytes() + data.tobytes()
+
+
+def encode_blocks(plist):
+    # encode_postings의 파이썬 루프 버전 (plist = 튜플 리스트)
+    if len(plist) <= SKIP_INTERVAL:
+        return encode_block(plist, 0)
+
+    skips = bytearray()
+    blocks = []
+    prev = 0
+    end = 0
+    for i in range(0, len(plist), SKIP_INTERVAL): # SKIP_INTERVAL개씩 블록 + skip 테이블
+        block = encode_block(plist[i:i + SKIP_INTERVAL], prev)
+        prev = plist[min(i + SKIP_INTERVAL, len(plist)) - 1][0]
+        end += len(block)
+        skips += struct.pack("<II", prev, end)
+        blocks.append(block)
+    return bytes(skips) + b"".join(blocks)
+
+
+def encode_block(plist, prev):
+    out = bytearray()
+    for posting in plist: # doc_id d-gap (prev = 앞 블록의 마지막 doc_id)
+        encode_varint(posting[0] - prev, out)
+        prev = posting[0]
+    for field in (1, 2, 3): # 필드별 TF를 모아서 저장 (title들, abstract들, claims들)
+        for posting in plist:
+            encode_varint(posting[field], out)
+    return bytes(out)
+
+
+def encode_positions(field_positions):
+    # field_positions: (title 위치 리스트, abstract 위치 리스트, claims 위치 리스트) -> 포스팅 하나의 positions bytes
+    out = bytearray()
+    for positions in field_positions:
+        prev = 0
+        for pos in positions:
+            encode_varint(pos - prev, out)
+            prev = pos
+    return bytes(out)
+
+
+def has_skips(df, version):
+    return version >= SKIP_VERSION and df > SKIP_INTERVAL
+
+
+def block_count(df):
+    return (df + SKIP_INTERVAL - 1) // SKIP_INTERVAL
+
+
+def decode_postings(data, df, postings_format, version=VERSION):
+    # data: term 블록의 np.uint8 배열 -> POSTING_DTYPE 배열
+    if postings_format == FORMAT_LEGACY:
+        return np.frombuffer(data, dtype=POSTING_DTYPE, count=df)
+    if has_skips(df, version):
+        return decode_blocks(data, df, np.arange(block_count(df)))
+
+    values = decode_varints(data)
+    if len(values) != df * 4:
+        raise ValueError(f"Corrupted postings block: expected {df * 4} values, got {len(values)}")
+    postings = np.empty(df, dtype=POSTING_DTYPE)
+    postings["doc_id"] = np.cumsum(values[:df]) # d-gap -> doc_id
+    postings["tf_title"] = values[df:2 * df]
+    postings["tf_abstract"] = values[2 * df:3 * df]
+    postings["tf_claims"] = values[3 * df:]
+    return postings
+
+
+def decode_blocks(data, df, blocks):
+    # skip 테이블이 있는 term 블록에서 blocks(오름차순 블록 번호)만 디코딩 -> POSTING_DTYPE 배열
+    n_blocks = block_count(df)
+    table_size = n_blocks * SKIP_DTYPE.itemsize
+    skips = data[:table_size].view(SKIP_DTYPE)
+    body = data[table_size:]
+    ends = skips["end"].astype(np.int64)
+    starts = np.concatenate(([0], ends[:-1]))
+    if len(blocks) == n_blocks: # 전체
+        values = decode_varints(body)
+    else:
+        values = decode_varints(np.concatenate([body[starts[b]:ends[b]] for b in blocks.tolist()]))
+
+    rest = df - (n_blocks - 1) * SKIP_INTERVAL # 마지막 블록의 포스팅 수 (나머지 블록은 SKIP_INTERVAL개)
+    short = rest if blocks[-1] == n_blocks - 1 else 0
+    full = len(blocks) - (1 if short else 0)
+    if len(values) != (full * SKIP_INTERVAL + short) * 4:
+        raise ValueError(f"Corrupted postings block: expected {(full * SKIP_INTERVAL + short) * 4} values, got {len(values)}")
+    # 블록마다 [d-gap들][tf_title들][tf_abstract들][tf_claims들] -> (블록, 4, 포스팅) 모양으로 보고 필드 열에 바로 복사 (중간 배열 X)
+    head = values[:full * SKIP_INTERVAL * 4].reshape(full, 4, SKIP_INTERVAL)
+    tail = values[full * SKIP_INTERVAL * 4:].reshape(4, short)
+    postings = np.empty(full * SKIP_INTERVAL + short, dtype=POSTING_DTYPE)
+    for i, field in enumerate(POSTING_DTYPE.names):
+        postings[field][:full * SKIP_INTERVAL].reshape(full, SKIP_INTERVAL)[:] = head[:, i]
+        postings[field][full * SKIP_INTERVAL:] = tail[i]
+
+    doc_ids = postings["doc_id"]
+    gaps = doc_ids[::SKIP_INTERVAL].copy() # 고른 블록들의 첫 d-gap
+    np.cumsum(doc_ids, out=doc_ids) # 블록 첫 d-gap은 앞 블록의 마지막 doc_id 기준이라 처음부터 이어서 누적하면 그대로 doc_id
+    if len(blocks) < n_blocks: # 중간 블록을 건너뛰었으면 블록마다 앞 블록의 마지막 doc_id로 기준을 다시 맞춘다
+        counts = np.full(len(blocks), SKIP_INTERVAL)
+        counts[-1] = short or SKIP_INTERVAL
+        bases = np.concatenate(([0], skips["last_doc"].astype(np.int64)))[blocks]
+        doc_ids += np.repeat(bases - (doc_ids[::SKIP_INTERVAL] - gaps), counts).astype(doc_ids.dtype)
+    return postings
+
+
+def select_postings(postings, doc_ids):
+    # 정렬된 포스팅 리스트에서 doc_ids(정렬됨)에 해당하는 포스팅만 이진 탐색으로 골라낸다.
+    if not len(postings) or not len(doc_ids):
+        return postings[:0]
+    pos = np.minimum(np.searchsorted(postings["doc_id"], doc_ids), len(postings) - 1)
+    return postings[pos[postings["doc_id"][pos] == doc_ids]]
+
+
+class MappedFile:
+    # 읽기 전용 mmap + np.uint8 view. (빈 파일은 mmap이 안 돼서 빈 배열로 대신함)
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'rb')
+        if os.path.getsize(path) > 0:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mm = None # 빈 파일은 mmap 불가
+        self.buf = np.frombuffer(self.mm, dtype=np.uint8) if self.mm is not None else np.zeros(0, dtype=np.uint8)
+
+    def slice(self, start, size):
+        if start + size > len(self.buf):
+            raise ValueError(f"Incomplete data read at offset {start}")
+        return self.buf[start:start + size]
+
+    def close(self):
+        self.buf = None # mmap을 닫기 전에 view 참조부터 끊어야 함
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError: # 밖에서 아직 포스팅 view를 들고 있으면 GC 때 닫히도록 둔다
+                pass
+            self.mm = None
+        self.f.close()
+
+
+class PostingsReader(MappedFile):
+    # postings.bin을 mmap 해서 읽는 reader.
+    # - legacy 포맷은 파일 내용을 그대로 structured array view로 돌려준다. (복사 X, 포스팅마다 파이썬 객체 X)
+    # - varint 포맷은 term 블록 bytes만 view로 잘라서 NumPy로 한 번에 디코딩한다.
+    # 읽기 전용 mmap이라 여러 검색 프로세스가 OS page cache에 올라간 같은 파일을 공유한다.
+    def __init__(self, path):
+        super().__init__(path)
+        self.postings_format, self.version = read_header(self.f)
+
+    def read(self, entry):
+        df = entry["df"]
+        size = entry["bytes"] if self.postings_format != FORMAT_LEGACY else df * LEGACY_POSTING_SIZE
+        metrics.count("postings.bytes_read", size)
+        metrics.count("postings.decoded", df)
+        return decode_postings(self.slice(entry["start"], size), df, self.postings_format, self.version)
+
+    def probe(self, entry, doc_ids):
+        # doc_ids(정렬됨) 중 이 term이 나오는 문서의 포스팅만 돌려준다. (AND 교집합용)
+        # legacy는 mmap view에서 바로 이진 탐색, skip 테이블이 있으면 doc_ids가 걸리는 블록만 디코딩한다.
+        df = entry["df"]
+        if self.postings_format == FORMAT_LEGACY:
+            return select_postings(decode_postings(self.slice(entry["start"], df * LEGACY_POSTING_SIZE), df, FORMAT_LEGACY), doc_ids)
+        if not has_skips(df, self.version) or not len(doc_ids):
+            return select_postings(self.read(entry), doc_ids)
+
+        data = self.slice(entry["start"], entry["bytes"])
+        n_blocks = block_count(df)
+        skips = data[:n_blocks * SKIP_DTYPE.itemsize].view(SKIP_DTYPE)
+        blocks = np.unique(np.searchsorted(skips["last_doc"], doc_ids)) # doc이 들어 있을 수 있는 블록 = last_doc >= doc인 첫 블록
+        blocks = blocks[blocks < n_blocks]
+        if not len(blocks):
+            return np.zeros(0, dtype=POSTING_DTYPE)
+        if len(blocks) > n_blocks * SKIP_FULL_DECODE:
+            return select_postings(self.read(entry), doc_ids)
+        postings = decode_blocks(data, df, blocks)
+        ends = skips["end"].astype(np.int64)
+        starts = np.concatenate(([0], ends[:-1]))
+        metrics.count("postings.bytes_read", int((ends[blocks] - starts[blocks]).sum()) + len(skips) * SKIP_DTYPE.itemsize)
+        metrics.count("postings.decoded", len(postings))
+        return select_postings(postings, doc_ids)
+
+
+class PositionsReader(MappedFile):
+    # positions.bin reader. term 하나의 위치 블록을 통째로 디코딩해 두고 (문서, 필드)별 위치를 잘라서 준다.
+    def read(self, entry, postings):
+        return TermPositions(decode_varints(self.slice(entry["pos_start"], entry["pos_bytes"])), postings)
+
+
+class TermPositions:
+    def __init__(self, values, postings):
+        self.values = values # 필드 안에서 delta 인코딩된 위치들 (포스팅 순서대로 이어붙인 것)
+        self.postings = postings
+        counts = postings["tf_title"].astype(np.int64) + postings["tf_abstract"] + postings["tf_claims"]
+        self.starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+
+    def get(self, posting_idx, field):
+        # posting_idx번째 포스팅(문서)의 field 위치 배열 (오름차순, 절대 위치)
+        posting = self.postings[posting_idx]
+        offset = self.starts[posting_idx]
+        if field in ("abstract", "claims"):
+            offset += posting["tf_title"]
+        if field == "claims":
+            offset += posting["tf_abstract"]
+        return np.cumsum(self.values[offset:offset + posting["tf_" + field]])
+
+    def encoded(self, posting_idx):
+        # posting_idx번째 포스팅의 positions bytes (세그먼트 merge 때 포스팅 단위로 옮겨 담기용)
+        posting = self.postings[posting_idx]
+        offset = self.starts[posting_idx]
+        count = posting["tf_title"] + posting["tf_abstract"] + posting["tf_claims"]
+        out = bytearray()
+        for delta in self.values[offset:offset + count].tolist():
+            encode_varint(delta, out)
+        return bytes(out)
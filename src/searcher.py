@@ -1,128 +1,182 @@
 # src/searcher.py
 import os
-import struct
-import math
 import json
 import re
-from .tokenizer import extract_terms
+import time
+import numpy as np
+from .postings import POSTING_DTYPE, PostingsReader, PositionsReader, select_postings
+from .bm25f import BM25FScorer, idf
+from .docstore import DocStoreReader
+from .term_dict import load_term_dict
+from .doc_table import load_doc_table
+from .segments import SegmentedIndex, load_manifest
+from .tokenizer import extract_terms_batch
+from .cache import LRUCache
+from .metrics import metrics
+from .highlighter import Highlighter
+# 필드 이름 -> 원본 JSON(dataset)의 키
+SOURCE_KEYS = {"title": "invention_title", "abstract": "abstract", "claims": "claims"}
+
+PRUNING_EPS = 1e-9 # 점수 상한 비교 시 부동소수점 합산 순서 차이를 흡수하기 위한 여유
+OPEN_RETRIES = 5 # 세그먼트 색인을 여는 중에 merge가 예전 세그먼트 폴더를 지웠을 때 새 manifest로 다시 여는 횟수
+WILDCARD_LIMIT = 50 # 와일드카드(word*) 하나가 확장될 수 있는 최대 term 수
+WILDCARD_PATTERN = re.compile(r"(\S+)\*")
+
+
 class Searcher:
-    def __init__(self, index_dir, doc_table_file, term_dict_file, postings_file):
+    def __init__(self, index_dir, doc_table_file, term_dict_file, postings_file, pruning=True,
+                 query_cache_size=1024, postings_cache_size=256, result_cache_size=1024, refresh_interval=1.0):
     # load index_dir/...
         self.index_dir = os.path.abspath(index_dir) 
-        postings_file = os.path.join(self.index_dir, postings_file)
-        term_dict_file = os.path.join(self.index_dir, term_dict_file)
-        doc_table_file = os.path.join(self.index_dir, doc_table_file)
+        self.postings_file = os.path.join(self.index_dir, postings_file)
+        self.term_dict_file = os.path.join(self.index_dir, term_dict_file)
+        self.doc_table_file = os.path.join(self.index_dir, doc_table_file)
 
     # load doc_table → self.doc_table
     # load term_dict → self.term_dcit
     # open posting file → self.fp
-        with open(doc_table_file, 'r', encoding='utf-8') as f:
-            self.doc_table = json.load(f)
-        with open(term_dict_file, 'r', encoding='utf-8') as f:
-            self.term_dict = json.load(f)
-        self.fp = open(postings_file, 'rb')
-    # 총문서 크기 → self.N
-        self.N = len(self.doc_table)
+        self.open_index()
+    # MaxScore 동적 가지치기 사용 여부 (term_dict에 max_score가 있는 색인에서만 동작)
+        self.pruning = pruning
+    # LRU 캐시 (크기 0이면 끔). 색인 generation이 바뀌면 전부 비운다.
+        self.query_cache = LRUCache(query_cache_size) # 검색어 문자열 -> 형태소 분석 결과 term들
+        self.postings_cache = LRUCache(postings_cache_size) # term -> 디코딩된 포스팅 배열 (자주 나오는 term)
+        self.result_cache = LRUCache(result_cache_size) # (정규화된 검색어, AND/PHRASE/FIELD 플래그) -> 최종 top-k
+        self.refresh_interval = refresh_interval # 색인이 바뀌었는지 확인하는 최소 간격(초)
+        self.checked_at = time.monotonic()
+
+    def open_index(self):
+        self.generation = self.current_generation() # 여는 중에 색인이 바뀌면 다음 refresh 때 다시 연다
+    # segments.json이 있으면 세그먼트 색인 (update_index로 만든 색인). 세그먼트들을 하나의 색인처럼 묶어서 쓴다.
+        self.segments = None
+        self.live = None # 살아있는 문서 마스크 (세그먼트 색인에서 삭제된 문서 제외용)
+        if load_manifest(self.index_dir) is not None:
+            self.segments = self.open_segments()
+            self.generation = self.segments.generation
+            self.live = self.segments.live
+            self.doc_table = self.segments.doc_table
+            self.term_dict = self.segments.term_dict
+            self.postings = self.segments.postings
+            self.positions = self.segments.positions
+            self.docstore = self.segments.docstore
+        else:
+    # 바이너리(term_dict.bin / doc_table.bin)가 있으면 mmap 해서 필요한 부분만 읽는다. (없으면 예전 json 로드)
+            self.doc_table = load_doc_table(self.doc_table_file)
+            self.term_dict = load_term_dict(self.term_dict_file)
+            self.postings = PostingsReader(self.postings_file) # postings.bin mmap (헤더 보고 legacy / varint 포맷 판별)
+    # positions.bin이 있으면 PHRASE 검증을 원본 JSON 대신 위치 정보로 한다.
+            positions_file = os.path.join(self.index_dir, "positions.bin")
+            self.positions = PositionsReader(positions_file) if os.path.exists(positions_file) else None
+    # docstore.bin이 있으면 스니펫/PHRASE 검증용 원문을 원본 JSON 대신 여기서 읽는다.
+            docstore_file = os.path.join(self.index_dir, "docstore.bin")
+            self.docstore = DocStoreReader(docstore_file) if os.path.exists(docstore_file) else None
+    # 필드 길이 정규화 값은 로드할 때 한 번만 계산 (쿼리마다 doc_table 전체를 더하지 않음)
+        self.scorer = BM25FScorer({
+            "title": self.doc_table.column('len_title'),
+            "abstract": self.doc_table.column('len_abstract'),
+            "claims": self.doc_table.column('len_claims')
+        }, self.live)
+    # 총문서 크기 → self.N (삭제된 문서 제외), 점수 배열 크기 → self.doc_slots (전역 doc_id 개수)
+        self.N = self.scorer.N
+        self.doc_slots = len(self.doc_table)
+
+    def open_segments(self):
+        # merge는 manifest를 바꾼 직후 예전 세그먼트 폴더를 지운다. manifest를 읽은 뒤 폴더가 사라졌으면
+        # (FileNotFoundError) 새 manifest를 다시 읽어서 연다. 이미 열린 Searcher는 mmap으로 예전 파일을 계속 본다.
+        for attempt in range(OPEN_RETRIES):
+            try:
+                return SegmentedIndex(self.index_dir, os.path.basename(self.doc_table_file), os.path.basename(self.term_dict_file), os.path.basename(self.postings_file))
+            except FileNotFoundError:
+                if attempt == OPEN_RETRIES - 1:
+                    raise
+
+    def current_generation(self):
+        # 세그먼트 색인은 manifest의 generation, 단일 색인은 postings.bin의 수정 시각 (다시 색인하면 바뀜)
+        manifest = load_manifest(self.index_dir)
+        if manifest is not None:
+            return manifest["generation"]
+        return os.stat(self.postings_file).st_mtime_ns if os.path.exists(self.postings_file) else 0
+
+    def refresh(self, force=False):
+        # refresh_interval마다 색인 generation을 확인해서 바뀌었으면 색인을 다시 열고 캐시를 비운다.
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.refresh_interval:
+            return False
+        self.checked_at = now
+        if not force and self.current_generation() == self.generation:
+            return False
+        for cache in (self.query_cache, self.postings_cache, self.result_cache): # mmap view를 먼저 놓아줌
+            cache.clear()
+        self.close()
+        self.open_index()
+        return True
+
+    def cache_stats(self): # 캐시별 hit/miss 통계
+        return {"query": self.query_cache.stats(), "postings": self.postings_cache.stats(), "result": self.result_cache.stats()}
 
     def close(self): # __init__에서 안 닫아줘서 클래스가 닫힐 때 닫기
-        if self.fp:
-            self.fp.close()
+        if self.postings:
+            self.postings.close()
+            self.postings = None
+        if self.positions:
+            self.positions.close()
+            self.positions = None
+        if self.docstore:
+            self.docstore.close()
+            self.docstore = None
+        if self.term_dict is not None:
+            self.term_dict.close()
+            self.term_dict = None
+        if self.doc_table is not None:
+            self.doc_table.close()
+            self.doc_table = None
+        if self.segments is not None:
+            self.segments.close()
+            self.segments = None
             
 
     def get_postings(self, term):
+        # term의 포스팅 리스트를 NumPy structured array (doc_id, tf_title, tf_abstract, tf_claims)로 반환
         if term not in self.term_dict:
-            return []
-        # term == 'ai'  
-        entry = self.term_dict[term]
-        df = entry["df"] # 123
-        start_offset = entry["start"] # 0
-        postings = []
-
-        self.fp.seek(start_offset) # posting_file 에서 0번 byte offset으로 커서를 이동
-        
-        for _ in range(df): # df(range) 만큼 반복
-            data = self.fp.read(16) 
-            # 커서 이동 후에 start 지점에서 16바이트 읽기 (8바이트 안에 몇번째 파일(4byte)에 해당 term이 몇 번(4byte) 나왔는지에 대한 정보가 담겨있음.)
-            if len(data) != 16:
-                raise ValueError(f"Incomplete data read at offset {start_offset}") # 8바이트 정보가 아니면 오프셋 에러 출력.
-            doc_id, tf_title, tf_abstract, tf_claims = struct.unpack("iiii", data) # 바이트 -> int로 변환
-            postings.append((doc_id, tf_title, tf_abstract, tf_claims)) # postings 안에 doc_id랑 freq를 집어넣기.
+            return np.zeros(0, dtype=POSTING_DTYPE)
+        postings = self.postings_cache.get(term)
+        if postings is None:
+            # term == 'ai'
+            entry = self.term_dict[term] # {"df": 123, "start": 0, ...}
+            with metrics.timer("query.postings"):
+                postings = self.postings.read(entry)
+            postings.flags.writeable = False # 캐시에 들어가는 배열이라 실수로 고치지 않게
+            self.postings_cache.put(term, postings)
         return postings
-    
-    
+
+    def tokenize(self, text):
+        return list(self.analyze_query(text)[0])
+
+    def analyze_query(self, text):
+        # 검색어 형태소 분석 -> (terms, 위치들) (같은 검색어는 캐시에서). 위치는 PHRASE 검증용
+        analyzed = self.query_cache.get(text)
+        if analyzed is None:
+            with metrics.timer("query.tokenize"):
+                terms, positions = extract_terms_batch([text], positions=True)[0]
+            analyzed = (tuple(terms), tuple(positions))
+            self.query_cache.put(text, analyzed)
+        return analyzed
+
+    def expand_prefix(self, prefix, limit=WILDCARD_LIMIT):
+        # 사전에서 prefix로 시작하는 term 목록 (정렬된 사전이라 이진 탐색 + 순차 스캔)
+        return self.term_dict.prefix(prefix.lower(), limit)
+
+
     def process_query(self, user_query): # ex) process_query(데이터와 보안)
-        # 1. 태그 파싱 ([AND], [FIELD=...], [PHRASE])
-        is_phrase_query = "[PHRASE]" in user_query
-        is_and_query = "[AND]" in user_query or is_phrase_query # Phrase Query는 암묵적으로 AND 조건을 포함
-        
-        target_fields = []
-        if "[FIELD=T]" in user_query or is_phrase_query: target_fields.append("title") # Phrase는 Title만 검색
-        if "[FIELD=A]" in user_query and not is_phrase_query: target_fields.append("abstract")
-        if "[FIELD=C]" in user_query and not is_phrase_query: target_fields.append("claims")
-        
-        # 태그 제거 후 검색어 추출
-        clean_query = user_query.replace("[AND]", "").replace("[FIELD=T]", "").replace("[FIELD=A]", "").replace("[FIELD=C]", "").replace("[PHRASE]", "").replace("[VERBOSE]", "").strip()
-        query_terms = extract_terms(clean_query)
-        
+        result = self.search(user_query, 5, snippets="[VERBOSE]" in user_query)
+        query_terms = result["terms"]
+        total = result["total"]
+
         if not query_terms:
             print("검색어가 없습니다.")
             return
 
-        # 2. AND Query / Phrase Query일 경우: 모든 검색어가 포함된 문서 교집합(Candidate Docs) 구하기
-        candidate_docs = None
-        term_postings_map = {} # 포스팅 리스트 캐싱 (IO 줄이기)
-
-        for term in query_terms:
-            if term not in self.term_dict:
-                if is_and_query: # AND 조건인데 단어가 없으면 결과 0개
-                    candidate_docs = set()
-                    break
-                continue
-            
-            postings = self.get_postings(term)
-            term_postings_map[term] = postings
-            
-            if is_and_query:
-                # 필드 제약조건을 만족하는 문서 ID 집합 추출
-                valid_docs_for_term = set()
-                for doc_id, tf_title, tf_abstract, tf_claims in postings:
-                    # 필드 조건 확인
-                    is_in_field = False
-                    if not target_fields: # 필드 명시 없으면 전체 필드 대상
-                        is_in_field = True
-                    else:
-                        if "title" in target_fields and tf_title > 0: is_in_field = True
-                        elif "abstract" in target_fields and tf_abstract > 0: is_in_field = True
-                        elif "claims" in target_fields and tf_claims > 0: is_in_field = True
-                    
-                    if is_in_field:
-                        valid_docs_for_term.add(doc_id)
-                
-                if candidate_docs is None:
-                    candidate_docs = valid_docs_for_term
-                else:
-                    candidate_docs &= valid_docs_for_term # 교집합 연산
-                    if not candidate_docs: # 교집합이 비면 조기 종료
-                        break
-        
-        # Phrase Query 검증 (Exact Matching in Title)
-        if is_phrase_query and candidate_docs:
-            verified_docs = set()
-            for doc_id in candidate_docs:
-                doc_info = self.doc_table[doc_id]
-                file_path = doc_info['path']
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        title = data['dataset'].get('invention_title', '')
-                        if clean_query in title: # 원본 쿼리(clean_query)가 제목에 포함되어 있는지 확인
-                            verified_docs.add(doc_id)
-                except Exception as e:
-                    print(f"Error reading file {file_path}: {e}")
-                    continue
-            candidate_docs = verified_docs
-
-        if is_and_query and not candidate_docs:
+        if result["mode"] != "OR" and not total: # AND/PHRASE 조건을 만족하는 문서 없음
             print(f'''RESULT:
               검색어: {query_terms} (AND/PHRASE)
               총 0개 문서 검색
@@ -130,222 +184,329 @@ class Searcher:
               ''')
             return
 
-        # 3. BM25F 점수 계산
-        w_title = 2.5 
-        w_abstract = 1.5
-        w_claims = 1.1
-
-        b_title = 0.3 # 필드별 길이 정규화 세기
-        b_abstract = 0.75
-        b_claims = 0.8
-        
-        k1 = 1.2 # 파라미터 값 정의
-        
-        avgdl_title = sum(d['len_title'] for d in self.doc_table) / self.N
-        avgdl_abstract = sum(d['len_abstract'] for d in self.doc_table) / self.N
-        avgdl_claims = sum(d['len_claims'] for d in self.doc_table) / self.N
-        # 필드별 평균 길이(토큰 수) 계산
-
-        doc_scores = {} # 랭크 값 {[0, 15], [5, 12], ... }
-        for term in query_terms:
-            if term not in term_postings_map:
-                if term in self.term_dict: # 캐싱 안된 경우 (OR 쿼리 등)
-                    term_postings_map[term] = self.get_postings(term)
-                else:
-                    continue
-            df = self.term_dict[term]["df"] # 데이터 의 df를 df에 저장
-            idf = math.log((self.N - df + 0.5) / (df + 0.5) + 1) # idf 계산식 ㅇ
-
-            postings = term_postings_map[term]
-            for doc_id, tf_title, tf_abstract, tf_claims in postings:
-                # AND/Phrase 쿼리인 경우 교집합(및 검증된)에 있는 문서만 계산
-                if is_and_query and doc_id not in candidate_docs:
-                    continue
-                
-                doc = self.doc_table[doc_id]
-                
-                # 필드 제약조건 적용: 선택되지 않은 필드의 TF는 0으로 취급
-                real_tf_title = tf_title if (not target_fields or "title" in target_fields) else 0
-                real_tf_abstract = tf_abstract if (not target_fields or "abstract" in target_fields) else 0
-                real_tf_claims = tf_claims if (not target_fields or "claims" in target_fields) else 0
-                
-                # 해당 문서에서 유효한 필드에 단어가 하나도 없으면 스킵 (OR 쿼리에서도 필드 제한 적용 가능)
-                if real_tf_title == 0 and real_tf_abstract == 0 and real_tf_claims == 0:
-                    continue
-
-                # 필드별 TF 계산을 위한 분모 값.
-                Bunmo_title = 1 - b_title + b_title * (doc['len_title'] / avgdl_title)
-                Bunmo_abstract = 1 - b_abstract + b_abstract * (doc['len_abstract'] / avgdl_abstract)
-                Bunmo_claims = 1 - b_claims + b_claims * (doc['len_claims'] / avgdl_claims)
-                
-                # sum( wf * tf_t,d,f / B_t,d,f )    
-                tilde_tf = (w_title * real_tf_title / Bunmo_title) + \
-                           (w_abstract * real_tf_abstract / Bunmo_abstract) + \
-                           (w_claims * real_tf_claims / Bunmo_claims)
-                
-                # 최종 BM25F 점수 계산
-                numerator = tilde_tf * (k1 + 1) # 분자
-                denominator = k1 + tilde_tf # 분모
-                
-                bm25f_score = idf * (numerator / denominator) # 기존 idf랑 곱하기
-                
-                doc_scores[doc_id] = doc_scores.get(doc_id, 0) + bm25f_score
-                # 랭킹 값이 doc_scores로 들어감. 
-                # ex) {doc_id:BM25f_score} 101:0.5 가 들어오고 101:0.8이 또 들어오면 101:1.3이 되는 원리. term들이 겹칠수록 점수가 높아진다.
-                
-        # doc_scores의 상위 5개 문서를 추출해서 새로운 리스트로 만들자.
-        sorted_doc_scores = sorted(doc_scores.items(), key = lambda x:x[1], reverse=True) # if_idf 높은순으로 정렬
-        top5_doc_scores = sorted_doc_scores[:5] # 5개만 따로 리스트 만들기
-        
         print(f'''RESULT:
                     검색어 입력: {user_query}
-                    총 {len(doc_scores)}개 문서 검색
-                    상위 {len(top5_doc_scores)}개 문서:''')
+                    총 {total}개 문서 검색
+                    상위 {len(result["results"])}개 문서:''')
         
-        for idx, score in top5_doc_scores:
-            print(f'  {self.doc_table[idx]["filename"]}  {round(score,2)}')
+        for item in result["results"]:
+            print(f'  {item["filename"]}  {round(item["score"],2)}')
             
         print("-" * 50)
         print()
 
-        for idx, score in top5_doc_scores:
-            print(f'파일명: {self.doc_table[idx]["filename"]}, 점수: {round(score,2)}')
+        for item in result["results"]:
+            print(f'파일명: {item["filename"]}, 점수: {round(item["score"],2)}')
             
             # [VERBOSE] 옵션이 있을 경우 하이라이팅 출력
-            if "[VERBOSE]" in user_query:
-                mode = "OR"
-                if is_phrase_query: mode = "PHRASE"
-                elif is_and_query: mode = "AND"
-                
-                # Phrase Query인 경우 원본 쿼리(clean_query)를 전달
-                terms_to_highlight = [clean_query] if is_phrase_query else query_terms
-                self.highlight_snippet(idx, terms_to_highlight, mode)
+            if "error" in item:
+                print(f"Error reading file for highlighting: {item['error']}")
+            for snippet in item.get("snippets", []):
+                print(f"[{snippet['field']}] {snippet['text']}")
             print()
 
-    def highlight_snippet(self, doc_id, query_terms, mode):
-        doc_info = self.doc_table[doc_id]
-        file_path = doc_info['path']
+    def search(self, user_query, k=5, snippets=False):
+        # 검색 API. 출력 없이 결과를 dict로 돌려준다. (검색 서버 / process_query 공용)
+        # {"query", "terms", "mode": OR/AND/PHRASE, "fields", "total", "results": [{"doc_id", "filename", "score", ["snippets"]}]}
+        trace = metrics.begin("query", user_query) # 계측이 켜져 있으면 이 검색어의 단계별 시간/카운터를 모음
+        # 1. 태그 파싱 ([AND], [FIELD=...], [PHRASE])
+        is_phrase_query = "[PHRASE]" in user_query
+        is_and_query = "[AND]" in user_query or is_phrase_query # Phrase Query는 암묵적으로 AND 조건을 포함
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                title = data['dataset'].get('invention_title', '')
-                abstract = data['dataset'].get('abstract', '')
-                claims = data['dataset'].get('claims', '')
-        except Exception as e:
-            print(f"Error reading file for highlighting: {e}")
-            return
+        target_fields = []
+        if "[FIELD=T]" in user_query: target_fields.append("title")
+        if "[FIELD=A]" in user_query: target_fields.append("abstract")
+        if "[FIELD=C]" in user_query: target_fields.append("claims")
+        if is_phrase_query and not target_fields: target_fields.append("title") # Phrase는 필드 지정이 없으면 Title만 검색
+        
+        # 태그 제거 후 검색어 추출
+        clean_query = user_query.replace("[AND]", "").replace("[FIELD=T]", "").replace("[FIELD=A]", "").replace("[FIELD=C]", "").replace("[PHRASE]", "").replace("[VERBOSE]", "").strip()
+
+        # 같은 검색어 + 같은 플래그면 캐시된 결과를 그대로 쓴다 ([VERBOSE]는 출력만 달라서 key에서 뺌)
+        self.refresh()
+        result_key = (" ".join(clean_query.split()), is_and_query, is_phrase_query, tuple(target_fields), k)
+        cached = self.result_cache.get(result_key)
+        if cached is None:
+            cached = self.execute_query(clean_query, is_and_query, is_phrase_query, target_fields, k)
+            self.result_cache.put(result_key, cached)
+        query_terms, clean_query, total, top_doc_scores = cached
+
+        mode = "OR"
+        if is_phrase_query: mode = "PHRASE"
+        elif is_and_query: mode = "AND"
+        results = self.build_results(top_doc_scores, query_terms, clean_query, mode, target_fields, snippets)
+        metrics.end(trace)
+        return {"query": user_query, "terms": list(query_terms), "mode": mode, "fields": target_fields, "total": total, "results": results}
 
-        # 검색 대상 텍스트 및 우선순위 설정
-        # Title > Abstract > Claims 순서
-        targets = [("TITLE", title), ("ABSTRACT", abstract), ("CLAIMS", claims)]
+    def build_results(self, top_doc_scores, query_terms, clean_query, mode, target_fields, snippets):
+        # top-k [(doc_id, score)] -> 결과 항목 [{"doc_id", "filename", "score", ["snippets"]}]
+        # Phrase Query인 경우 원본 쿼리(clean_query)로 하이라이팅
+        highlighter = None
+        if snippets and top_doc_scores:
+            highlighter = Highlighter([clean_query] if mode == "PHRASE" else query_terms)
+
+        results = []
+        for doc_id, score in top_doc_scores:
+            item = {"doc_id": doc_id, "filename": self.doc_table[doc_id]["filename"], "score": score}
+            if snippets:
+                try:
+                    with metrics.timer("query.snippets"):
+                        item["snippets"] = [{"field": field_name, "text": text}
+                                            for field_name, text in self.make_snippets(doc_id, highlighter, mode, target_fields)]
+                except Exception as e:
+                    item["snippets"] = []
+                    item["error"] = str(e)
+            results.append(item)
+        return results
+
+    def execute_query(self, clean_query, is_and_query, is_phrase_query, target_fields, k=5):
+        # 태그를 뗀 검색어로 검색 -> (query_terms, clean_query, 총 문서 수, top-k [(doc_id, score)])
+        # OR 쿼리의 와일드카드(ex. 데이터*)는 사전에서 prefix로 찾은 term들로 확장해서 검색어에 추가
+        wildcard_terms = []
+        if not is_and_query:
+            for prefix in WILDCARD_PATTERN.findall(clean_query):
+                wildcard_terms.extend(self.expand_prefix(prefix))
+            clean_query = WILDCARD_PATTERN.sub(" ", clean_query).strip()
+        query_terms = self.tokenize(clean_query)
+        query_terms += [term for term in dict.fromkeys(wildcard_terms) if term not in query_terms]
         
-        window_size = 80
+        if not query_terms:
+            return query_terms, clean_query, 0, []
+        total, top_doc_scores = self.match_terms(query_terms, clean_query, is_and_query, is_phrase_query, target_fields, k)
+        return query_terms, clean_query, total, top_doc_scores
+
+    def match_terms(self, query_terms, clean_query, is_and_query, is_phrase_query, target_fields, k=5):
+        # 분석된 검색어 term들로 검색 -> (총 문서 수, top-k [(doc_id, score)])
+        # 2. AND Query / Phrase Query일 경우: 모든 검색어가 포함된 문서 교집합(Candidate Docs) 구하기
+        candidate_docs = None # 정렬된 doc_id 배열
+        term_postings_map = {} # 포스팅 리스트 캐싱 (IO 줄이기)
+
+        if is_and_query:
+            # 교집합은 df가 작은 term부터: 가장 드문 term만 포스팅 전체를 읽고, 나머지 term은 지금까지 남은 후보 문서만 찾아본다.
+            # (캐시에 있으면 이진 탐색, 없으면 skip 테이블로 후보가 걸리는 블록만 디코딩)
+            # -> 드문 term + 흔한 term 조합의 비용이 흔한 term 포스팅 길이가 아니라 후보 수에 비례
+            and_terms = list(dict.fromkeys(query_terms))
+            if any(term not in self.term_dict for term in and_terms): # AND 조건인데 단어가 없으면 결과 0개
+                candidate_docs = np.zeros(0, dtype=np.int32)
+                and_terms = []
+            and_terms.sort(key=lambda term: self.term_dict[term]["df"])
+
+            for term in and_terms:
+                if candidate_docs is None:
+                    postings = self.get_postings(term)
+                else:
+                    postings = self.probe_postings(term, candidate_docs) # 후보 문서에 있는 포스팅만 (= 교집합)
+                term_postings_map[term] = postings # 점수 계산 때 후보 문서만 쓰므로 일부만 있어도 됨
+
+                with metrics.timer("query.intersect"):
+                    # 필드 제약조건을 만족하는 문서 ID 집합 추출 (배열 마스크로 한 번에)
+                    if not target_fields: # 필드 명시 없으면 전체 필드 대상
+                        candidate_docs = postings["doc_id"]
+                    else:
+                        in_field = np.zeros(len(postings), dtype=bool)
+                        for field in target_fields:
+                            in_field |= postings["tf_" + field] > 0
+                        candidate_docs = postings["doc_id"][in_field]
+                if not len(candidate_docs): # 교집합이 비면 조기 종료
+                    break
         
-        if mode == "PHRASE":
-            # Phrase Query: Title에서만 정확히 일치하는 한 곳만 출력
-            if clean_query := query_terms[0]: # query_terms has [clean_query]
-                 match = re.search(re.escape(clean_query), title, re.IGNORECASE)
-                 if match:
-                    idx = match.start()
-                    start = max(0, idx - (window_size - len(clean_query)) // 2)
-                    end = min(len(title), start + window_size)
-                    snippet = title[start:end]
-                    snippet = re.sub(re.escape(clean_query), fr"<<\g<0>>>", snippet, flags=re.IGNORECASE)
-                    print(f"[{targets[0][0]}] {snippet}")
-            return
+        # Phrase Query 검증 (지정 필드에서 검색어가 연속으로 나오는지)
+        if is_phrase_query and candidate_docs is not None and len(candidate_docs):
+            with metrics.timer("query.phrase"):
+                candidate_docs = self.verify_phrase(candidate_docs, query_terms, clean_query, target_fields)
 
-        elif mode == "OR":
-            # OR Query: 최대한 (서로 다른) query가 가장 많이 발생한 한 부분만 출력
-            best_snippet = ""
-            best_score = -1
-            best_field = ""
-            
-            for field_name, text in targets:
-                if not text: continue
-                
-                term_indices = []
-                for term in query_terms:
-                    for match in re.finditer(re.escape(term), text, re.IGNORECASE):
-                        term_indices.append(match.start())
-                
-                if not term_indices: continue
-                term_indices.sort()
-                
-                for start_idx in term_indices:
-                    
-                    w_start = max(0, start_idx - window_size // 2)
-                    w_end = min(len(text), w_start + window_size)
-                    window_text = text[w_start:w_end]
-                    
-                    current_score = 0
-                    for term in query_terms:
-                        if re.search(re.escape(term), window_text, re.IGNORECASE):
-                            current_score += 1
-                    
-                    if current_score > best_score:
-                        best_score = current_score
-                        best_snippet = window_text
-                        best_field = field_name
-            
-            if best_snippet:
-                for term in query_terms:
-                    best_snippet = re.sub(re.escape(term), fr"<<\g<0>>>", best_snippet, flags=re.IGNORECASE)
-                print(f"[{best_field}] {best_snippet}")
-                
-        elif mode == "AND":
-            # AND Query: 모든 term이 다 등장할 때까지 (여러 부분) 출력
-            remaining_terms = set(query_terms)
-
-            while remaining_terms:
-                best_snippet = ""
-                best_score = -1 
-                best_field = ""
-                covered_in_this_step = set()
-                best_window_indices = (0, 0) # start, end
-                best_text_ref = ""
-                
-                for field_name, text in targets:
-                    if not text: continue
-                    
-                    
-                    term_indices = []
-                    for term in remaining_terms:
-                         for match in re.finditer(re.escape(term), text, re.IGNORECASE):
-                            term_indices.append(match.start())
-                            
-                    if not term_indices: continue
-                    term_indices.sort()
-                    
-                    for start_idx in term_indices:
-                        w_start = max(0, start_idx - window_size // 2)
-                        w_end = min(len(text), w_start + window_size)
-                        window_text = text[w_start:w_end]
-                        
-                        current_covered = set()
-                        for term in remaining_terms:
-                             if re.search(re.escape(term), window_text, re.IGNORECASE):
-                                current_covered.add(term)
-                        
-                        if len(current_covered) > best_score:
-                            best_score = len(current_covered)
-                            best_snippet = window_text
-                            best_field = field_name
-                            covered_in_this_step = current_covered
-                            best_window_indices = (w_start, w_end)
-                            best_text_ref = text
-                
-                if best_score > 0:
-                    
-                    highlighted = best_snippet
-                    for term in query_terms:
-                         highlighted = re.sub(re.escape(term), fr"<<\g<0>>>", highlighted, flags=re.IGNORECASE)
-                    
-                    print(f"[{best_field}] {highlighted}")
-                    
-                    remaining_terms -= covered_in_this_step
-                    
-                    if not covered_in_this_step:
+        if is_and_query and (candidate_docs is None or not len(candidate_docs)):
+            return 0, []
+
+        # 3. BM25F 점수 계산 (포스팅 리스트 단위로 배열 연산)
+        candidate_mask = None
+        if is_and_query: # AND/Phrase 쿼리인 경우 교집합(및 검증된)에 있는 문서만 계산
+            candidate_mask = np.zeros(self.doc_slots, dtype=bool)
+            candidate_mask[candidate_docs] = True
+
+        for term in query_terms: # 포스팅 읽기를 점수 계산 전에 끝내 둔다 (단계별 시간이 겹치지 않게)
+            if term in self.term_dict:
+                self.term_postings(term, term_postings_map)
+        with metrics.timer("query.score"):
+            return self.rank(query_terms, term_postings_map, target_fields, candidate_mask, k)
+
+    def verify_phrase(self, candidate_docs, query_terms, clean_query, phrase_fields):
+        if self.positions is not None and all("pos_start" in self.term_dict[term] for term in query_terms):
+            return self.verify_phrase_positions(candidate_docs, query_terms, clean_query, phrase_fields)
+
+        # positions 색인이 없으면 원문(docstore 또는 원본 JSON)에서 확인
+        verified_docs = []
+        for doc_id in candidate_docs.tolist():
+            try:
+                fields = self.load_fields(doc_id)
+            except Exception as e:
+                print(f"Error reading file {self.doc_table[doc_id]['path']}: {e}")
+                continue
+            # 원본 쿼리(clean_query)가 지정 필드 중 하나에 포함되어 있는지 확인
+            if any(clean_query in fields[field] for field in phrase_fields):
+                verified_docs.append(doc_id)
+        return np.array(verified_docs, dtype=np.int32)
+
+    def load_fields(self, doc_id):
+        # 문서 원문 {"title", "abstract", "claims"}. docstore.bin이 있으면 거기서, 없으면 원본 JSON에서 읽는다.
+        if self.docstore is not None:
+            return self.docstore.get(doc_id)
+        metrics.count("files.opened")
+        with open(self.doc_table[doc_id]['path'], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {field: data['dataset'].get(key, '') for field, key in SOURCE_KEYS.items()}
+
+    def verify_phrase_positions(self, candidate_docs, query_terms, clean_query, phrase_fields):
+        # i번째 검색어가 (첫 검색어 위치 + 검색어 안에서 두 term 사이 거리)에 있으면 구문 일치.
+        # 위치는 버린 토큰까지 센 순번이라 "인공지능 시스템"은 "인공지능 3 시스템"과 일치하지 않는다 (원문 비교와 같게)
+        # 위치 블록은 포스팅 순서대로 이어져 있어서 포스팅 전체가 필요하다 (교집합 때 찾아본 일부 포스팅 X)
+        query_positions = self.analyze_query(clean_query)[1]
+        offsets = [pos - query_positions[0] for pos in query_positions]
+        term_positions = {}
+        posting_idx = {}
+        for term in set(query_terms):
+            postings = self.get_postings(term)
+            term_positions[term] = self.positions.read(self.term_dict[term], postings)
+            posting_idx[term] = np.searchsorted(postings["doc_id"], candidate_docs) # 후보는 모든 term 포스팅에 있음
+
+        verified_docs = []
+        for i, doc_id in enumerate(candidate_docs.tolist()):
+            for field in phrase_fields:
+                starts = term_positions[query_terms[0]].get(posting_idx[query_terms[0]][i], field)
+                for offset, term in zip(offsets[1:], query_terms[1:]):
+                    if not len(starts):
                         break
-                else:
-                    break
\ No newline at end of file
+                    starts = starts[np.isin(starts + offset, term_positions[term].get(posting_idx[term][i], field))]
+                if len(starts):
+                    verified_docs.append(doc_id)
+                    break
+        return np.array(verified_docs, dtype=np.int32)
+
+    def probe_postings(self, term, doc_ids):
+        # term 포스팅 중 doc_ids(정렬됨)에 있는 것만. 포스팅 전체를 캐시에 올리지는 않는다.
+        postings = self.postings_cache.get(term)
+        if postings is not None:
+            return select_postings(postings, doc_ids)
+        with metrics.timer("query.postings"):
+            return self.postings.probe(self.term_dict[term], doc_ids)
+
+    def term_postings(self, term, term_postings_map):
+        if term not in term_postings_map: # 캐싱 안된 경우 (OR 쿼리 등)
+            term_postings_map[term] = self.get_postings(term)
+        return term_postings_map[term]
+
+    def term_idf(self, term):
+        return idf(self.N, self.term_dict[term]["df"]) # 데이터 의 df로 idf 계산
+
+    def rank(self, query_terms, term_postings_map, target_fields, candidate_mask, k):
+        if (self.pruning and candidate_mask is None
+                and all("max_score" in self.term_dict[term] for term in query_terms if term in self.term_dict)):
+            return self.rank_maxscore(query_terms, term_postings_map, target_fields, k)
+
+        # 모든 term의 점수를 dense 배열(doc_scores)에 누적한 뒤 np.partition으로 상위 k개 후보만 골라서 정렬한다.
+        doc_scores = np.zeros(self.doc_slots) # 랭크 값 (doc_id 위치에 점수 누적)
+        # 동점일 때 순서를 예전(dict 삽입 순서 + 안정 정렬)과 똑같이 맞추기 위해
+        # 문서가 처음 점수를 받은 term 순번을 기록해 둔다. (같은 term 안에서는 doc_id 오름차순)
+        first_seen = np.full(self.doc_slots, len(query_terms), dtype=np.int64)
+
+        for term_idx, term in enumerate(query_terms):
+            if term not in self.term_dict:
+                continue
+            postings = self.term_postings(term, term_postings_map)
+            if candidate_mask is not None:
+                postings = postings[candidate_mask[postings["doc_id"]]]
+
+            doc_ids, scores = self.scorer.score(postings, self.term_idf(term), target_fields)
+            doc_scores[doc_ids] += scores # term들이 겹칠수록 점수가 높아진다. (한 term 안에서 doc_id는 중복 없음)
+            first_seen[doc_ids] = np.minimum(first_seen[doc_ids], term_idx)
+
+        matched = np.flatnonzero(first_seen < len(query_terms)) # 점수를 한 번이라도 받은 문서
+        return len(matched), self.select_top(doc_scores, first_seen, matched, k)
+
+    def select_top(self, doc_scores, first_seen, matched, k):
+        if len(matched) > k:
+            # k번째 점수 이상인 문서만 후보로 (경계에서 동점인 문서도 전부 포함)
+            kth_score = np.partition(doc_scores[matched], len(matched) - k)[len(matched) - k]
+            top = matched[doc_scores[matched] >= kth_score]
+        else:
+            top = matched
+        # 점수 내림차순 -> 처음 점수 받은 term 순번 -> doc_id 순
+        order = np.lexsort((top, first_seen[top], -doc_scores[top]))[:k]
+        return [(int(doc_id), float(doc_scores[doc_id])) for doc_id in top[order]]
+
+    def rank_maxscore(self, query_terms, term_postings_map, target_fields, k):
+        # MaxScore 동적 가지치기 (term-at-a-time)
+        # 1) term을 점수 상한(max_score) 큰 순서로 처리하면서 지금까지의 k번째 점수(theta)를 유지한다.
+        # 2) 남은 term들의 상한 합이 theta보다 작아지면, 아직 안 나온 문서는 top-k에 들 수 없다.
+        #    -> 남은 term(보통 df가 큰 흔한 단어)은 전체를 점수 계산하지 않고 후보 문서만 searchsorted로 찾아본다.
+        #    -> 후보도 (현재 점수 + 남은 상한) < theta 이면 버린다.
+        # 3) term별로 계산해 둔 점수를 원래 term 순서로 다시 더해서 완전 탐색과 똑같은 점수/순위를 만든다.
+        #    (가지치기가 한 번도 안 걸리면 rank()와 같은 계산이 된다. 점수 계산을 두 번 하지 않음)
+        # theta는 크기 k 최소 힙 대신 np.partition으로 구한다. 포스팅마다 파이썬 heapq를 도는 것보다 배열 한 번에 고르는 게 훨씬 빠름
+        occurrences = [(term_idx, term, self.term_dict[term]["max_score"])
+                       for term_idx, term in enumerate(query_terms) if term in self.term_dict]
+        occurrences.sort(key=lambda item: -item[2])
+        remaining = [0.0] * (len(occurrences) + 1) # remaining[i] = i번째 이후 term들의 상한 합
+        for i in range(len(occurrences) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + occurrences[i][2]
+
+        acc = np.zeros(self.doc_slots) # 부분 점수 누적
+        hit = np.zeros(self.doc_slots, dtype=bool) # 점수를 받은 문서 (후보 / 총 검색 문서 수)
+        hit_docs = [] # 처음 점수를 받은 문서들 (term마다 새로 나온 것만. 정렬은 끝나고 한 번)
+        hit_count = 0
+        scored = {} # term 순번 -> (doc_ids, scores). 마지막에 다시 계산하지 않고 더하기만 한다
+        theta = 0.0
+
+        i = 0
+        while i < len(occurrences): # essential term: 포스팅 전체 점수 계산
+            if hit_count >= k and remaining[i] < theta * (1 - PRUNING_EPS):
+                break
+            term_idx, term, _ = occurrences[i]
+            postings = self.term_postings(term, term_postings_map)
+            doc_ids, scores = self.scorer.score(postings, self.term_idf(term), target_fields)
+            scored[term_idx] = (doc_ids, scores)
+            acc[doc_ids] += scores
+            new_docs = doc_ids[~hit[doc_ids]]
+            hit[new_docs] = True
+            hit_docs.append(new_docs)
+            hit_count += len(new_docs)
+            i += 1
+            if hit_count >= k and i < len(occurrences): # 마지막 term 뒤에는 theta가 필요 없음
+                seen = np.concatenate(hit_docs) if len(hit_docs) > 1 else hit_docs[0]
+                hit_docs = [seen]
+                theta = np.partition(acc[seen], len(seen) - k)[len(seen) - k]
+
+        candidates = np.flatnonzero(hit)
+        for j in range(i, len(occurrences)): # non-essential term: 후보 문서만 찾아서 점수 추가
+            candidates = candidates[acc[candidates] + remaining[j] >= theta * (1 - PRUNING_EPS)]
+            term_idx, term, _ = occurrences[j]
+            postings = self.term_postings(term, term_postings_map)
+            hit[postings["doc_id"][self.scorer.field_mask(postings, target_fields)]] = True
+            found = select_postings(postings, candidates)
+            doc_ids, scores = self.scorer.score(found, self.term_idf(term), target_fields)
+            scored[term_idx] = (doc_ids, scores) # 이후 후보는 지금 후보의 부분집합이라 이것만 있으면 됨
+            acc[doc_ids] += scores
+        total = hit_count if i == len(occurrences) else int(np.count_nonzero(hit))
+        if len(candidates) > k:
+            candidates = candidates[acc[candidates] >= theta * (1 - PRUNING_EPS)]
+
+        # 원래 term 순서대로 점수를 더해서 정확한 점수 (부동소수점 합산 순서까지 rank()와 같게)
+        doc_scores = np.zeros(self.doc_slots)
+        first_seen = np.full(self.doc_slots, len(query_terms), dtype=np.int64)
+        for term_idx in sorted(scored):
+            doc_ids, scores = scored[term_idx]
+            doc_scores[doc_ids] += scores
+            first_seen[doc_ids] = np.minimum(first_seen[doc_ids], term_idx)
+
+        matched = candidates[first_seen[candidates] < len(query_terms)]
+        return total, self.select_top(doc_scores, first_seen, matched, k)
+
+    def make_snippets(self, doc_id, highlighter, mode, phrase_fields=None):
+        # 하이라이팅된 스니펫 [(필드 이름, 스니펫), ...] (원문을 못 읽으면 예외)
+        fields = self.load_fields(doc_id)
+        # 검색 대상 텍스트 및 우선순위 설정 (Title > Abstract > Claims 순서)
+        targets = [("TITLE", fields['title']), ("ABSTRACT", fields['abstract']), ("CLAIMS", fields['claims'])]
+        if mode == "PHRASE": # Phrase Query: 지정 필드(기본 Title)에서 정확히 일치하는 한 곳만 출력
+            targets = [target for target, field in zip(targets, ("title", "abstract", "claims"))
+                       if field in (phrase_fields or ["title"])]
+        return highlighter.snippets(targets, mode)
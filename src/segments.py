@@ -0,0 +1,401 @@
+# src/segments.py
+# 세그먼트 색인 (증분 색인 + 삭제 + 백그라운드 merge)
+#
+# index_dir/
+#   segments.json       : manifest {"generation", "updated_ns", "next_segment", "segments": [{"name", "doc_count", "deleted", "deleted_count"}, ...]}
+#   seg_00000/          : 세그먼트 하나 = 보통 색인과 같은 파일들 (postings.bin, term_dict.bin, doc_table.bin, positions.bin, docstore.bin)
+#     deletes_00003.bin : 삭제된 문서의 세그먼트 내 doc_id (int32 오름차순). 바뀔 때마다 새 파일로 쓰고 manifest가 가리킨다.
+#   paths_00003.json    : 살아있는 문서의 path -> [세그먼트 이름, 세그먼트 내 doc_id, 크기, 수정 시각(ns)]
+#                         (update_index가 바뀐 문서를 찾는 용도. 크기/수정 시각은 색인하기 전에 잰 파일 stat)
+#                         manifest["paths"]가 가리키고, update / merge 때 바뀐 부분만 고쳐서 새 파일로 쓴다.
+#
+# manifest는 임시 파일에 쓰고 os.replace로 바꿔치기 하기 때문에 Searcher는 항상 완전한 generation 하나만 본다.
+# 검색할 때 전역 doc_id = 세그먼트 base(앞 세그먼트들의 문서 수 합) + 세그먼트 내 doc_id.
+import os
+import json
+import math
+import heapq
+import itertools
+from array import array
+from functools import lru_cache
+import numpy as np
+from .postings import POSTING_DTYPE, PostingsReader, PositionsReader, write_header, encode_postings
+from .bm25f import FIELDS, BM25FScorer, idf, rescale_max_score, tf_scale
+from .docstore import DocStoreReader
+from .term_dict import load_term_dict
+from .doc_table import load_doc_table
+
+MANIFEST_FILE = "segments.json"
+MERGE_FACTOR = 4 # 크기 tier가 같은 세그먼트가 이만큼 모이면 하나로 merge
+DELETE_RATIO = 0.5 # 삭제된 문서 비율이 이보다 크면 그 세그먼트만 다시 써서 삭제 문서를 정리
+
+
+def manifest_path(index_dir):
+    return os.path.join(index_dir, MANIFEST_FILE)
+
+
+def load_manifest(index_dir): # 세그먼트 색인이 아니면 None
+    path = manifest_path(index_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(index_dir, manifest):
+    manifest["generation"] += 1
+    tmp_path = manifest_path(index_dir) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path(index_dir)) # 원자적으로 교체
+
+
+def segment_name(number):
+    return f"seg_{number:05d}"
+
+
+def live_count(info):
+    return info["doc_count"] - info["deleted_count"]
+
+
+def read_deletes(segment_dir, info):
+    if not info["deleted"]:
+        return np.zeros(0, dtype=np.int32)
+    return np.fromfile(os.path.join(segment_dir, info["deleted"]), dtype="<i4")
+
+
+def write_deletes(segment_dir, doc_ids, generation):
+    name = f"deletes_{generation:05d}.bin"
+    np.asarray(doc_ids, dtype="<i4").tofile(os.path.join(segment_dir, name))
+    return name
+
+
+def read_paths(index_dir, manifest): # manifest에 paths 파일이 없으면 (예전 색인) None
+    if not manifest.get("paths"):
+        return None
+    with open(os.path.join(index_dir, manifest["paths"]), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_paths(index_dir, path_map, generation):
+    name = f"paths_{generation:05d}.json"
+    with open(os.path.join(index_dir, name), 'w', encoding='utf8') as f:
+        json.dump(path_map, f, ensure_ascii=False)
+    return name
+
+
+def find_merge(segments, merge_factor=MERGE_FACTOR):
+    # merge 정책. 합칠 세그먼트 목록을 돌려준다. (없으면 빈 리스트)
+    # 1) 삭제 비율이 높은 세그먼트는 혼자 다시 써서 삭제 문서를 없앤다. (전부 삭제됐으면 그냥 사라짐)
+    for info in segments:
+        if info["doc_count"] and info["deleted_count"] / info["doc_count"] > DELETE_RATIO:
+            return [info]
+    # 2) 살아있는 문서 수의 log(merge_factor) 단위 tier가 같은 세그먼트가 merge_factor개 모이면 합친다.
+    #    매일 들어오는 작은 세그먼트끼리 먼저 합쳐지고, 큰 세그먼트는 드물게 다시 쓰인다.
+    tiers = {}
+    for info in segments:
+        tier = int(math.log(max(live_count(info), 1), merge_factor))
+        tiers.setdefault(tier, []).append(info)
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= merge_factor:
+            return tiers[tier][:merge_factor]
+    return []
+
+
+class Segment:
+    # 세그먼트 하나의 reader 묶음 + 살아있는 문서 마스크
+    def __init__(self, index_dir, info, doc_table_file, term_dict_file, postings_file, base=0):
+        self.name = info["name"]
+        self.dir = os.path.join(index_dir, self.name)
+        self.base = base
+        self.doc_table = load_doc_table(os.path.join(self.dir, doc_table_file))
+        self.term_dict = load_term_dict(os.path.join(self.dir, term_dict_file))
+        self.postings = PostingsReader(os.path.join(self.dir, postings_file))
+        positions_file = os.path.join(self.dir, "positions.bin")
+        self.positions = PositionsReader(positions_file) if os.path.exists(positions_file) else None
+        docstore_file = os.path.join(self.dir, "docstore.bin")
+        self.docstore = DocStoreReader(docstore_file) if os.path.exists(docstore_file) else None
+        self.deleted = read_deletes(self.dir, info)
+        self.live = np.ones(len(self.doc_table), dtype=bool)
+        self.live[self.deleted] = False
+        # 색인할 때 max_score를 계산한 통계 (삭제 전 세그먼트 문서 전체 기준)
+        self.doc_count = len(self.doc_table)
+        self.lengths = {field: np.asarray(self.doc_table.column("len_" + field), dtype=np.int64) for field in FIELDS}
+        self.avgdl = {field: float(self.lengths[field].sum() / self.doc_count) if self.doc_count else 0.0 for field in FIELDS}
+
+    def read_live(self, entry):
+        # term의 포스팅 중 삭제 안 된 문서만 (원래 포스팅, 남길 포스팅 마스크)
+        postings = self.postings.read(entry)
+        return postings, self.live[postings["doc_id"]]
+
+    def close(self):
+        for reader in (self.postings, self.positions, self.docstore, self.term_dict, self.doc_table):
+            if reader is not None:
+                reader.close()
+
+
+class SegmentedIndex:
+    # 여러 세그먼트를 하나의 색인처럼 보여준다.
+    # Searcher는 doc_table / term_dict / postings / positions / docstore 자리에 아래 래퍼들을 그대로 쓴다.
+    # term 항목의 df는 모든 세그먼트에서 살아있는 포스팅 수 (전역 통계)
+    def __init__(self, index_dir, doc_table_file, term_dict_file, postings_file):
+        manifest = load_manifest(index_dir)
+        self.generation = manifest["generation"]
+        self.segments = []
+        base = 0
+        try:
+            for info in manifest["segments"]:
+                segment = Segment(index_dir, info, doc_table_file, term_dict_file, postings_file, base)
+                self.segments.append(segment)
+                base += len(segment.doc_table)
+        except FileNotFoundError: # 여는 중에 merge가 세그먼트를 지움 -> 열어둔 것 닫고 Searcher가 다시 연다
+            for segment in self.segments:
+                segment.close()
+            raise
+        self.bases = np.array([segment.base for segment in self.segments], dtype=np.int64)
+        self.live = np.concatenate([segment.live for segment in self.segments]) if self.segments else np.zeros(0, dtype=bool)
+        # 세그먼트 max_score는 세그먼트 통계로 계산한 값이라 전역 통계(살아있는 문서 기준) 상한으로 바꿔서 쓴다.
+        # tombstone은 포스팅을 빼기만 하므로 색인 때의 최댓값이 그대로 상한이고, 바뀌는 건 idf와 평균 길이뿐
+        self.N = int(np.count_nonzero(self.live))
+        avgdl = {field: float(sum(segment.lengths[field][segment.live].sum() for segment in self.segments) / self.N) if self.N else 0.0
+                 for field in FIELDS}
+        for segment in self.segments:
+            segment.tf_scale = tf_scale(segment.avgdl, avgdl)
+        self.lookup = lru_cache(maxsize=1024)(self._lookup)
+        self.closed = False
+
+        self.doc_table = SegmentedDocTable(self)
+        self.term_dict = SegmentedTermDict(self)
+        self.postings = SegmentedPostingsReader(self)
+        self.positions = SegmentedPositionsReader(self) if all(s.positions is not None for s in self.segments) else None
+        self.docstore = SegmentedDocStore(self) if all(s.docstore is not None for s in self.segments) else None
+
+    def segment_of(self, doc_id):
+        segment = self.segments[int(np.searchsorted(self.bases, doc_id, side="right")) - 1]
+        return segment, int(doc_id) - segment.base
+
+    def _lookup(self, term):
+        # 세그먼트별 사전 항목만 모은다. 포스팅은 read / probe 할 때 세그먼트별로 디코딩 (여기서는 안 읽음)
+        # df는 삭제된 문서 중 이 term이 나오는 것만 probe로 찾아서 뺀다 (tombstone이 걸린 skip 블록만 디코딩)
+        parts = []
+        df = 0
+        for segment in self.segments:
+            entry = segment.term_dict.get(term)
+            if entry is None:
+                continue
+            live_df = entry["df"] - (len(segment.postings.probe(entry, segment.deleted)) if len(segment.deleted) else 0)
+            if not live_df: # 삭제된 문서에만 있는 term
+                continue
+            parts.append((segment, entry))
+            df += live_df
+        if not parts:
+            return None
+        entry = {"df": df, "parts": parts}
+        if all("pos_start" in part_entry for _, part_entry in parts):
+            entry["pos_start"] = [part_entry["pos_start"] for _, part_entry in parts]
+        bounds = [self.max_score(segment, part_entry, df) for segment, part_entry in parts]
+        if None not in bounds:
+            entry["max_score"] = max(bounds)
+        return entry
+
+    def max_score(self, segment, entry, df):
+        # 세그먼트 term 항목의 max_score -> 전역 df / N / 평균 길이 기준 상한 (없으면 None = 가지치기 X)
+        # (평균 길이가 0인 필드를 0으로 나누던 예전 세그먼트는 max_score가 nan)
+        if "max_score" not in entry or not math.isfinite(entry["max_score"]):
+            return None
+        return rescale_max_score(entry["max_score"], idf(segment.doc_count, entry["df"]), idf(self.N, df), segment.tf_scale)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.lookup.cache_clear()
+        for segment in self.segments:
+            segment.close()
+
+
+class SegmentedDocTable:
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self): # 삭제된 문서 자리도 포함한 전역 doc_id 개수
+        return int(sum(len(segment.doc_table) for segment in self.index.segments))
+
+    def __getitem__(self, doc_id):
+        segment, local_id = self.index.segment_of(doc_id)
+        doc = dict(segment.doc_table[local_id])
+        doc["doc_id"] = int(doc_id)
+        return doc
+
+    def column(self, name):
+        columns = [np.asarray(segment.doc_table.column(name)) for segment in self.index.segments]
+        return np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+
+    def close(self):
+        self.index.close()
+
+
+class SegmentedTermDict:
+    def __init__(self, index):
+        self.index = index
+
+    def __contains__(self, term):
+        return self.index.lookup(term) is not None
+
+    def __getitem__(self, term):
+        entry = self.index.lookup(term)
+        if entry is None:
+            raise KeyError(term)
+        return entry
+
+    def get(self, term, default=None):
+        entry = self.index.lookup(term)
+        return default if entry is None else entry
+
+    def prefix(self, prefix, limit=None):
+        # 세그먼트별 prefix 확장 결과를 합친다 (사전 순서)
+        terms = sorted(set(itertools.chain.from_iterable(segment.term_dict.prefix(prefix, limit) for segment in self.index.segments)))
+        return terms[:limit] if limit is not None else terms
+
+    def close(self):
+        self.index.close()
+
+
+class SegmentedPostingsReader:
+    def __init__(self, index):
+        self.index = index
+
+    def read(self, entry):
+        # 세그먼트별 포스팅에서 삭제 문서를 빼고 전역 doc_id로 이어붙인다. (세그먼트 순서 = doc_id 오름차순)
+        chunks = []
+        for segment, part_entry in entry["parts"]:
+            postings, keep = segment.read_live(part_entry)
+            kept = postings[keep] # 복사본 (doc_id를 바꿔도 mmap에 영향 없음)
+            kept["doc_id"] += segment.base
+            chunks.append(kept)
+        return np.concatenate(chunks)
+
+    def probe(self, entry, doc_ids):
+        # doc_ids(전역, 정렬됨)를 세그먼트별로 나눠서 각 세그먼트 PostingsReader의 skip 블록 탐색에 맡긴다.
+        chunks = []
+        for segment, part_entry in entry["parts"]:
+            lo, hi = np.searchsorted(doc_ids, [segment.base, segment.base + len(segment.live)])
+            if lo == hi:
+                continue
+            postings = segment.postings.probe(part_entry, (doc_ids[lo:hi] - segment.base).astype(np.int32))
+            kept = postings[segment.live[postings["doc_id"]]] # 블록 디코딩 결과라 복사본
+            kept["doc_id"] += segment.base
+            chunks.append(kept)
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=POSTING_DTYPE)
+
+    def close(self):
+        self.index.close()
+
+
+class SegmentedPositionsReader:
+    def __init__(self, index):
+        self.index = index
+
+    def read(self, entry, postings):
+        return SegmentedTermPositions(entry["parts"])
+
+    def close(self):
+        self.index.close()
+
+
+class SegmentedTermPositions:
+    # 전역 포스팅 순번 -> (세그먼트, 세그먼트 포스팅 순번) 으로 바꿔서 세그먼트의 TermPositions에 물어본다.
+    # 위치 블록이 삭제된 문서까지 포함한 포스팅 순서라서 세그먼트 포스팅을 다시 읽어 살아있는 순번을 구한다. (PHRASE 검증 때만)
+    def __init__(self, parts):
+        self.term_positions = []
+        self.kept = []
+        for segment, entry in parts:
+            postings, keep = segment.read_live(entry)
+            self.term_positions.append(segment.positions.read(entry, postings))
+            self.kept.append(np.flatnonzero(keep))
+        self.offsets = np.cumsum([0] + [len(kept) for kept in self.kept])
+
+    def get(self, posting_idx, field):
+        part = int(np.searchsorted(self.offsets, posting_idx, side="right")) - 1
+        return self.term_positions[part].get(self.kept[part][posting_idx - self.offsets[part]], field)
+
+
+class SegmentedDocStore:
+    def __init__(self, index):
+        self.index = index
+
+    def get(self, doc_id):
+        segment, local_id = self.index.segment_of(doc_id)
+        return segment.docstore.get(local_id)
+
+    def close(self):
+        self.index.close()
+
+
+def tag_items(items, segment_idx): # heapq.merge용 (term, 세그먼트 순번, 항목)
+    for term, entry in items:
+        yield term, segment_idx, entry
+
+
+def write_merged_segment(indexer, segments):
+    # segments(열린 Segment들)의 살아있는 문서를 순서대로 이어붙여 indexer.output_dir에 새 세그먼트로 쓴다.
+    # 원본 JSON은 다시 읽지 않는다. (포스팅/positions/원문은 세그먼트 파일에서 옮겨 담음)
+    # 반환값: 세그먼트별 doc_id 변환표 (삭제된 문서는 -1), 새 세그먼트 문서 수
+    remaps = []
+    new_id = 0
+    for segment in segments:
+        remap = np.full(len(segment.live), -1, dtype=np.int64)
+        live_docs = int(segment.live.sum())
+        remap[segment.live] = np.arange(new_id, new_id + live_docs)
+        remaps.append(remap)
+        new_id += live_docs
+
+    field_lengths = {"title": array('i'), "abstract": array('i'), "claims": array('i')}
+    doc_table_writer = indexer.open_doc_table_writer()
+    docstore = indexer.open_docstore()
+    for segment, remap in zip(segments, remaps):
+        for local_id in np.flatnonzero(segment.live).tolist():
+            doc = dict(segment.doc_table[local_id])
+            doc["doc_id"] = int(remap[local_id])
+            doc_table_writer.append(doc)
+            for field, lengths in field_lengths.items():
+                lengths.append(doc["len_" + field])
+            if docstore is not None:
+                fields = segment.docstore.get(local_id)
+                docstore.add(fields["title"], fields["abstract"], fields["claims"])
+    doc_table_writer.close()
+    indexer.close_docstore(docstore)
+
+    scorer = BM25FScorer(field_lengths)
+    term_dict_writer = indexer.open_term_dict_writer()
+    sources = [tag_items(segment.term_dict.sorted_items(), i) for i, segment in enumerate(segments)]
+    with indexer.open_postings() as pbin, indexer.open_positions() as posbin:
+        offset = write_header(pbin, indexer.postings_format)
+        pos_offset = 0
+        for term, items in itertools.groupby(heapq.merge(*sources, key=lambda item: item[0]), key=lambda item: item[0]):
+            chunks = []
+            pos_chunks = []
+            for _, segment_idx, entry in items: # 세그먼트 순서대로 나오므로 새 doc_id 오름차순 유지
+                segment = segments[segment_idx]
+                postings, keep = segment.read_live(entry)
+                kept = postings[keep]
+                kept["doc_id"] = remaps[segment_idx][kept["doc_id"]]
+                chunks.append(kept)
+                if indexer.positions:
+                    term_positions = segment.positions.read(entry, postings)
+                    pos_chunks.extend(term_positions.encoded(idx) for idx in np.flatnonzero(keep).tolist())
+            postings = np.concatenate(chunks)
+            if not len(postings): # 삭제된 문서에만 있던 term은 버린다
+                continue
+            data = encode_postings(postings, indexer.postings_format)
+            pbin.write(data)
+            pos_data = b"".join(pos_chunks)
+            posbin.write(pos_data)
+            term_dict_writer.add(term, indexer.term_entry(len(postings), offset, data, indexer.max_score(scorer, postings), pos_offset, pos_data))
+            offset += len(data)
+            pos_offset += len(pos_data)
+    term_dict_writer.close()
+    indexer.publish()
+    return remaps, new_id
@@ -0,0 +1,227 @@
+# src/server.py
+# 검색 서버 (asyncio HTTP/JSON)
+#
+# 부모 프로세스가 listen 소켓 하나를 열고 워커 프로세스 여러 개를 미리 띄운다(pre-fork).
+# 워커는 모두 같은 소켓에서 accept 하므로 들어오는 연결이 커널에 의해 워커들에 나눠진다.
+# 워커마다 Searcher(= Komoran + mmap 색인)를 한 번만 열고 계속 쓴다. mmap이라 색인 파일은 OS page cache를 같이 쓴다.
+# 토크나이저 풀(src/tokenizer_pool.py)을 install 한 뒤 serve 하면 워커들은 JVM 없이 풀의 분석기를 나눠 쓴다.
+# Komoran(JVM)은 fork 후에 쓸 수 없어서 워커는 spawn으로 띄우고, Searcher는 워커 안에서 import 한다.
+#
+# API
+#   GET  /search?q=...&k=5&snippets=1
+#   POST /search  {"query": "...", "k": 5, "snippets": false}
+#   POST /batch   {"queries": ["...", ...], "k": 5, "snippets": false} -> {"results": [...]}
+#   GET  /stats   워커 pid, 색인 generation, 캐시 통계
+#   GET  /metrics 단계별 시간 히스토그램 / 카운터 (계측을 켠 경우, 요청을 받은 워커 프로세스 기준)
+#   GET  /health
+import os
+import json
+import time
+import signal
+import socket
+import asyncio
+import multiprocessing
+from multiprocessing.connection import wait
+from urllib.parse import urlsplit, parse_qs
+from .metrics import metrics
+
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_BATCH = 1000
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+class SearchApp:
+    # HTTP 요청(method, path, body) -> (status, JSON 응답). 소켓/asyncio와 분리해서 그대로 호출해도 된다.
+    def __init__(self, searcher):
+        self.searcher = searcher
+        self.started = time.time()
+        self.requests = 0
+
+    def dispatch(self, method, target, body):
+        self.requests += 1
+        url = urlsplit(target)
+        try:
+            if url.path == "/search":
+                if method == "GET":
+                    params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                    params["query"] = params.pop("q", params.get("query", ""))
+                elif method == "POST":
+                    params = self.load_json(body)
+                else:
+                    return 405, {"error": "method not allowed"}
+                return 200, self.search(params)
+            if url.path == "/batch":
+                if method != "POST":
+                    return 405, {"error": "method not allowed"}
+                params = self.load_json(body)
+                queries = params.get("queries")
+                if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+                    raise BadRequest("'queries' must be a list of strings")
+                if len(queries) > MAX_BATCH:
+                    raise BadRequest(f"too many queries (max {MAX_BATCH})")
+                return 200, {"results": [self.search(dict(params, query=query)) for query in queries]}
+            if url.path == "/stats":
+                return 200, {"pid": os.getpid(), "generation": self.searcher.generation, "documents": self.searcher.N,
+                             "requests": self.requests, "uptime": time.time() - self.started, "cache": self.searcher.cache_stats()}
+            if url.path == "/metrics":
+                return 200, dict(metrics.snapshot(), pid=os.getpid())
+            if url.path == "/health":
+                return 200, {"status": "ok", "pid": os.getpid()}
+            return 404, {"error": "not found"}
+        except BadRequest as e:
+            return 400, {"error": str(e)}
+        except Exception as e: # 검색 중 오류는 워커를 죽이지 않고 500으로 응답
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    def load_json(self, body):
+        try:
+            params = json.loads(body.decode('utf8') or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise BadRequest(f"invalid JSON body: {e}")
+        if not isinstance(params, dict):
+            raise BadRequest("JSON body must be an object")
+        return params
+
+    def search(self, params):
+        query = params.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise BadRequest("'query' is required")
+        try:
+            k = int(params.get("k", 5))
+        except (TypeError, ValueError):
+            raise BadRequest("'k' must be an integer")
+        if k < 1:
+            raise BadRequest("'k' must be positive")
+        return self.searcher.search(query.strip(), k, snippets=parse_bool(params.get("snippets", False)))
+
+
+async def handle_connection(app, reader, writer):
+    # HTTP/1.1 keep-alive 연결 하나 처리. 검색은 CPU 작업이라 워커 안에서는 요청을 순서대로 처리한다. (병렬성은 워커 수로)
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, version = (part.decode('latin1') for part in request_line.split())
+            except ValueError:
+                await send_response(writer, 400, {"error": "malformed request line"}, False)
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode('latin1').partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get("content-length", 0) or 0)
+            except ValueError:
+                length = -1
+            if length < 0 or length > MAX_BODY_BYTES:
+                await send_response(writer, 413 if length > 0 else 400, {"error": "bad content-length"}, False)
+                break
+            body = await reader.readexactly(length) if length else b""
+
+            status, payload = app.dispatch(method.upper(), target, body)
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            await send_response(writer, status, payload, keep_alive)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def send_response(writer, status, payload, keep_alive):
+    data = json.dumps(payload, ensure_ascii=False).encode('utf8')
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin1') + data)
+    await writer.drain()
+
+
+def serve_worker(sock, index_dir, doc_table_file, term_dict_file, postings_file, searcher_kwargs, metrics_options):
+    # 워커 프로세스 본체. Searcher는 여기서 import (풀을 안 쓰면 Komoran은 워커마다 따로 뜸)
+    from .searcher import Searcher
+    from .shards import ShardedSearcher, load_manifest
+    from .tokenizer import warmup
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C는 부모가 받아서 워커를 정리한다
+    if metrics_options is not None:
+        metrics.enable(**metrics_options)
+    # 샤드 색인이면 워커마다 coordinator (샤드 워커 프로세스를 따로 띄움)
+    searcher_class = ShardedSearcher if load_manifest(index_dir) is not None else Searcher
+    searcher = searcher_class(index_dir, doc_table_file, term_dict_file, postings_file, **searcher_kwargs)
+    app = SearchApp(searcher)
+    warmup() # 첫 요청이 분석기 시작(JVM)을 기다리지 않게
+
+    async def main():
+        server = await asyncio.start_server(lambda reader, writer: handle_connection(app, reader, writer), sock=sock)
+        print(f"worker {os.getpid()} ready")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    finally:
+        searcher.close()
+
+
+def serve(index_dir, doc_table_file, term_dict_file, postings_file, host="127.0.0.1", port=8000, workers=None, metrics_options=None, **searcher_kwargs):
+    # 검색 서버 실행 (Ctrl+C / SIGTERM으로 종료). 죽은 워커는 다시 띄운다.
+    # metrics_options를 주면 워커마다 계측을 켠다. ex) {"slow_query_ms": 100, "slow_query_log": "slow_queries.log"}
+    workers = workers or os.cpu_count() or 1
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    print(f"search server : http://{host}:{sock.getsockname()[1]} (workers {workers})")
+
+    ctx = multiprocessing.get_context("spawn")
+    args = (sock, os.path.abspath(index_dir), doc_table_file, term_dict_file, postings_file, searcher_kwargs, metrics_options)
+
+    def start_worker():
+        # 샤드 색인이면 워커가 샤드 워커 프로세스를 띄워야 해서 daemon으로 안 띄운다 (종료는 아래 finally에서)
+        process = ctx.Process(target=serve_worker, args=args)
+        process.start()
+        return process
+
+    processes = [start_worker() for _ in range(workers)]
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    previous = signal.signal(signal.SIGTERM, stop)
+    try:
+        while not stopping:
+            wait([process.sentinel for process in processes], timeout=1.0)
+            for i, process in enumerate(processes):
+                if not process.is_alive() and not stopping:
+                    print(f"worker {process.pid} exited ({process.exitcode}), restarting")
+                    processes[i] = start_worker()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        sock.close()
+        print("search server stopped")
@@ -0,0 +1,286 @@
+# src/shards.py
+# 샤드 색인 + scatter-gather 병렬 검색
+#
+# index_dir/
+#   shards.json        : manifest {"generation", "doc_count", "field_lengths": {필드: 전체 길이 합}, "shards": [{"name", "doc_count"}, ...]}
+#   global_terms.bin   : 전체 색인의 단어 사전 (term -> 전체 df). term_dict.bin과 같은 포맷 (start는 안 씀)
+#   shard_000/         : 샤드 하나 = 보통 색인과 같은 파일들 (postings.bin, term_dict.bin, doc_table.bin, positions.bin, docstore.bin)
+#     global_ids.bin   : 샤드 내 doc_id -> 전체 doc_id (int32 오름차순)
+#
+# 문서는 파일 순서대로 샤드에 돌아가며 나눠 담는다. 전체 doc_id는 샤드를 나누지 않은 색인과 똑같이 매긴다.
+# 점수는 전체 통계(N, 필드 평균 길이, df)로 매기고, 샤드 term_dict의 max_score도 전체 통계로 다시 계산해 두므로
+# 샤드마다 MaxScore 가지치기를 그대로 쓰면서 나누지 않은 색인과 같은 점수가 나온다.
+#
+# 검색 (ShardedSearcher = coordinator)
+#   1) coordinator가 검색어를 분석하고 (와일드카드는 global_terms에서 확장) term별 전체 df를 붙여서
+#   2) 샤드 워커 프로세스(원격 노드 대신)들에 동시에 보내면 샤드마다 자기 top-k를 (전체 doc_id, 점수, 처음 점수 받은 term 순번)으로 돌려주고
+#   3) coordinator가 (점수 내림차순, term 순번, doc_id) 순으로 합쳐서 top-k를 고른다. -> 단일 색인 select_top과 같은 순서
+#   4) 결과 문서가 있는 샤드에만 파일 이름/스니펫을 받아온다.
+import os
+import json
+import heapq
+import shutil
+import itertools
+import multiprocessing
+import numpy as np
+from .bm25f import BM25FScorer, FIELDS, idf
+from .postings import PostingsReader
+from .term_dict import BinaryTermDict, TermDictWriter, binary_path
+from .doc_table import load_doc_table
+from .searcher import Searcher
+from .metrics import metrics
+
+MANIFEST_FILE = "shards.json"
+GLOBAL_TERMS_FILE = "global_terms.bin"
+GLOBAL_IDS_FILE = "global_ids.bin"
+
+
+def shard_name(number):
+    return f"shard_{number:03d}"
+
+
+def manifest_path(index_dir):
+    return os.path.join(index_dir, MANIFEST_FILE)
+
+
+def load_manifest(index_dir): # 샤드 색인이 아니면 None
+    path = manifest_path(index_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(index_dir, manifest):
+    tmp_path = manifest_path(index_dir) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path(index_dir)) # 원자적으로 교체
+
+
+def clear_shards(index_dir):
+    manifest = load_manifest(index_dir)
+    if manifest is None:
+        return
+    os.remove(manifest_path(index_dir))
+    global_terms = os.path.join(index_dir, GLOBAL_TERMS_FILE)
+    if os.path.exists(global_terms):
+        os.remove(global_terms)
+    for info in manifest["shards"]:
+        shutil.rmtree(os.path.join(index_dir, info["name"]), ignore_errors=True)
+
+
+def tag_items(items, shard_idx): # heapq.merge용 (term, 샤드 순번, 항목)
+    for term, entry in items:
+        yield term, shard_idx, entry
+
+
+def finish_shards(indexer, shard_indexers, file_list, generation):
+    # 샤드들을 다 색인한 뒤 전체 통계를 모은다.
+    # 1) 전체 doc_id 표 (색인 순서 = file_list 순서, 읽기 실패한 파일은 건너뜀 -> 단일 색인과 같은 번호)
+    doc_tables = [load_doc_table(shard.doc_table_file) for shard in shard_indexers]
+    global_ids = [[] for _ in shard_indexers]
+    next_local = [0] * len(shard_indexers)
+    doc_count = 0
+    for file_idx, (_, file_path) in enumerate(file_list):
+        shard_idx = file_idx % len(shard_indexers)
+        local_id = next_local[shard_idx]
+        if local_id < len(doc_tables[shard_idx]) and doc_tables[shard_idx][local_id]["path"] == file_path:
+            global_ids[shard_idx].append(doc_count)
+            next_local[shard_idx] += 1
+            doc_count += 1
+    for shard, ids in zip(shard_indexers, global_ids):
+        np.asarray(ids, dtype="<i4").tofile(os.path.join(shard.output_dir, GLOBAL_IDS_FILE))
+
+    # 2) 전체 N / 필드 길이 합
+    stats = {"doc_count": doc_count,
+             "field_lengths": {field: sum(int(table.column("len_" + field).sum(dtype=np.int64)) for table in doc_tables) for field in FIELDS}}
+    scorers = [BM25FScorer({field: table.column("len_" + field) for field in FIELDS}, stats=stats) for table in doc_tables]
+
+    # 3) 샤드 사전들을 term 순서로 합치면서 전체 df를 쓰고, 샤드마다 max_score를 전체 통계로 다시 계산
+    binary_paths = [binary_path(shard.term_dict_file) for shard in shard_indexers]
+    term_dicts = [BinaryTermDict(path) for path in binary_paths]
+    postings = [PostingsReader(shard.postings_file) for shard in shard_indexers]
+    writers = [TermDictWriter(path + ".tmp", term_dict.flags) for path, term_dict in zip(binary_paths, term_dicts)]
+    global_writer = TermDictWriter(os.path.join(indexer.output_dir, GLOBAL_TERMS_FILE), 0)
+    sources = [tag_items(term_dict.sorted_items(), i) for i, term_dict in enumerate(term_dicts)]
+    for term, items in itertools.groupby(heapq.merge(*sources, key=lambda item: item[0]), key=lambda item: item[0]):
+        items = list(items)
+        df = sum(entry["df"] for _, _, entry in items)
+        global_writer.add(term, {"df": df, "start": 0})
+        for _, shard_idx, entry in items:
+            entry = dict(entry)
+            entry["max_score"] = indexer.max_score(scorers[shard_idx], postings[shard_idx].read(entry), df)
+            writers[shard_idx].add(term, entry)
+    global_writer.close()
+    for writer in writers:
+        writer.close()
+    for reader in doc_tables + term_dicts + postings:
+        reader.close()
+    for path in binary_paths:
+        os.replace(path + ".tmp", path)
+
+    manifest = {"generation": generation, "doc_count": doc_count, "field_lengths": stats["field_lengths"],
+                "shards": [{"name": os.path.basename(shard.output_dir), "doc_count": len(ids)} for shard, ids in zip(shard_indexers, global_ids)]}
+    save_manifest(indexer.output_dir, manifest)
+    return manifest
+
+
+class ShardSearcher(Searcher):
+    # 샤드 워커 안의 Searcher. 점수는 전체 통계로 매기고 결과에 전체 doc_id / 처음 점수 받은 term 순번을 붙인다.
+    def __init__(self, shard_dir, doc_table_file, term_dict_file, postings_file, stats, pruning=True, postings_cache_size=256):
+        self.stats = stats
+        self.global_df = {} # 검색어마다 coordinator가 보내는 term별 전체 df
+        super().__init__(shard_dir, doc_table_file, term_dict_file, postings_file, pruning,
+                         query_cache_size=0, postings_cache_size=postings_cache_size, result_cache_size=0)
+
+    def open_index(self):
+        super().open_index()
+        self.scorer = BM25FScorer({field: self.doc_table.column("len_" + field) for field in FIELDS}, self.live, self.stats)
+        self.N = self.scorer.N
+        self.global_ids = np.fromfile(os.path.join(self.index_dir, GLOBAL_IDS_FILE), dtype="<i4")
+
+    def term_idf(self, term):
+        return idf(self.N, self.global_df[term])
+
+    def select_top(self, doc_scores, first_seen, matched, k):
+        # 샤드끼리 동점 순서를 맞추려면 term 순번이 필요하다
+        return [(doc_id, score, int(first_seen[doc_id])) for doc_id, score in super().select_top(doc_scores, first_seen, matched, k)]
+
+    def match(self, query_terms, clean_query, is_and_query, is_phrase_query, target_fields, k, global_df):
+        # -> (샤드 안의 총 문서 수, top-k [(전체 doc_id, 점수, term 순번)])
+        self.global_df = global_df
+        total, top = self.match_terms(query_terms, clean_query, is_and_query, is_phrase_query, target_fields, k)
+        return total, [(int(self.global_ids[doc_id]), score, term_idx) for doc_id, score, term_idx in top]
+
+
+def shard_worker(conn, shard_dir, doc_table_file, term_dict_file, postings_file, stats, options):
+    # 샤드 워커 프로세스 본체. (메서드 이름, 인자) 요청을 받아서 ("ok", 결과) / ("error", 메시지)로 답한다. None이면 종료
+    try:
+        searcher = ShardSearcher(shard_dir, doc_table_file, term_dict_file, postings_file, stats, **options)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ok", None)) # 준비 완료
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            if request is None:
+                return
+            method, args = request
+            try:
+                conn.send(("ok", getattr(searcher, method)(*args)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        searcher.close()
+
+
+class ShardedSearcher(Searcher):
+    # coordinator. 검색어 분석 / 결과 캐시는 여기서, 포스팅 읽기와 점수 계산은 샤드 워커들이 동시에 한다.
+    # search() / process_query() / 캐시 / refresh는 Searcher 그대로 (색인 generation은 shards.json 기준)
+    def __init__(self, index_dir, doc_table_file, term_dict_file, postings_file, pruning=True,
+                 query_cache_size=1024, postings_cache_size=256, result_cache_size=1024, refresh_interval=1.0):
+        self.shard_options = {"pruning": pruning, "postings_cache_size": postings_cache_size} # 포스팅 캐시는 샤드 워커마다
+        self.processes = []
+        self.conns = []
+        super().__init__(index_dir, doc_table_file, term_dict_file, postings_file, pruning,
+                         query_cache_size=query_cache_size, postings_cache_size=0, result_cache_size=result_cache_size,
+                         refresh_interval=refresh_interval)
+
+    def open_index(self):
+        manifest = load_manifest(self.index_dir)
+        self.generation = manifest["generation"]
+        self.N = manifest["doc_count"]
+        self.term_dict = BinaryTermDict(os.path.join(self.index_dir, GLOBAL_TERMS_FILE))
+        stats = {"doc_count": manifest["doc_count"], "field_lengths": manifest["field_lengths"]}
+        # 전체 doc_id -> (샤드 순번, 샤드 내 doc_id). 결과 파일 이름/스니펫을 가진 샤드에 물어볼 때
+        self.owner = np.zeros(self.N, dtype=np.int32)
+        self.local_ids = np.zeros(self.N, dtype=np.int64)
+        # 샤드마다 워커 프로세스 하나 (Komoran과 같이 spawn. 샤드 워커는 형태소 분석을 안 해서 JVM이 안 뜸)
+        ctx = multiprocessing.get_context("spawn")
+        for shard_idx, info in enumerate(manifest["shards"]):
+            shard_dir = os.path.join(self.index_dir, info["name"])
+            ids = np.fromfile(os.path.join(shard_dir, GLOBAL_IDS_FILE), dtype="<i4")
+            self.owner[ids] = shard_idx
+            self.local_ids[ids] = np.arange(len(ids))
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=shard_worker, daemon=True,
+                                  args=(child_conn, shard_dir, os.path.basename(self.doc_table_file), os.path.basename(self.term_dict_file),
+                                        os.path.basename(self.postings_file), stats, self.shard_options))
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+            self.conns.append(parent_conn)
+        self.gather(range(len(self.conns))) # 전부 색인을 열 때까지 기다림 (못 열면 여기서 에러)
+
+    def current_generation(self):
+        manifest = load_manifest(self.index_dir)
+        return manifest["generation"] if manifest is not None else 0
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.conns:
+            conn.close()
+        self.processes = []
+        self.conns = []
+        if self.term_dict is not None:
+            self.term_dict.close()
+            self.term_dict = None
+
+    def gather(self, shard_ids):
+        # 요청을 보낸 샤드들의 답을 순서대로 받는다. 하나가 실패해도 나머지 답은 다 받아서 연결이 어긋나지 않게
+        replies = [self.conns[shard_idx].recv() for shard_idx in shard_ids]
+        for status, value in replies:
+            if status != "ok":
+                raise RuntimeError(f"shard search failed: {value}")
+        return [value for _, value in replies]
+
+    def scatter(self, calls):
+        # calls: [(샤드 순번, 메서드 이름, 인자)] -> 전부 보낸 뒤 모아서 받으므로 샤드들이 동시에 검색한다
+        for shard_idx, method, args in calls:
+            self.conns[shard_idx].send((method, args))
+        return self.gather([shard_idx for shard_idx, _, _ in calls])
+
+    def match_terms(self, query_terms, clean_query, is_and_query, is_phrase_query, target_fields, k=5):
+        if is_and_query and any(term not in self.term_dict for term in query_terms): # 어느 샤드에도 없는 단어
+            return 0, []
+        global_df = {term: self.term_dict[term]["df"] for term in dict.fromkeys(query_terms) if term in self.term_dict}
+        if not global_df:
+            return 0, []
+        args = (query_terms, clean_query, is_and_query, is_phrase_query, target_fields, k, global_df)
+        with metrics.timer("query.shards"):
+            replies = self.scatter([(shard_idx, "match", args) for shard_idx in range(len(self.conns))])
+        # 샤드별 top-k를 합쳐서 전체 top-k (점수 내림차순 -> 처음 점수 받은 term 순번 -> doc_id 순)
+        total = sum(shard_total for shard_total, _ in replies)
+        hits = heapq.nsmallest(k, (hit for _, top in replies for hit in top), key=lambda hit: (-hit[1], hit[2], hit[0]))
+        return total, [(doc_id, score) for doc_id, score, _ in hits]
+
+    def build_results(self, top_doc_scores, query_terms, clean_query, mode, target_fields, snippets):
+        # 결과 문서를 가진 샤드에만 (샤드 내 doc_id로) 물어보고 전체 doc_id로 바꿔서 원래 순서대로
+        groups = {}
+        for rank, (doc_id, score) in enumerate(top_doc_scores):
+            groups.setdefault(int(self.owner[doc_id]), []).append((rank, int(self.local_ids[doc_id]), score))
+        calls = [(shard_idx, "build_results", ([(local_id, score) for _, local_id, score in docs], query_terms, clean_query, mode, target_fields, snippets))
+                 for shard_idx, docs in groups.items()]
+        with metrics.timer("query.fetch"):
+            replies = self.scatter(calls)
+        results = [None] * len(top_doc_scores)
+        for docs, items in zip(groups.values(), replies):
+            for (rank, _, _), item in zip(docs, items):
+                item["doc_id"] = top_doc_scores[rank][0]
+                results[rank] = item
+        return results
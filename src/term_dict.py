@@ -0,0 +1,243 @@
+# src/term_dict.py
+# 단어 사전 (term_dict.json / term_dict.bin)
+#
+# term_dict.bin : 정렬 + prefix 압축(front coding)된 바이너리 사전. mmap 해서 필요할 때만 읽는다.
+#   [헤더 8바이트]  b"TRSL" + version(1) + flags(1) + 예약(2)
+#   [블록들]        term BLOCK_TERMS개씩. 블록 첫 term은 전체 저장, 나머지는 앞 term과 겹치는 prefix 길이 + 나머지 bytes.
+#                   term마다 뒤에 항목 값(df, start, bytes, pos_start, pos_bytes는 varint, max_score는 float64)
+#   [블록 offset 표] 블록 시작 위치 uint64 배열 (sparse index. 블록 첫 term으로 이진 탐색)
+#   [footer 16바이트] offset 표 위치(uint64) + term 수(uint32) + BLOCK_TERMS(uint32)
+# 메모리에 올라가는 건 최근에 찾아본 term 몇 개뿐이라 term 수가 늘어도 시작 시간/메모리가 거의 그대로다.
+import os
+import json
+import bisect
+import struct
+from functools import lru_cache
+import numpy as np
+from .postings import MappedFile, encode_varint
+
+MAGIC = b"TRSL"
+VERSION = 1
+HEADER_SIZE = 8
+FOOTER_FORMAT = "<QII"
+FOOTER_SIZE = struct.calcsize(FOOTER_FORMAT)
+BLOCK_TERMS = 16
+
+# flags: 항목에 어떤 값이 들어있는지 (색인 옵션에 따라 다름)
+FLAG_BYTES = 1 # varint 포스팅 포맷의 블록 길이
+FLAG_POSITIONS = 2 # positions.bin 위치
+FLAG_MAX_SCORE = 4
+
+
+def binary_path(path): # term_dict.json -> term_dict.bin
+    return os.path.splitext(path)[0] + ".bin"
+
+
+def read_varint(buf, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class TermDictWriter:
+    # term을 정렬된 순서(파이썬 문자열 순서 = utf8 바이트 순서)로 add() 해야 한다.
+    def __init__(self, path, flags):
+        self.f = open(path, 'wb')
+        self.f.write(MAGIC + struct.pack("<BBH", VERSION, flags, 0))
+        self.flags = flags
+        self.offset = HEADER_SIZE
+        self.offsets = []
+        self.count = 0
+        self.prev = b""
+
+    def add(self, term, entry):
+        term_bytes = term.encode('utf8')
+        if self.count and term_bytes <= self.prev:
+            raise ValueError(f"Terms must be added in sorted order: {term}")
+        out = bytearray()
+        if self.count % BLOCK_TERMS == 0: # 블록 시작: term 전체 저장
+            self.offsets.append(self.offset)
+            encode_varint(len(term_bytes), out)
+            out += term_bytes
+        else: # 앞 term과 겹치는 prefix 길이 + 나머지만 저장
+            shared = 0
+            limit = min(len(term_bytes), len(self.prev))
+            while shared < limit and term_bytes[shared] == self.prev[shared]:
+                shared += 1
+            encode_varint(shared, out)
+            encode_varint(len(term_bytes) - shared, out)
+            out += term_bytes[shared:]
+
+        encode_varint(entry["df"], out)
+        encode_varint(entry["start"], out)
+        if self.flags & FLAG_BYTES:
+            encode_varint(entry["bytes"], out)
+        if self.flags & FLAG_POSITIONS:
+            encode_varint(entry["pos_start"], out)
+            encode_varint(entry["pos_bytes"], out)
+        if self.flags & FLAG_MAX_SCORE:
+            out += struct.pack("<d", entry["max_score"])
+
+        self.f.write(out)
+        self.offset += len(out)
+        self.prev = term_bytes
+        self.count += 1
+
+    def close(self):
+        self.f.write(np.array(self.offsets, dtype="<u8").tobytes())
+        self.f.write(struct.pack(FOOTER_FORMAT, self.offset, self.count, BLOCK_TERMS))
+        self.f.close()
+
+
+class BinaryTermDict(MappedFile):
+    # json에서 읽은 dict처럼 쓸 수 있게 in / [] / get / len 지원. (term -> {"df", "start", ...})
+    def __init__(self, path):
+        super().__init__(path)
+        if bytes(self.buf[:4]) != MAGIC:
+            raise ValueError(f"Not a term dictionary file: {path}")
+        self.data = self.mm # mmap 객체 그대로 인덱싱하면 int, 슬라이싱하면 bytes (numpy 스칼라보다 빠름)
+        self.flags = self.data[5]
+        table_offset, self.count, self.block_terms = struct.unpack(FOOTER_FORMAT, bytes(self.buf[-FOOTER_SIZE:]))
+        block_count = (self.count + self.block_terms - 1) // self.block_terms
+        self.offsets = np.frombuffer(self.buf, dtype="<u8", count=block_count, offset=table_offset)
+        self.lookup = lru_cache(maxsize=4096)(self._lookup) # 자주 찾는 term은 캐싱
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, term):
+        return self.lookup(term) is not None
+
+    def __getitem__(self, term):
+        entry = self.lookup(term)
+        if entry is None:
+            raise KeyError(term)
+        return entry
+
+    def get(self, term, default=None):
+        entry = self.lookup(term)
+        return default if entry is None else entry
+
+    def block_first_term(self, block_idx):
+        pos = int(self.offsets[block_idx])
+        length, pos = read_varint(self.data, pos)
+        return self.data[pos:pos + length]
+
+    def find_block(self, term_bytes):
+        # term_bytes가 들어있을 수 있는 블록 = 첫 term이 term_bytes 이하인 마지막 블록 (이진 탐색)
+        lo, hi = 0, len(self.offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.block_first_term(mid) <= term_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def iter_block(self, block_idx):
+        # 블록 안의 (term bytes, 항목) 을 순서대로
+        pos = int(self.offsets[block_idx])
+        n = min(self.block_terms, self.count - block_idx * self.block_terms)
+        buf = self.data
+        term_bytes = b""
+        for i in range(n):
+            if i == 0:
+                length, pos = read_varint(buf, pos)
+                term_bytes = buf[pos:pos + length]
+                pos += length
+            else:
+                shared, pos = read_varint(buf, pos)
+                length, pos = read_varint(buf, pos)
+                term_bytes = term_bytes[:shared] + buf[pos:pos + length]
+                pos += length
+            df, pos = read_varint(buf, pos)
+            start, pos = read_varint(buf, pos)
+            entry = {"df": df, "start": start, "length": df}
+            if self.flags & FLAG_BYTES:
+                entry["bytes"], pos = read_varint(buf, pos)
+            if self.flags & FLAG_POSITIONS:
+                entry["pos_start"], pos = read_varint(buf, pos)
+                entry["pos_bytes"], pos = read_varint(buf, pos)
+            if self.flags & FLAG_MAX_SCORE:
+                (entry["max_score"],) = struct.unpack_from("<d", buf, pos)
+                pos += 8
+            yield term_bytes, entry
+
+    def _lookup(self, term):
+        term_bytes = term.encode('utf8')
+        block_idx = self.find_block(term_bytes)
+        if block_idx < 0:
+            return None
+        for candidate, entry in self.iter_block(block_idx):
+            if candidate == term_bytes:
+                return entry
+            if candidate > term_bytes:
+                break
+        return None
+
+    def sorted_items(self):
+        # (term, 항목) 전체를 사전 순서로 (세그먼트 merge용)
+        for block_idx in range(len(self.offsets)):
+            for term_bytes, entry in self.iter_block(block_idx):
+                yield term_bytes.decode('utf8'), entry
+
+    def prefix(self, prefix, limit=None):
+        # prefix로 시작하는 term 목록 (사전 순서). 와일드카드 검색어 확장용
+        prefix_bytes = prefix.encode('utf8')
+        terms = []
+        block_idx = max(self.find_block(prefix_bytes), 0)
+        while block_idx < len(self.offsets):
+            for term_bytes, _ in self.iter_block(block_idx):
+                if term_bytes < prefix_bytes:
+                    continue
+                if not term_bytes.startswith(prefix_bytes):
+                    return terms
+                terms.append(term_bytes.decode('utf8'))
+                if limit is not None and len(terms) >= limit:
+                    return terms
+            block_idx += 1
+        return terms
+
+    def close(self):
+        self.lookup.cache_clear()
+        self.offsets = None
+        self.data = None
+        super().close()
+
+
+class JsonTermDict(dict):
+    # 예전 term_dict.json 용. dict 그대로 쓰고 prefix 확장만 정렬된 term 목록으로 처리
+    sorted_terms = None
+
+    def sorted_items(self):
+        for term in sorted(self):
+            yield term, self[term]
+
+    def prefix(self, prefix, limit=None):
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self)
+        terms = []
+        for term in self.sorted_terms[bisect.bisect_left(self.sorted_terms, prefix):]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            if limit is not None and len(terms) >= limit:
+                break
+        return terms
+
+    def close(self):
+        pass
+
+
+def load_term_dict(path):
+    # term_dict.bin이 있으면 바이너리 사전(mmap), 없으면 json
+    if os.path.exists(binary_path(path)):
+        return BinaryTermDict(binary_path(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return JsonTermDict(json.load(f))
@@ -0,0 +1,134 @@
+# src/token_cache.py
+# 형태소 분석 결과 캐시 (token_cache.db, sqlite)
+# 색인 비용 대부분이 Komoran이라, 필드 텍스트가 그대로면 예전에 뽑은 term 리스트를 다시 쓴다.
+#
+# key   = sha1(토크나이저 fingerprint + 필드 이름 + 필드 텍스트)  -> 내용이 같으면 파일 경로/이름이 달라도 재사용
+# value = "\n".join(terms) + "\0" + ",".join(위치들)을 zlib 압축한 bytes (위치 = tokenizer.select_positions, PHRASE 색인용)
+# 토크나이저나 품사 필터가 바뀌면 fingerprint가 달라져서 캐시를 통째로 비운다.
+# 전체 크기가 max_bytes를 넘으면 가장 오래 안 쓴 항목부터 지운다. (used = 마지막으로 쓴 시각)
+#
+# 워커 프로세스는 읽기 전용으로 열어서 조회만 하고, 새로 분석한 결과/조회된 key는 부모 프로세스가 모아서 한 번에 쓴다.
+import time
+import zlib
+import sqlite3
+import hashlib
+from .tokenizer import extract_terms_batch, fingerprint
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024 # 1GB
+FLUSH_EVERY = 1000 # 부모 프로세스가 이만큼 모이면 한 번에 commit
+
+
+def encode_terms(terms, positions):
+    return zlib.compress(("\n".join(terms) + "\0" + ",".join(map(str, positions))).encode('utf8'))
+
+
+def decode_terms(blob):
+    # -> (terms, 위치들)
+    terms, _, positions = zlib.decompress(blob).decode('utf8').partition("\0")
+    return (terms.split("\n") if terms else []), ([int(p) for p in positions.split(",")] if positions else [])
+
+
+class TokenCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, readonly=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint()
+        self.hits = []
+        self.new = []
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+            return
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL") # 워커가 읽는 동안 부모가 쓸 수 있게
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tokens (key BLOB PRIMARY KEY, terms BLOB, size INTEGER, used INTEGER)")
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+        if row is None or row[0] != self.fingerprint: # 토크나이저가 바뀜 -> 예전 결과는 못 씀
+            if row is not None:
+                print("tokenizer changed : token cache 초기화")
+            self.conn.execute("DELETE FROM tokens")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+        self.conn.commit()
+
+    def key(self, field, text):
+        return hashlib.sha1("\0".join((self.fingerprint, field, text)).encode('utf8')).digest()
+
+    def lookup(self, key):
+        row = self.conn.execute("SELECT terms FROM tokens WHERE key = ?", (key,)).fetchone()
+        return decode_terms(row[0]) if row else None
+
+    def extract_terms_batch(self, items, pendings, positions=False):
+        # items = [(필드 이름, 텍스트), ...]. 캐시에 있으면 그대로, 없는 것만 모아서 한 번에 형태소 분석.
+        # pendings[i] = items[i] 문서의 {"hits": [...], "new": [...]} (부모가 캐시에 쓸 내용)
+        # 위치는 positions 색인 여부와 상관없이 같이 저장한다. (positions=True 이면 (terms, 위치들)로 돌려줌)
+        keys = [self.key(field, text) for field, text in items]
+        results = [self.lookup(key) for key in keys]
+        missing = []
+        for i, analyzed in enumerate(results):
+            if analyzed is None:
+                missing.append(i)
+            else:
+                pendings[i]["hits"].append(keys[i])
+        for i, analyzed in zip(missing, extract_terms_batch([items[i][1] for i in missing], positions=True)):
+            results[i] = analyzed
+            pendings[i]["new"].append((keys[i], encode_terms(*analyzed)))
+        return results if positions else [terms for terms, _ in results]
+
+    def record(self, pending):
+        # 워커에서 온 pending을 모았다가 FLUSH_EVERY개마다 commit
+        self.hits.extend(pending["hits"])
+        self.new.extend(pending["new"])
+        if len(self.hits) + len(self.new) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        now = time.time_ns()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)",
+                                  [(key, blob, len(key) + len(blob), now) for key, blob in self.new])
+            self.conn.executemany("UPDATE tokens SET used = ? WHERE key = ?", [(now, key) for key in self.hits])
+        self.hits = []
+        self.new = []
+
+    def evict(self):
+        # 크기 제한을 넘으면 오래 안 쓴 항목부터 지워서 max_bytes의 90%까지 줄인다
+        (total,) = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM tokens").fetchone()
+        if total <= self.max_bytes:
+            return 0
+        target = total - int(self.max_bytes * 0.9)
+        removed = 0
+        keys = []
+        cursor = self.conn.execute("SELECT key, size FROM tokens ORDER BY used")
+        for key, size in cursor:
+            if removed >= target:
+                break
+            keys.append((key,))
+            removed += size
+        cursor.close()
+        with self.conn:
+            self.conn.executemany("DELETE FROM tokens WHERE key = ?", keys)
+        self.conn.execute("VACUUM") # 파일 크기도 실제로 줄이기
+        print(f"token cache eviction : {len(keys)}개 삭제")
+        return len(keys)
+
+    def close(self):
+        if self.hits or self.new:
+            self.flush()
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)") # WAL 내용을 본 파일로 옮기고 WAL 비우기
+        self.conn.close()
+
+
+_readers = {} # 워커 프로세스 안에서 path별로 한 번만 연다 (직렬 색인이면 부모 프로세스 안)
+
+
+def open_reader(path):
+    if path not in _readers:
+        _readers[path] = TokenCache(path, readonly=True)
+    return _readers[path]
+
+
+def close_readers():
+    # 직렬 색인은 부모 프로세스에서 읽기 연결을 열기 때문에 쓰기 연결보다 먼저 닫아야 WAL 파일이 남지 않는다
+    for reader in _readers.values():
+        reader.conn.close()
+    _readers.clear()
@@ -1,8 +1,131 @@
 # src/tokenizer.py
-from konlpy.tag import Komoran
+# 형태소 분석기 backend. TOKENIZER_BACKEND 환경변수로 고른다. (환경변수라서 spawn으로 뜨는 색인 워커 / 검색 서버 워커도 같은 backend를 쓴다)
+#   komoran : KoNLPy Komoran (기본)
+#   simple  : 공백/문자 종류로만 자르는 대체 분석기. JVM 없이 빠르게 돌아서 벤치마크(bench/)에서 Komoran 비용을 뺄 때 쓴다.
+#   pool    : 토크나이저 풀 서비스(src/tokenizer_pool.py)에 보내서 분석. 여러 프로세스가 풀의 분석기 몇 개를 나눠 쓴다.
+#
+# 분석기는 처음 분석할 때 만든다. (import만 해서는 JVM이 안 뜸 -> 분석을 안 하는 작업은 시작이 빠르다)
+import os
+import re
+import hashlib
+import inspect
+from importlib import metadata
+
+POS_TAGS = {'NNG', 'NNP', 'SL'} # 색인/검색에 쓰는 품사 (일반명사, 고유명사, 외국어)
+
+
+def select_terms(tokens):
+    # (단어, 품사) 리스트 -> 색인/검색 term 리스트 (영문은 소문자로)
+    return [w.lower() if t == 'SL' else w for w, t in tokens if t in POS_TAGS]
+
+
+def select_positions(tokens):
+    # select_terms가 고른 term마다 분석 결과(버린 토큰 포함)에서의 순번.
+    # 숫자(SN)/조사처럼 버린 토큰 자리도 위치가 벌어져서 PHRASE 검증이 원문 구문 기준이 된다.
+    return [i for i, (w, t) in enumerate(tokens) if t in POS_TAGS]
+
+
+class SimpleTagger:
+    # Komoran.pos()와 같은 모양으로 (단어, 품사) 리스트를 돌려준다. 한글 두 글자 이상 -> NNG, 영문 -> SL
+    pattern = re.compile(r"[가-힣]+|[A-Za-z]+|[0-9]+")
+
+    def pos(self, text):
+        tokens = []
+        for match in self.pattern.finditer(text):
+            word = match.group(0)
+            if word[0].isdigit():
+                tokens.append((word, 'SN'))
+            elif word.isascii():
+                tokens.append((word, 'SL'))
+            else:
+                tokens.append((word, 'NNG' if len(word) > 1 else 'NNB'))
+        return tokens
+
+    def extract_terms_batch(self, texts, positions=False):
+        # positions=True 이면 텍스트마다 (terms, 위치들)
+        results = []
+        for text in texts:
+            tokens = self.pos(text)
+            results.append((select_terms(tokens), select_positions(tokens)) if positions else select_terms(tokens))
+        return results
+
+
+class KomoranTagger(SimpleTagger):
+    # Komoran은 여러 문장을 한 번에 받는 API가 없어서 텍스트마다 pos()를 부른다. (여러 코어는 풀로)
+    def __init__(self):
+        from konlpy.tag import Komoran # 여기서 JVM이 뜬다 (수 초)
+        self.komoran = Komoran()
+
+    def pos(self, text):
+        return self.komoran.pos(text)
+
+
+BACKENDS = {"komoran": KomoranTagger, "simple": SimpleTagger}
+
+_tagger = None # 프로세스마다 하나 (처음 쓸 때 생성)
+
+
+def backend_name():
+    return os.environ.get("TOKENIZER_BACKEND", "komoran")
+
+
+def analyzer_name():
+    # 실제로 형태소 분석을 하는 backend (pool이면 풀 워커들이 쓰는 backend)
+    if backend_name() == "pool":
+        return os.environ.get("TOKENIZER_POOL_BACKEND", "komoran")
+    return backend_name()
+
+
+def get_tagger():
+    global _tagger
+    if _tagger is None:
+        name = backend_name()
+        if name == "pool":
+            from .tokenizer_pool import PoolClient
+            _tagger = PoolClient(os.environ["TOKENIZER_ADDRESS"], bytes.fromhex(os.environ["TOKENIZER_AUTHKEY"]))
+        elif name in BACKENDS:
+            _tagger = BACKENDS[name]()
+        else:
+            raise ValueError(f"unknown TOKENIZER_BACKEND: {name}")
+    return _tagger
+
+
+def reset_tagger():
+    # backend 환경변수를 바꾼 뒤 다음 분석 때 새로 만들도록
+    global _tagger
+    _tagger = None
+
+
+def warmup():
+    # 첫 검색/색인이 분석기 시작 시간을 기다리지 않게 미리 만들어 둔다 (검색 서버 워커, 풀 워커)
+    get_tagger().extract_terms_batch([""])
 
-tagger = Komoran()
 
 def extract_terms(text): # term 추출 함수 정의
-    tokens = tagger.pos(text)
-    return [w.lower() if t == 'SL' else w for w, t in tokens if t in {'NNG', 'NNP', 'SL'}]
\ No newline at end of file
+    return get_tagger().extract_terms_batch([text])[0]
+
+
+def extract_terms_batch(texts, positions=False):
+    # 여러 텍스트를 한 번에. pool backend면 서비스 왕복 한 번에 풀 워커들이 나눠서 분석한다.
+    # positions=True 이면 텍스트마다 (terms, 위치들). 위치는 select_positions 참고
+    if not texts:
+        return []
+    return get_tagger().extract_terms_batch(texts, positions)
+
+
+def fingerprint():
+    # 형태소 분석기(종류, 버전) / 품사 필터 / select_terms, select_positions 코드가 바뀌면 값이 바뀐다. (토큰 캐시 무효화용)
+    # 분석기를 만들지 않고 계산한다. pool은 풀 워커의 backend 기준이라 직접 분석한 캐시와 같이 쓸 수 있다.
+    name = analyzer_name()
+    version = ""
+    if name == "komoran":
+        try:
+            version = metadata.version("konlpy")
+        except metadata.PackageNotFoundError:
+            pass
+    try:
+        source = inspect.getsource(select_terms) + inspect.getsource(select_positions)
+    except (OSError, TypeError):
+        source = ""
+    parts = [name, version, ",".join(sorted(POS_TAGS)), source]
+    return hashlib.sha1("\0".join(parts).encode('utf8')).hexdigest()
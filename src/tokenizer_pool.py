@@ -0,0 +1,116 @@
+# src/tokenizer_pool.py
+# 형태소 분석기 프로세스 풀
+#
+# TokenizerPool    : 분석기를 하나씩 띄워 둔 워커 프로세스 N개 (오래 살아 있음). 텍스트 묶음을 나눠서 동시에 분석한다.
+# TokenizerService : 풀을 unix socket(multiprocessing.connection)으로 열어서 다른 프로세스도 쓰게 한다.
+#                    install() 하면 TOKENIZER_BACKEND=pool 환경변수가 설정되어 이 프로세스와 이후에 spawn 되는
+#                    프로세스(색인 워커, 검색 서버 워커)가 전부 풀로 분석한다.
+#                    -> 검색 서버 워커마다 JVM을 띄우지 않고 풀의 JVM N개를 나눠 쓰고,
+#                       직렬 색인(workers=1)도 형태소 분석은 풀 워커 수만큼 병렬로 돈다.
+# PoolClient       : 서비스에 붙는 쪽. tokenizer.get_tagger()가 pool backend일 때 만든다.
+import os
+import math
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+from . import tokenizer
+
+CHUNKS_PER_WORKER = 2 # 묶음 하나를 워커당 이만큼 조각으로 나눈다 (텍스트 길이가 달라도 고르게 돌도록)
+
+
+def init_worker(backend):
+    os.environ["TOKENIZER_BACKEND"] = backend # 부모가 pool backend여도 풀 워커는 직접 분석
+    tokenizer.reset_tagger()
+    tokenizer.warmup()
+
+
+def extract_chunk(texts, positions=False):
+    return tokenizer.extract_terms_batch(texts, positions)
+
+
+class TokenizerPool:
+    def __init__(self, workers=None, backend="komoran"):
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        # Komoran(JVM)은 fork 후에 쓸 수 없어서 spawn
+        self.pool = multiprocessing.get_context("spawn").Pool(self.workers, initializer=init_worker, initargs=(backend,))
+
+    def extract_terms_batch(self, texts, positions=False):
+        if not texts:
+            return []
+        size = max(1, math.ceil(len(texts) / (self.workers * CHUNKS_PER_WORKER)))
+        chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+        return [terms for chunk in self.pool.starmap(extract_chunk, [(chunk, positions) for chunk in chunks]) for terms in chunk]
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class TokenizerService:
+    def __init__(self, workers=None, backend="komoran"):
+        self.pool = TokenizerPool(workers, backend)
+        self.dir = tempfile.mkdtemp(prefix="tokenizer_pool_")
+        self.address = os.path.join(self.dir, "socket")
+        self.authkey = os.urandom(16)
+        self.listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        self.saved_env = None
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError: # close()
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        # 연결 하나 = 클라이언트 프로세스 하나. (텍스트 리스트, positions 여부)를 받아서 term 리스트들을 돌려준다.
+        with conn:
+            while True:
+                try:
+                    texts, positions = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self.pool.extract_terms_batch(texts, positions)))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    def install(self):
+        # 이 프로세스 + 이후 spawn 되는 자식 프로세스가 풀을 쓰도록 환경변수 설정
+        names = ("TOKENIZER_BACKEND", "TOKENIZER_POOL_BACKEND", "TOKENIZER_ADDRESS", "TOKENIZER_AUTHKEY")
+        self.saved_env = {name: os.environ.get(name) for name in names}
+        os.environ.update({"TOKENIZER_BACKEND": "pool", "TOKENIZER_POOL_BACKEND": self.pool.backend,
+                           "TOKENIZER_ADDRESS": self.address, "TOKENIZER_AUTHKEY": self.authkey.hex()})
+        tokenizer.reset_tagger()
+        return self
+
+    def close(self):
+        if self.saved_env is not None: # 환경변수 원래대로
+            for name, value in self.saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            tokenizer.reset_tagger()
+        self.listener.close()
+        self.pool.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class PoolClient:
+    def __init__(self, address, authkey):
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+        self.lock = threading.Lock() # 연결 하나를 여러 스레드가 쓰면 요청/응답이 섞이지 않게
+
+    def extract_terms_batch(self, texts, positions=False):
+        with self.lock:
+            self.conn.send((list(texts), positions))
+            status, value = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"tokenizer pool failed: {value}")
+        return value
@@ -0,0 +1,18 @@
+# tests/conftest.py
+# 저장소 루트를 sys.path에 넣어서 어디서 pytest를 돌려도 src / bench를 import 할 수 있게
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import tokenizer
+
+
+@pytest.fixture
+def simple_tokenizer(monkeypatch):
+    # Komoran(JVM) 없이 simple 분석기로 (spawn으로 뜨는 워커도 환경변수를 물려받는다)
+    monkeypatch.setenv("TOKENIZER_BACKEND", "simple")
+    tokenizer.reset_tagger()
+    yield
+    tokenizer.reset_tagger()
@@ -0,0 +1,89 @@
+# tests/test_cache.py
+# Searcher LRU 캐시: 색인이 바뀌면(다시 색인 / 세그먼트 업데이트로 generation이 바뀜) 캐시를 비우고 새 색인으로 검색하는지
+import os
+import io
+import json
+import contextlib
+import pytest
+from src.cache import LRUCache
+from src.indexer import Indexer
+from src.searcher import Searcher
+
+FILES = ("doc_table.json", "term_dict.json", "postings.bin")
+
+
+def write_document(data_dir, name, title):
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, f"{name}.json"), 'w', encoding='utf8') as f:
+        json.dump({"dataset": {"invention_title": title, "abstract": "", "claims": ""}}, f, ensure_ascii=False)
+
+
+def filenames(searcher, query):
+    return sorted(item["filename"] for item in searcher.search(query, 10)["results"])
+
+
+@pytest.fixture
+def data_dir(tmp_path, simple_tokenizer):
+    data_dir = str(tmp_path / "data")
+    write_document(data_dir, "a", "데이터 보안")
+    write_document(data_dir, "b", "영상 처리")
+    return data_dir
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1 # a가 최근 -> b가 밀려남
+    cache.put("c", 3)
+    assert cache.get("b") is None and len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["hits"] == 1 # 통계는 유지
+    disabled = LRUCache(0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None
+
+
+@pytest.mark.parametrize("segmented", [False, True])
+def test_refresh_clears_caches(tmp_path, data_dir, segmented):
+    index_dir = str(tmp_path / "index")
+    indexer = Indexer(data_dir, index_dir, *FILES)
+
+    def build():
+        with contextlib.redirect_stdout(io.StringIO()):
+            if segmented:
+                indexer.update_index(background_merge=False)
+            else:
+                indexer.build_index()
+
+    build()
+    searcher = Searcher(index_dir, *FILES, refresh_interval=0)
+    try:
+        generation = searcher.generation
+        assert filenames(searcher, "데이터") == ["a.json"]
+        assert filenames(searcher, "데이터") == ["a.json"]
+        assert searcher.result_cache.hits == 1 and len(searcher.query_cache) == 1
+
+        write_document(data_dir, "c", "데이터 처리")
+        build()
+        assert filenames(searcher, "데이터") == ["a.json", "c.json"] # 캐시된 결과가 아니라 새 색인 결과
+        assert searcher.generation != generation
+        assert searcher.result_cache.hits == 1 # 예전 항목은 비워짐
+        assert len(searcher.result_cache) == 1 and len(searcher.query_cache) == 1
+        assert len(searcher.postings_cache) <= 1 # 새 색인으로 읽은 포스팅만
+    finally:
+        searcher.close()
+
+
+def test_refresh_interval(tmp_path, data_dir):
+    index_dir = str(tmp_path / "index")
+    with contextlib.redirect_stdout(io.StringIO()):
+        Indexer(data_dir, index_dir, *FILES).build_index()
+    searcher = Searcher(index_dir, *FILES, refresh_interval=3600)
+    try:
+        assert searcher.refresh() is False # 간격 안에서는 generation 확인도 안 함
+        searcher.search("데이터")
+        assert searcher.refresh(force=True) is True
+        assert len(searcher.result_cache) == 0 and len(searcher.query_cache) == 0
+    finally:
+        searcher.close()
@@ -0,0 +1,197 @@
+# tests/test_equivalence.py
+# 색인 방식이 달라도 검색 결과가 같아야 한다.
+# bench/corpus.py로 작은 가짜 corpus를 만들고 기본 색인(varint)과 legacy / SPIMI / 세그먼트 / 샤드 색인의 검색 결과를 비교한다.
+# 형태소 분석은 simple backend (Komoran JVM 없이)
+import io
+import os
+import json
+import shutil
+import contextlib
+import pytest
+from bench.corpus import generate_corpus, make_vocabulary, sample_titles
+from bench.run import make_queries, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE
+from src.indexer import Indexer
+from src.searcher import Searcher
+from src.shards import ShardedSearcher
+from src import segments
+
+DOCS = 300
+VOCAB_SIZE = 2000
+QUERIES_PER_WORKLOAD = 15
+TOP_K = (5, 1000) # 5 = MaxScore 가지치기가 걸리는 경우, 1000 = 매칭된 문서 전부
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    # (data_dir, 검색어 목록). 세그먼트 테스트가 파일을 지우고 고치므로 테스트마다 data_dir를 복사해서 쓴다.
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("TOKENIZER_BACKEND", "simple") # spawn으로 뜨는 샤드 워커도 환경변수를 물려받는다
+        data_dir = str(tmp_path_factory.mktemp("corpus") / "data")
+        generate_corpus(data_dir, DOCS, vocab_size=VOCAB_SIZE, seed=0)
+        queries = make_queries(make_vocabulary(VOCAB_SIZE, seed=0), sample_titles(data_dir, DOCS, 50), QUERIES_PER_WORKLOAD)
+        yield data_dir, [query for name in ("OR", "AND", "FIELD", "PHRASE") for query in queries[name]]
+
+
+def copy_data(corpus, tmp_path):
+    data_dir = str(tmp_path / "data")
+    shutil.copytree(corpus[0], data_dir)
+    return data_dir
+
+
+def make_indexer(data_dir, index_dir, **options):
+    return Indexer(data_dir, index_dir, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, **options)
+
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO()) # 색인은 파일마다 print 한다
+
+
+def search_all(index_dir, queries, k, searcher_class=Searcher):
+    # 검색어마다 (총 문서 수, [(파일명, 점수)]). doc_id는 색인 방식마다 달라질 수 있어서 파일명으로 비교
+    searcher = searcher_class(index_dir, DOC_TABLE_FILE, TERM_DICT_FILE, POSTINGS_FILE, result_cache_size=0)
+    try:
+        results = []
+        for query in queries:
+            result = searcher.search(query, k)
+            results.append((result["total"], [(item["filename"], round(item["score"], 9)) for item in result["results"]]))
+        return results
+    finally:
+        searcher.close()
+
+
+def build_and_search(data_dir, index_dir, queries, **options):
+    with quiet():
+        make_indexer(data_dir, index_dir, **options).build_index()
+    return {k: search_all(index_dir, queries, k) for k in TOP_K}
+
+
+def unordered(results, k):
+    # 동점 문서는 doc_id 순이라 문서 순서가 바뀌는 색인(세그먼트)과는 top-k 점수만 비교한다. (k가 전부면 파일명까지)
+    return [(total, sorted(hits) if k >= DOCS else [score for _, score in hits]) for total, hits in results]
+
+
+@pytest.fixture(scope="module")
+def reference(corpus, tmp_path_factory):
+    index_dir = str(tmp_path_factory.mktemp("reference"))
+    return build_and_search(corpus[0], index_dir, corpus[1])
+
+
+def test_queries_match_documents(reference):
+    # 비교할 결과가 비어 있으면 테스트가 의미 없음
+    assert sum(1 for total, _ in reference[5] if total) > len(reference[5]) // 2
+
+
+@pytest.mark.parametrize("options", [
+    {"postings_format": "legacy"},
+    {"memory_budget": 0.05}, # SPIMI (run 파일 여러 개로 나뉘게 작은 예산)
+    {"memory_budget": 0.05, "postings_format": "legacy"},
+    {"memory_budget": 0.05, "workers": 2, "batch_size": 8}, # 병렬 SPIMI (워커에 맡기는 묶음 수 제한)
+    {"positions": True}, # PHRASE 검증을 위치 정보로
+    {"dict_format": "json"},
+])
+def test_build_options_match_default(corpus, reference, tmp_path, options):
+    assert build_and_search(corpus[0], str(tmp_path / "index"), corpus[1], **options) == reference
+
+
+@pytest.mark.parametrize("shard_count", [1, 3])
+def test_sharded_matches_single(corpus, reference, tmp_path, shard_count):
+    index_dir = str(tmp_path / "index")
+    with quiet():
+        make_indexer(corpus[0], index_dir).build_shards(shard_count)
+    for k in TOP_K:
+        assert search_all(index_dir, corpus[1], k, ShardedSearcher) == reference[k]
+
+
+def test_segmented_matches_rebuild(corpus, tmp_path):
+    # 처음 업데이트 -> 파일 삭제 / 수정 후 작은 업데이트 여러 번 -> merge 할 때마다 같은 데이터를 처음부터 색인한 결과와 비교
+    data_dir = copy_data(corpus, tmp_path)
+    index_dir = str(tmp_path / "segmented")
+    queries = corpus[1]
+    with quiet():
+        indexer = make_indexer(data_dir, index_dir, positions=True)
+        indexer.update_index(background_merge=False)
+
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(data_dir) for name in names)
+    deleted = files[::25]
+    changed = files[3::20]
+    for path in deleted:
+        os.remove(path)
+    for path in changed: # 다른 문서 내용으로 바꿔서 예전 버전은 tombstone, 새 버전은 새 세그먼트로
+        with open(files[files.index(path) + 1], encoding='utf8') as f:
+            content = f.read()
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(content)
+    with quiet():
+        for i in range(0, len(changed), 4): # 작은 세그먼트 여러 개 (merge 대상)
+            indexer.update_index(changed_files=changed[i:i + 4], deleted_files=deleted if i == 0 else None, background_merge=False)
+    expected = build_and_search(data_dir, str(tmp_path / "rebuild"), queries, positions=True)
+    for k in TOP_K:
+        assert unordered(search_all(index_dir, queries, k), k) == unordered(expected[k], k)
+
+    segment_count = len(segments.load_manifest(index_dir)["segments"])
+    with quiet():
+        indexer.merge_factor = 2
+        indexer.merge_segments()
+    assert len(segments.load_manifest(index_dir)["segments"]) < segment_count
+    for k in TOP_K:
+        assert unordered(search_all(index_dir, queries, k), k) == unordered(expected[k], k)
+
+
+def write_titles(data_dir, titles):
+    # 제목만 있는 문서들 (abstract / claims는 비어 있음)
+    data_dir.mkdir(exist_ok=True)
+    for name, title in titles.items():
+        with open(data_dir / f"{name}.json", 'w', encoding='utf8') as f:
+            json.dump({"dataset": {"invention_title": title, "abstract": "", "claims": ""}}, f, ensure_ascii=False)
+
+
+def test_phrase_positions_match_substring(corpus, tmp_path):
+    # 형태소 분석에서 버린 토큰(숫자 SN 등)이 사이에 있으면 구문이 아니다. 위치 정보로 검증해도 원문 비교와 결과가 같아야 한다.
+    data_dir = tmp_path / "data"
+    write_titles(data_dir, {"gap": "인공지능 3 시스템", "phrase": "인공지능 시스템 개발", "reverse": "시스템 인공지능", "wide": "인공지능 3 7 시스템"})
+    queries = ["[PHRASE] 인공지능 시스템", "[PHRASE] 인공지능 3 시스템", "[PHRASE] 시스템 인공지능"]
+    expected = build_and_search(str(data_dir), str(tmp_path / "substring"), queries)
+    assert [[name for name, _ in hits] for _, hits in expected[1000]] == [["phrase.json"], ["gap.json"], ["reverse.json"]]
+    assert build_and_search(str(data_dir), str(tmp_path / "positions"), queries, positions=True) == expected
+
+
+def test_empty_fields_score(corpus, tmp_path):
+    # 모든 문서에서 빈 필드(평균 길이 0)가 있어도 점수가 nan이 되지 않고, 세그먼트 색인의 MaxScore 결과도 같아야 한다
+    data_dir = tmp_path / "data"
+    write_titles(data_dir, {f"doc{i}": " ".join(["데이터"] * (i % 3 + 1) + ["보안"] * (i % 2)) for i in range(20)})
+    queries = ["데이터", "보안", "데이터 보안", "[AND] 데이터 보안"]
+    expected = build_and_search(str(data_dir), str(tmp_path / "index"), queries)
+    assert all(total and hits for total, hits in expected[5])
+    with quiet():
+        indexer = make_indexer(str(data_dir), str(tmp_path / "segmented"))
+        indexer.update_index(background_merge=False)
+        write_titles(data_dir, {"doc20": "데이터 보안 보안"})
+        indexer.update_index(changed_files=[str(data_dir / "doc20.json")], background_merge=False)
+    expected = build_and_search(str(data_dir), str(tmp_path / "rebuild"), queries)
+    for k in TOP_K:
+        assert unordered(search_all(str(tmp_path / "segmented"), queries, k), k) == unordered(expected[k], k)
+
+
+def test_scan_finds_replaced_files(corpus, tmp_path):
+    # 데이터 폴더 스캔(update_index 인자 없음)이 예전 수정 시각을 그대로 가진 파일로 바꿔치기 한 경우(cp -p, rsync -t)도 찾아야 한다
+    data_dir = copy_data(corpus, tmp_path)
+    index_dir = str(tmp_path / "segmented")
+    queries = corpus[1]
+    with quiet():
+        indexer = make_indexer(data_dir, index_dir)
+        indexer.update_index(background_merge=False)
+
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(data_dir) for name in names)
+    for path in files[5::30]:
+        old = os.stat(path)
+        with open(files[files.index(path) + 1], encoding='utf8') as f:
+            content = f.read()
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(content)
+        os.utime(path, ns=(old.st_atime_ns, old.st_mtime_ns - 10 ** 9)) # 업데이트 시각보다 이전
+    with quiet():
+        indexer.update_index(background_merge=False)
+        assert indexer.scan_changes(segments.load_manifest(index_dir), indexer.segment_paths(segments.load_manifest(index_dir)))[:2] == ([], [])
+    expected = build_and_search(data_dir, str(tmp_path / "rebuild"), queries)
+    for k in TOP_K:
+        assert unordered(search_all(index_dir, queries, k), k) == unordered(expected[k], k)
@@ -0,0 +1,88 @@
+# tests/test_highlighter.py
+# 한 번 훑는 Highlighter가 예전 스니펫 코드(Searcher.make_snippets 안에 있던 highlight_snippet)와 같은 스니펫을 만드는지
+# 무작위 필드 텍스트 / 검색어로 비교한다. (겹치는 term, 대소문자, 정규식 특수문자 포함)
+import re
+import random
+import pytest
+from src.highlighter import Highlighter
+
+WINDOW_SIZE = 80
+
+
+def highlight_snippet(targets, query_terms, mode):
+    # 예전 구현 그대로 (term마다 필드 전체 re.finditer + 창마다 term별 re.search). targets는 우선순위 순 [(필드 이름, 텍스트)]
+    snippets = []
+    if mode == "PHRASE":
+        if clean_query := query_terms[0]:
+            for field_name, text in targets:
+                match = re.search(re.escape(clean_query), text, re.IGNORECASE)
+                if match:
+                    start = max(0, match.start() - (WINDOW_SIZE - len(clean_query)) // 2)
+                    end = min(len(text), start + WINDOW_SIZE)
+                    snippets.append((field_name, re.sub(re.escape(clean_query), r"<<\g<0>>>", text[start:end], flags=re.IGNORECASE)))
+                    break
+        return snippets
+
+    if mode == "OR":
+        best_snippet, best_score, best_field = "", -1, ""
+        for field_name, text in targets:
+            if not text: continue
+            term_indices = sorted(match.start() for term in query_terms for match in re.finditer(re.escape(term), text, re.IGNORECASE))
+            for start_idx in term_indices:
+                w_start = max(0, start_idx - WINDOW_SIZE // 2)
+                window_text = text[w_start:min(len(text), w_start + WINDOW_SIZE)]
+                score = sum(1 for term in query_terms if re.search(re.escape(term), window_text, re.IGNORECASE))
+                if score > best_score:
+                    best_snippet, best_score, best_field = window_text, score, field_name
+        if best_snippet:
+            for term in query_terms:
+                best_snippet = re.sub(re.escape(term), r"<<\g<0>>>", best_snippet, flags=re.IGNORECASE)
+            snippets.append((best_field, best_snippet))
+        return snippets
+
+    remaining_terms = set(query_terms) # AND
+    while remaining_terms:
+        best_snippet, best_score, best_field, covered = "", -1, "", set()
+        for field_name, text in targets:
+            if not text: continue
+            term_indices = sorted(match.start() for term in remaining_terms for match in re.finditer(re.escape(term), text, re.IGNORECASE))
+            for start_idx in term_indices:
+                w_start = max(0, start_idx - WINDOW_SIZE // 2)
+                window_text = text[w_start:min(len(text), w_start + WINDOW_SIZE)]
+                current = {term for term in remaining_terms if re.search(re.escape(term), window_text, re.IGNORECASE)}
+                if len(current) > best_score:
+                    best_snippet, best_score, best_field, covered = window_text, len(current), field_name, current
+        if best_score <= 0:
+            break
+        for term in query_terms:
+            best_snippet = re.sub(re.escape(term), r"<<\g<0>>>", best_snippet, flags=re.IGNORECASE)
+        snippets.append((best_field, best_snippet))
+        remaining_terms -= covered
+    return snippets
+
+
+@pytest.mark.parametrize("alphabet", ["aAbB데이터 .(*", "aaab ", "데이터베이스 DATA data"])
+def test_matches_old_snippets(alphabet):
+    rng = random.Random(alphabet)
+
+    def text(low, high):
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+    for _ in range(600):
+        targets = [("TITLE", text(0, 30)), ("ABSTRACT", text(0, 200)), ("CLAIMS", text(0, 600))]
+        mode = rng.choice(["OR", "AND", "PHRASE"])
+        if mode == "PHRASE":
+            query_terms = [text(1, 6).strip() or "a"]
+            targets = rng.choice([targets[:1], targets[1:]])
+        else:
+            query_terms = [text(1, rng.choice([3, 3, 50])).strip() or "b" for _ in range(rng.randint(1, 5))]
+        assert Highlighter(query_terms).snippets(targets, mode) == highlight_snippet(targets, query_terms, mode), (mode, query_terms, targets)
+
+
+def test_reused_across_documents():
+    # 검색어 하나에 Highlighter 하나를 만들어서 top-k 문서 전부에 쓴다
+    highlighter = Highlighter(["데이터", "보안"])
+    documents = [[("TITLE", "데이터 보안 시스템")], [("TITLE", "보안"), ("CLAIMS", "데이터를 저장")], [("TITLE", "없음")]]
+    for targets in documents:
+        for mode in ("OR", "AND"):
+            assert highlighter.snippets(targets, mode) == highlight_snippet(targets, ["데이터", "보안"], mode)
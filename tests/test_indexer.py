@@ -0,0 +1,29 @@
+# tests/test_indexer.py
+# 병렬 색인: 워커에 맡겨 두는 분석 묶음 수가 제한되는지 (워커가 부모보다 앞서 나가서 결과가 메모리에 쌓이지 않게)
+import threading
+from multiprocessing.pool import ThreadPool
+from src.indexer import analyze_in_order
+
+
+def test_analyze_in_order_bounds_in_flight():
+    lock = threading.Lock()
+    state = {"submitted": 0, "consumed": 0, "max_ahead": 0}
+
+    def analyze(batch):
+        return [value * 2 for value in batch]
+
+    def batches():
+        for i in range(50):
+            with lock: # 부모가 아직 안 받아 간 묶음 수 (지금 넘기는 것 포함)
+                state["submitted"] += 1
+                state["max_ahead"] = max(state["max_ahead"], state["submitted"] - state["consumed"])
+            yield [i, i + 100]
+
+    with ThreadPool(3) as pool:
+        results = []
+        for result in analyze_in_order(pool, analyze, batches(), 4):
+            with lock:
+                state["consumed"] += 1
+            results.append(result)
+    assert results == [[i * 2, (i + 100) * 2] for i in range(50)] # 입력 순서대로
+    assert state["max_ahead"] <= 4 + 1 # 맡겨 둔 4개 + 부모가 처리 중인 1개
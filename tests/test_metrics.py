@@ -0,0 +1,58 @@
+# tests/test_metrics.py
+# 계측: 꺼져 있으면 아무것도 기록하지 않고(공용 NULL_TIMER), 켜면 단계별 시간/카운터와 느린 검색어 로그를 남긴다.
+import json
+import pytest
+from src.metrics import Metrics, NULL_TIMER
+
+
+@pytest.fixture
+def metrics():
+    return Metrics()
+
+
+def test_disabled_is_noop(metrics):
+    assert metrics.timer("query.postings") is NULL_TIMER
+    with metrics.timer("query.postings"):
+        pass
+    metrics.count("postings.decoded", 5)
+    items = [1, 2, 3]
+    assert metrics.timed("index.analyze", items) is items
+    assert metrics.begin("query", "데이터") is None
+    assert metrics.end(None) is None
+    assert metrics.snapshot() == {"enabled": False, "counters": {}, "slow_queries": 0, "histograms": {}}
+
+
+def test_trace_breakdown(metrics):
+    metrics.enable()
+    trace = metrics.begin("query", "데이터")
+    assert metrics.begin("query", "안쪽") is None # 진행 중인 trace에 합쳐짐
+    with metrics.timer("query.postings"):
+        pass
+    metrics.count("postings.decoded", 5)
+    assert list(metrics.timed("index.analyze", iter([1, 2]))) == [1, 2]
+    metrics.end(trace)
+    assert set(trace["stages"]) == {"query.postings", "index.analyze"}
+    assert trace["counters"] == {"postings.decoded": 5}
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"postings.decoded": 5}
+    assert snapshot["histograms"]["index.analyze"]["count"] == 3 # 값 2개 + 끝(StopIteration)
+    assert snapshot["histograms"]["query.total"]["count"] == 1
+    assert snapshot["slow_queries"] == 0 # slow_query_ms 없으면 기록 안 함
+
+
+def test_slow_query_log(metrics, tmp_path):
+    log = tmp_path / "slow.log"
+    metrics.enable(slow_query_ms=0, slow_query_log=str(log))
+    for query in ("데이터", "보안"):
+        trace = metrics.begin("query", query)
+        metrics.count("files.opened")
+        metrics.end(trace)
+    metrics.end(metrics.begin("index", "build")) # 색인 trace는 느린 검색어 로그 대상이 아님
+    records = [json.loads(line) for line in log.read_text(encoding='utf8').splitlines()]
+    assert [record["label"] for record in records] == ["데이터", "보안"]
+    assert all(record["kind"] == "query" and record["counters"] == {"files.opened": 1} and "total_ms" in record for record in records)
+    assert metrics.snapshot()["slow_queries"] == 2
+
+    metrics.enable(slow_query_ms=60000, slow_query_log=str(log)) # 기준보다 빠르면 안 남김
+    metrics.end(metrics.begin("query", "영상"))
+    assert len(log.read_text(encoding='utf8').splitlines()) == 2
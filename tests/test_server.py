@@ -0,0 +1,84 @@
+# tests/test_server.py
+# 검색 서버 요청 처리 (SearchApp.dispatch): 잘못된 요청은 400, 안 되는 method는 405, /batch는 검색어 순서대로 결과
+# 소켓 없이 dispatch를 바로 부르고, Searcher 대신 받은 인자를 기록하는 객체를 쓴다.
+import json
+import pytest
+from src import server
+from src.server import SearchApp
+
+
+class RecordingSearcher:
+    generation = 3
+    N = 10
+
+    def __init__(self):
+        self.calls = []
+
+    def search(self, query, k, snippets=False):
+        self.calls.append((query, k, snippets))
+        if query == "boom":
+            raise RuntimeError("broken index")
+        return {"query": query, "total": 0, "results": []}
+
+    def cache_stats(self):
+        return {}
+
+
+@pytest.fixture
+def app():
+    return SearchApp(RecordingSearcher())
+
+
+def post(app, path, payload):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf8')
+    return app.dispatch("POST", path, body)
+
+
+def test_search_get_and_post(app):
+    assert app.dispatch("GET", "/search?q=%EB%8D%B0%EC%9D%B4%ED%84%B0&k=3&snippets=1", b"") == (200, {"query": "데이터", "total": 0, "results": []})
+    assert post(app, "/search", {"query": " 보안 ", "k": 2})[0] == 200
+    assert app.searcher.calls == [("데이터", 3, True), ("보안", 2, False)]
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/search", b"{not json"),
+    ("/search", [1, 2]), # object가 아님
+    ("/search", {"k": 3}), # query 없음
+    ("/search", {"query": "   "}),
+    ("/search", {"query": "a", "k": "many"}),
+    ("/search", {"query": "a", "k": 0}),
+    ("/batch", {"queries": "a"}),
+    ("/batch", {"queries": ["a", 1]}),
+    ("/batch", {"queries": ["a", ""]}),
+])
+def test_bad_request(app, path, payload):
+    status, response = post(app, path, payload)
+    assert status == 400
+    assert "error" in response
+
+
+def test_batch_too_many(app, monkeypatch):
+    monkeypatch.setattr(server, "MAX_BATCH", 2)
+    assert post(app, "/batch", {"queries": ["a", "b", "c"]})[0] == 400
+    assert app.searcher.calls == [] # 검색 전에 거절
+
+
+@pytest.mark.parametrize("method, path", [("PUT", "/search"), ("DELETE", "/search"), ("GET", "/batch")])
+def test_method_not_allowed(app, method, path):
+    assert app.dispatch(method, path, b"")[0] == 405
+
+
+def test_batch(app):
+    status, response = post(app, "/batch", {"queries": ["데이터", "[AND] 보안 장치", "영상"], "k": 7, "snippets": True})
+    assert status == 200
+    assert [result["query"] for result in response["results"]] == ["데이터", "[AND] 보안 장치", "영상"]
+    assert app.searcher.calls == [("데이터", 7, True), ("[AND] 보안 장치", 7, True), ("영상", 7, True)]
+
+
+def test_other_routes(app):
+    assert app.dispatch("GET", "/nope", b"")[0] == 404
+    assert app.dispatch("GET", "/health", b"")[1]["status"] == "ok"
+    status, stats = app.dispatch("GET", "/stats", b"")
+    assert status == 200 and stats["generation"] == 3 and stats["requests"] == 3
+    status, response = post(app, "/search", {"query": "boom"}) # 검색 중 오류 -> 500 (워커는 계속 동작)
+    assert status == 500 and "broken index" in response["error"]
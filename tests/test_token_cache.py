@@ -0,0 +1,91 @@
+# tests/test_token_cache.py
+# 토큰 캐시(token_cache.db): 다시 색인할 때 캐시에서 꺼내 쓰는지, 토크나이저가 바뀌면 비우는지, 크기 제한을 넘으면 오래된 것부터 지우는지
+import sqlite3
+import pytest
+from src import tokenizer
+from src.token_cache import TokenCache
+
+TEXTS = ["인공지능 3 시스템", "데이터 보안 장치", "abc 검색 엔진", "영상 처리 방법"]
+
+
+@pytest.fixture
+def cache_path(tmp_path, simple_tokenizer):
+    return str(tmp_path / "token_cache.db")
+
+
+def extract(cache, path, items, positions=False):
+    # 워커처럼 읽기 전용 연결로 분석하고, 부모처럼 쓰기 연결에 pending을 기록 -> (결과, pendings)
+    reader = TokenCache(path, readonly=True)
+    try:
+        pendings = [{"hits": [], "new": []} for _ in items]
+        results = reader.extract_terms_batch(items, pendings, positions)
+    finally:
+        reader.conn.close()
+    for pending in pendings:
+        cache.record(pending)
+    cache.flush()
+    return results, pendings
+
+
+def row_count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_warm_hits(cache_path):
+    items = [("title", text) for text in TEXTS]
+    cache = TokenCache(cache_path)
+    cold, pendings = extract(cache, cache_path, items)
+    assert [len(pending["hits"]) for pending in pendings] == [0] * len(items)
+    assert [len(pending["new"]) for pending in pendings] == [1] * len(items)
+    assert cold == tokenizer.extract_terms_batch(TEXTS)
+
+    warm, pendings = extract(cache, cache_path, items + [("abstract", TEXTS[0])]) # 필드가 다르면 다른 key
+    assert sum(len(pending["hits"]) for pending in pendings) == len(items)
+    assert sum(len(pending["new"]) for pending in pendings) == 1
+    assert warm == cold + cold[:1]
+
+    with_positions, _ = extract(cache, cache_path, items, positions=True) # 위치도 캐시에서
+    assert with_positions == [tuple(analyzed) for analyzed in tokenizer.extract_terms_batch(TEXTS, positions=True)]
+    cache.close()
+    assert row_count(cache_path) == len(items) + 1
+
+
+def test_fingerprint_change_clears_cache(cache_path, monkeypatch, capsys):
+    cache = TokenCache(cache_path)
+    extract(cache, cache_path, [("title", text) for text in TEXTS])
+    cache.close()
+    assert row_count(cache_path) == len(TEXTS)
+
+    TokenCache(cache_path).close() # 그대로면 유지
+    assert row_count(cache_path) == len(TEXTS)
+
+    monkeypatch.setattr(tokenizer, "POS_TAGS", tokenizer.POS_TAGS | {"SN"}) # 품사 필터가 바뀜
+    cache = TokenCache(cache_path)
+    assert "token cache 초기화" in capsys.readouterr().out
+    assert row_count(cache_path) == 0
+    _, pendings = extract(cache, cache_path, [("title", TEXTS[0])])
+    assert pendings[0]["new"] and not pendings[0]["hits"]
+    cache.close()
+
+
+def test_evict_least_recently_used(cache_path):
+    cache = TokenCache(cache_path)
+    old_items = [("title", TEXTS[0])]
+    new_items = [("title", text) for text in TEXTS[1:]]
+    extract(cache, cache_path, old_items)
+    extract(cache, cache_path, new_items) # flush 시각이 더 늦음 -> 나중에 지워짐
+    (total,) = cache.conn.execute("SELECT SUM(size) FROM tokens").fetchone()
+
+    cache.max_bytes = total
+    assert cache.evict() == 0 # 제한 안이면 그대로
+    cache.max_bytes = total - 1
+    assert cache.evict() == 1
+    assert cache.lookup(cache.key(*old_items[0])) is None
+    assert all(cache.lookup(cache.key(*item)) is not None for item in new_items)
+    (remaining,) = cache.conn.execute("SELECT SUM(size) FROM tokens").fetchone()
+    assert remaining <= cache.max_bytes * 0.9
+    cache.close()
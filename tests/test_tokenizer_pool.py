@@ -0,0 +1,34 @@
+# tests/test_tokenizer_pool.py
+# 토크나이저 풀: simple 분석기 풀 워커로 분석한 결과가 직접 분석한 결과와 같은지 (풀 직접 호출 / 서비스 install 후 pool backend)
+import pytest
+from src import tokenizer
+from src.tokenizer_pool import TokenizerPool, TokenizerService
+
+TEXTS = ["인공지능 3 시스템", "데이터 보안 장치", "", "abc DEF 검색 엔진"] * 5
+
+
+@pytest.fixture
+def expected(simple_tokenizer):
+    return tokenizer.extract_terms_batch(TEXTS), tokenizer.extract_terms_batch(TEXTS, positions=True)
+
+
+def test_pool(expected):
+    pool = TokenizerPool(2, backend="simple")
+    try:
+        assert pool.extract_terms_batch(TEXTS) == expected[0]
+        assert pool.extract_terms_batch(TEXTS, positions=True) == expected[1]
+        assert pool.extract_terms_batch([]) == []
+    finally:
+        pool.close()
+
+
+def test_service_install(expected):
+    service = TokenizerService(2, backend="simple").install()
+    try:
+        assert tokenizer.backend_name() == "pool"
+        assert tokenizer.extract_terms_batch(TEXTS) == expected[0]
+        assert tokenizer.extract_terms_batch(TEXTS, positions=True) == expected[1]
+        assert tokenizer.extract_terms("데이터 보안") == ["데이터", "보안"]
+    finally:
+        service.close()
+    assert tokenizer.backend_name() == "simple" # 환경변수 원래대로